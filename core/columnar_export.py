@@ -0,0 +1,164 @@
+# report_maker/core/columnar_export.py
+# ------------------------------------------------------------
+# 案件レコードの列指向エクスポート（分析用）
+#   extract_fields / inbox のレコード（日本語キーの dict）の流れを Arrow の
+#   RecordBatch に詰め替え、Parquet ファイルまたは Arrow IPC ストリームで書き出す。
+#   - 受信/現着/完了時刻 は timestamp（秒, Asia/Tokyo）、所要時間は整数（分）
+#   - batch_size 件ずつ変換して書くので、何百万件でもメモリは 1 バッチ分で済む
+#   - pyarrow が無い環境では JSON Lines（1 行 1 案件、時刻は ISO 8601）で書き出す
+# ------------------------------------------------------------
+from __future__ import annotations
+
+import io
+import json
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .inbox_loader import EXPECTED_KEYS
+from .parsing import try_parse_datetime
+from .summary_writer import iter_source_records, parse_year_month, record_in_scope
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow は streamlit の依存なので通常は入っている
+    pa = None
+    pq = None
+
+DATETIME_KEYS = ("受信時刻", "現着時刻", "完了時刻")
+# 整数（分）の列：（列名, 開始キー, 終了キー）。作業時間_分 はレコードの値を優先する
+MINUTE_COLUMNS = (
+    ("受付〜現着_分", "受信時刻", "現着時刻"),
+    ("作業時間_分", "現着時刻", "完了時刻"),
+    ("受付〜完了_分", "受信時刻", "完了時刻"),
+)
+STRING_KEYS = tuple(k for k in EXPECTED_KEYS if k not in DATETIME_KEYS and k != "作業時間_分")
+
+# 形式ごとの (拡張子, MIME)
+FORMATS = {
+    "parquet": (".parquet", "application/vnd.apache.parquet"),
+    "arrow": (".arrows", "application/vnd.apache.arrow.stream"),
+    "jsonl": (".jsonl", "application/jsonl"),
+}
+
+
+def has_arrow() -> bool:
+    return pa is not None
+
+
+def resolve_format(fmt: str) -> str:
+    """pyarrow が無ければ parquet / arrow の指定を jsonl に落とす。"""
+    if fmt not in FORMATS:
+        raise ValueError(f"未知の出力形式です: {fmt!r}")
+    return fmt if fmt == "jsonl" or has_arrow() else "jsonl"
+
+
+def record_schema():
+    if pa is None:
+        raise RuntimeError("pyarrow がインストールされていません。")
+    ts = pa.timestamp("s", tz="Asia/Tokyo")
+    fields = [pa.field(k, pa.string()) for k in STRING_KEYS]
+    fields += [pa.field(k, ts) for k in DATETIME_KEYS]
+    fields += [pa.field(name, pa.int32()) for name, _, _ in MINUTE_COLUMNS]
+    return pa.schema(fields)
+
+
+def _minutes(raw: str, start, end) -> Optional[int]:
+    if re.fullmatch(r"-?\d+", raw or ""):
+        return int(raw)
+    if start is not None and end is not None and end >= start:
+        return int((end - start).total_seconds() // 60)
+    return None
+
+
+def typed_row(rec: Dict[str, Optional[str]]) -> Dict[str, object]:
+    """レコードを列の型に合わせた値へ変換する（時刻は datetime、所要時間は int）。"""
+    row: Dict[str, object] = {k: ((rec.get(k) or "").strip() or None) for k in STRING_KEYS}
+    parsed = {k: try_parse_datetime(rec.get(k)) for k in DATETIME_KEYS}
+    row.update(parsed)
+    for name, start, end in MINUTE_COLUMNS:
+        raw = (rec.get(name) or "").strip() if name == "作業時間_分" else ""
+        row[name] = _minutes(raw, parsed[start], parsed[end])
+    return row
+
+
+def _column_names() -> List[str]:
+    return list(STRING_KEYS) + list(DATETIME_KEYS) + [name for name, _, _ in MINUTE_COLUMNS]
+
+
+def iter_record_batches(records: Iterable[Dict[str, Optional[str]]], batch_size: int = 10000) -> Iterator["pa.RecordBatch"]:
+    """レコードの流れを batch_size 件ずつの RecordBatch にする。"""
+    schema = record_schema()
+    names = _column_names()
+    cols: Dict[str, list] = {n: [] for n in names}
+    count = 0
+    for rec in records:
+        row = typed_row(rec)
+        for n in names:
+            cols[n].append(row[n])
+        count += 1
+        if count >= batch_size:
+            yield pa.RecordBatch.from_pydict(cols, schema=schema)
+            cols = {n: [] for n in names}
+            count = 0
+    if count:
+        yield pa.RecordBatch.from_pydict(cols, schema=schema)
+
+
+def write_parquet(records: Iterable[Dict[str, Optional[str]]], dest, batch_size: int = 10000) -> int:
+    """Parquet で dest（パス or バイナリファイル）へ書き、件数を返す。"""
+    n = 0
+    with pq.ParquetWriter(dest, record_schema(), compression="zstd") as writer:
+        for batch in iter_record_batches(records, batch_size):
+            writer.write_batch(batch)
+            n += batch.num_rows
+    return n
+
+
+def write_ipc_stream(records: Iterable[Dict[str, Optional[str]]], dest, batch_size: int = 10000) -> int:
+    """Arrow IPC ストリーム形式で dest へ書き、件数を返す（読み手は pa.ipc.open_stream）。"""
+    n = 0
+    with pa.ipc.new_stream(dest, record_schema()) as writer:
+        for batch in iter_record_batches(records, batch_size):
+            writer.write_batch(batch)
+            n += batch.num_rows
+    return n
+
+
+def write_jsonl(records: Iterable[Dict[str, Optional[str]]], dest) -> int:
+    """JSON Lines で dest（バイナリファイル）へ書き、件数を返す。"""
+    n = 0
+    for rec in records:
+        row = typed_row(rec)
+        for k in DATETIME_KEYS:
+            if row[k] is not None:
+                row[k] = row[k].isoformat()
+        dest.write(json.dumps(row, ensure_ascii=False).encode("utf-8") + b"\n")
+        n += 1
+    return n
+
+
+def write_records(records: Iterable[Dict[str, Optional[str]]], dest, fmt: str = "parquet",
+                  batch_size: int = 10000) -> Tuple[int, str]:
+    """
+    fmt（parquet / arrow / jsonl）で書き出し、(件数, 実際に使った形式) を返す。
+    pyarrow が無い場合は jsonl になる。
+    """
+    fmt = resolve_format(fmt)
+    if fmt == "parquet":
+        return write_parquet(records, dest, batch_size), fmt
+    if fmt == "arrow":
+        return write_ipc_stream(records, dest, batch_size), fmt
+    return write_jsonl(records, dest), fmt
+
+
+def build_columnar_export(source: str, fmt: str = "parquet", manageno: str = "",
+                          month: str = "") -> Tuple[bytes, int]:
+    """
+    inbox / 過去案件索引 のレコードを書き出して (バイト列, 件数) を返す。プロセスプールから呼ぶ想定。
+    """
+    ym = parse_year_month(month)
+    records = (r for r in iter_source_records(source) if record_in_scope(r, manageno, ym))
+    out = io.BytesIO()
+    n, _ = write_records(records, out, fmt)
+    return out.getvalue(), n
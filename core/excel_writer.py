@@ -1,75 +1,205 @@
 # report_maker/core/excel_writer.py
+import copy
+import hashlib
 import io
+import json
+import re
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 from openpyxl import load_workbook
+from openpyxl.drawing.image import Image
 from .settings import SHEET_NAME, JST
 from .textutil import split_lines, sanitize_filename
 from .parsing import try_parse_datetime, split_dt_components, first_date_yyyymmdd
 
+# fill_template_xlsx が読むキー（生成結果のキャッシュ判定に使う）
+REPORT_KEYS = (
+    "管理番号", "メーカー", "制御方式", "通報者", "対応者", "処理修理後", "所属",
+    "受信時刻", "現着時刻", "完了時刻", "受信内容", "現着状況", "原因", "処置内容",
+)
+
+def report_fingerprint(template_digest: Optional[str], data: Dict[str, Optional[str]]) -> str:
+    """
+    テンプレート・書き込み対象の値・作成日（B5〜F5 に今日の日付が入る）から
+    生成結果を一意に表すハッシュを作る。
+    """
+    payload = {
+        "tpl": template_digest or "",
+        "day": datetime.now(JST).strftime("%Y%m%d"),
+        "data": [(k, (data.get(k) or "")) for k in REPORT_KEYS],
+    }
+    return hashlib.sha1(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def _multiline_values(col_letter: str, start_row: int, text: Optional[str], max_lines: int = 5) -> Dict[str, str]:
+    # 欄の全行を空にしてから、行数を超える分は最終行に「…」を付けて詰める
+    values = {f"{col_letter}{start_row + i}": "" for i in range(max_lines)}
+    if text:
+        for idx, line in enumerate(split_lines(text, max_lines=max_lines)[:max_lines]):
+            values[f"{col_letter}{start_row + idx}"] = line
+    return values
+
 def _fill_multiline(ws, col_letter: str, start_row: int, text: Optional[str], max_lines: int = 5):
-    for i in range(max_lines):
-        ws[f"{col_letter}{start_row + i}"] = ""
-    if not text:
-        return
-    for idx, line in enumerate(split_lines(text, max_lines=max_lines)[:max_lines]):
-        ws[f"{col_letter}{start_row + idx}"] = line
+    for coord, value in _multiline_values(col_letter, start_row, text, max_lines).items():
+        ws[coord] = value
 
-def fill_template_xlsx(template_bytes: bytes, data: Dict[str, Optional[str]]) -> bytes:
+def _load_template_wb(template_bytes):
+    # バイト列のほか、読み取り可能なファイル（共有テンプレートの mmap 等）も受け付ける
     if not template_bytes:
         raise ValueError("テンプレートのバイト列が空です。")
-
+    src = template_bytes if hasattr(template_bytes, "read") else io.BytesIO(template_bytes)
     try:
-        wb = load_workbook(io.BytesIO(template_bytes), keep_vba=True)
+        return load_workbook(src, keep_vba=True)
     except Exception as e:
         raise RuntimeError(f"テンプレートの読み込みに失敗しました（破損の可能性）: {e}") from e
 
+def _save_wb(wb) -> bytes:
+    out = io.BytesIO()
+    try:
+        wb.save(out)
+    except Exception as e:
+        raise RuntimeError(f"Excel保存時に失敗しました: {e}") from e
+    return out.getvalue()
+
+# 帳票のセル配置（書き込みと report_importer の読み戻しで共用する）
+FIELD_CELLS = (
+    ("管理番号", "C12"), ("メーカー", "J12"), ("制御方式", "M12"), ("通報者", "C14"),
+    ("対応者", "L37"), ("処理修理後", "C35"), ("所属", "C37"),
+)
+# 日時ブロック（キー, 行）と 年/月/日/曜日/時/分 の列
+DT_BLOCKS = (("受信時刻", 13), ("現着時刻", 19), ("完了時刻", 36))
+DT_COLUMNS = {"Y": "C", "Mo": "F", "D": "H", "W": "J", "H": "M", "Min": "O"}
+# 複数行欄（キー, 列, 開始行, 行数）
+MULTILINE_BLOCKS = (
+    ("受信内容", "C", 15, 4), ("現着状況", "C", 20, 5), ("原因", "C", 25, 5), ("処置内容", "C", 30, 5),
+)
+
+def report_cell_values(data: Dict[str, Optional[str]], now: datetime) -> Dict[str, object]:
+    """
+    帳票へ書き込むセルと値（セル番地 → 値、書き込み順）。_fill_sheet とプレビューで共用する。
+    空の項目などテンプレートの値をそのまま残すセルは含めない。
+    """
+    values: Dict[str, object] = {}
+    for key, cell in FIELD_CELLS:
+        # 処理修理後 は空白だけの値を書かない
+        value = (data.get(key) or "").strip() if key == "処理修理後" else data.get(key)
+        if value:
+            values[cell] = value
+
+    values["B5"], values["D5"], values["F5"] = now.year, now.month, now.day
+
+    for key, row in DT_BLOCKS:
+        dt = try_parse_datetime(data.get(key))
+        parts = dict(zip(("Y", "Mo", "D", "W", "H", "Min"), split_dt_components(dt)))
+        for part, col in DT_COLUMNS.items():
+            v = parts[part]
+            if v is None:
+                continue
+            values[f"{col}{row}"] = f"{v:02d}" if part in ("H", "Min") else v
+
+    for key, col, row, n in MULTILINE_BLOCKS:
+        values.update(_multiline_values(col, row, data.get(key), max_lines=n))
+    return values
+
+def _fill_sheet(ws, data: Dict[str, Optional[str]], now: datetime):
+    for coord, value in report_cell_values(data, now).items():
+        ws[coord] = value
+
+def fill_template_xlsx(template_bytes: bytes, data: Dict[str, Optional[str]]) -> bytes:
+    return fill_loaded_template(load_template_workbook(template_bytes), data)
+
+def load_template_workbook(template_bytes: bytes):
+    """
+    テンプレートを解析済みのブックにする（生成処理で一番重い部分）。
+    解析と書き込みを分けて使う場合に、fill_loaded_template / fill_binder_loaded へ渡す。
+    返したブックは書き込みで変更されるので 1 回しか使えない。
+    """
+    return _load_template_wb(template_bytes)
+
+def fill_loaded_template(wb, data: Dict[str, Optional[str]]) -> bytes:
     ws = wb[SHEET_NAME] if SHEET_NAME in wb.sheetnames else wb.active
+    _fill_sheet(ws, data, datetime.now(JST))
+    return _save_wb(wb)
+
+# =======================
+# バインダー（複数報告書を 1 ファイルに）
+# =======================
+_SHEET_TITLE_BAD = re.compile(r"[\\/:*?\[\]]+")
+
+def binder_sheet_title(data: Dict[str, Optional[str]], used: set) -> str:
+    """管理番号_YYYYMMDD 形式のシート名（31文字以内・重複時は _2, _3 …）"""
+    base_day = first_date_yyyymmdd(data.get("現着時刻"), data.get("完了時刻"), data.get("受信時刻"))
+    manageno = (data.get("管理番号") or "UNKNOWN").strip()
+    base = _SHEET_TITLE_BAD.sub("_", f"{manageno}_{base_day}").strip("'")[:31] or "報告書"
+    title, n = base, 2
+    while title.lower() in used:
+        suffix = f"_{n}"
+        title = base[: 31 - len(suffix)] + suffix
+        n += 1
+    used.add(title.lower())
+    return title
 
-    if data.get("管理番号"): ws["C12"] = data["管理番号"]
-    if data.get("メーカー"): ws["J12"] = data["メーカー"]
-    if data.get("制御方式"): ws["M12"] = data["制御方式"]
-    if data.get("通報者"): ws["C14"] = data["通報者"]
-    if data.get("対応者"): ws["L37"] = data["対応者"]
+def _copy_sheet_extras(src, dst):
+    """copy_worksheet が引き継がない画像・入力規則・条件付き書式・印刷範囲・表示設定を写す。"""
+    for img in getattr(src, "_images", []):
+        # Image._data() は読み込み元を close してしまうので、元の BytesIO を直接読む
+        ref = img.ref
+        raw = ref.getvalue() if hasattr(ref, "getvalue") else img._data()
+        new_img = Image(io.BytesIO(raw))
+        new_img.anchor = copy.deepcopy(img.anchor)
+        new_img.width, new_img.height = img.width, img.height
+        dst.add_image(new_img)
+    for dv in src.data_validations.dataValidation:
+        dst.add_data_validation(copy.copy(dv))
+    for cf in src.conditional_formatting:
+        for rule in cf.rules:
+            dst.conditional_formatting.add(str(cf.sqref), rule)
+    if src.print_area:
+        dst.print_area = [a.split("!")[-1] for a in src.print_area.split(",")]
+    dst.sheet_view.zoomScale = src.sheet_view.zoomScale
+    dst.sheet_view.view = src.sheet_view.view
+    dst.sheet_view.showGridLines = src.sheet_view.showGridLines
+    dst.freeze_panes = src.freeze_panes
 
-    pa = (data.get("処理修理後") or "").strip()
-    if pa:
-        ws["C35"] = pa
+def fill_binder_xlsx(template_bytes: bytes, records: List[Dict[str, Optional[str]]]) -> bytes:
+    """
+    records の件数分だけ SHEET_NAME シートを複製し、1 件ずつ書き込んだ .xlsm を返す。
+    テンプレートの読み込みは 1 回だけで、シートはブック内で複製する。
+    """
+    if not records:
+        raise ValueError("出力対象のレコードがありません。")
+    return fill_binder_loaded(_load_template_wb(template_bytes), records)
 
-    if data.get("所属"):
-        ws["C37"] = data["所属"]
+def fill_binder_loaded(wb, records: List[Dict[str, Optional[str]]]) -> bytes:
+    """fill_binder_xlsx の解析済みブック版（load_template_workbook の結果を渡す）"""
+    if not records:
+        raise ValueError("出力対象のレコードがありません。")
+    src = wb[SHEET_NAME] if SHEET_NAME in wb.sheetnames else wb.active
+    pos = wb.sheetnames.index(src.title)
+
+    # 書き込む前の原本から複製し、原本の直後に並べる
+    sheets = [src]
+    for i in range(1, len(records)):
+        ws = wb.copy_worksheet(src)
+        _copy_sheet_extras(src, ws)
+        ws.sheet_view.tabSelected = False
+        wb.move_sheet(ws, offset=pos + i - wb.sheetnames.index(ws.title))
+        sheets.append(ws)
 
     now = datetime.now(JST)
-    ws["B5"], ws["D5"], ws["F5"] = now.year, now.month, now.day
-
-    def write_dt_block(base_row: int, src_key: str):
-        dt = try_parse_datetime(data.get(src_key))
-        y, m, d, wd, hh, mm = split_dt_components(dt)
-        cellmap = {"Y": f"C{base_row}", "Mo": f"F{base_row}", "D": f"H{base_row}",
-                   "W": f"J{base_row}", "H": f"M{base_row}", "Min": f"O{base_row}"}
-        if y is not None: ws[cellmap["Y"]] = y
-        if m is not None: ws[cellmap["Mo"]] = m
-        if d is not None: ws[cellmap["D"]] = d
-        if wd is not None: ws[cellmap["W"]] = wd
-        if hh is not None: ws[cellmap["H"]] = f"{hh:02d}"
-        if mm is not None: ws[cellmap["Min"]] = f"{mm:02d}"
-
-    write_dt_block(13, "受信時刻")
-    write_dt_block(19, "現着時刻")
-    write_dt_block(36, "完了時刻")
-
-    _fill_multiline(ws, "C", 15, data.get("受信内容"), max_lines=4)
-    _fill_multiline(ws, "C", 20, data.get("現着状況"))
-    _fill_multiline(ws, "C", 25, data.get("原因"))
-    _fill_multiline(ws, "C", 30, data.get("処置内容"))
+    used = {t.lower() for t in wb.sheetnames if t not in {ws.title for ws in sheets}}
+    for ws, data in zip(sheets, records):
+        ws.title = binder_sheet_title(data, used)
+        _fill_sheet(ws, data, now)
 
-    out = io.BytesIO()
-    try:
-        wb.save(out)
-    except Exception as e:
-        raise RuntimeError(f"Excel保存時に失敗しました: {e}") from e
+    wb.active = pos
+    return _save_wb(wb)
 
-    return out.getvalue()
+def build_binder_filename(records: List[Dict[str, Optional[str]]]) -> str:
+    manenos = {(r.get("管理番号") or "").strip() for r in records} - {""}
+    manageno = sanitize_filename(manenos.pop().replace("/", "_")) if len(manenos) == 1 else "複数物件"
+    days = sorted(first_date_yyyymmdd(r.get("現着時刻"), r.get("完了時刻"), r.get("受信時刻")) for r in records)
+    span = days[0] if days[0] == days[-1] else f"{days[0]}-{days[-1]}"
+    return f"緊急出動報告書_綴り_{manageno}_{span}.xlsm"
 
 def build_filename(data: Dict[str, Optional[str]]) -> str:
     base_day = first_date_yyyymmdd(data.get("現着時刻"), data.get("完了時刻"), data.get("受信時刻"))
@@ -1,43 +1,215 @@
 # core/inbox_loader.py
+# ------------------------------------------------------------
+# inbox シート（CSV）の読み込み
+#   所属ごとに別シートの inbox を持てるよう、SHEET_CSV_URLS に複数の CSV を並べられる
+#   （従来の SHEET_CSV_URL も 1 件として併用可）。
+#   - 全ソースを asyncio で同時に取得する（所要時間は一番遅い 1 件分）
+#   - ソースごとに INBOX_FETCH_TIMEOUT_SEC（既定 15 秒）で打ち切る。失敗したソースは
+#     前回取得できた内容で代用し、他のソースの結果は待たせない
+#   - token 検索は全ソースを同時に探し、どこかで見つかった時点で返す（止まったソースは待たない）。
+#     取得の終わったソースどうしでは設定順で先のソースの行を採る
+#   - 代用のために覚えておく前回の内容は INBOX_LAST_GOOD_MAX_MB（既定 64MB）までとし、
+#     古く取得したものから捨てる
+#   - 空・HTML・token 列が無い等で読めないソースは飛ばし、inbox_source_errors() で知らせる
+# ------------------------------------------------------------
 from __future__ import annotations
 
-from typing import Dict
+from typing import Dict, Iterator, List, Optional, Tuple
+import asyncio
+import io
 import os
+import re
+import threading
 import unicodedata
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 import streamlit as st
 
+from .profiling import propagate_capture
+from .settings import get_setting
 
-def _get_csv_url() -> str:
+
+# 想定キー（inbox の列順と 1:1 対応させる）
+POS_KEYS = [
+    "token",        # index 0  = A列
+    "管理番号",      # 1        = B列
+    "物件名",        # 2        = C列
+    "住所",          # 3        = D列
+    "窓口会社",      # 4        = E列
+    "メーカー",      # 5        = F列
+    "制御方式",      # 6        = G列
+    "契約種別",      # 7        = H列
+    "受信時刻",      # 8        = I列
+    "現着時刻",      # 9        = J列
+    "完了時刻",      # 10       = K列
+    "通報者",        # 11       = L列
+    "受信内容",      # 12       = M列
+    "現着状況",      # 13       = N列
+    "原因",          # 14       = O列
+    "処置内容",      # 15       = P列 ← ここが本命
+    "対応者",        # 16       = Q列
+    "送信者",        # 17       = R列
+    "完了連絡先1",    # 18       = S列
+    "受付番号",      # 19       = T列
+    "受付URL",       # 20       = U列
+    "現着完了登録URL",# 21       = V列
+    "所属",          # 22       = W列
+    "処理修理後",     # 23       = X列
+    "作業時間_分",    # 24       = Y列
+]
+
+# 返却する辞書に必ず含めるキー（token 以外）
+EXPECTED_KEYS = [k for k in POS_KEYS if k != "token"]
+
+
+def _get_csv_urls() -> List[str]:
     """
-    SHEET_CSV_URL を secrets または環境変数から取得する。
-    - .streamlit/secrets.toml に SHEET_CSV_URL="https://docs.google.com/...export?format=csv&gid=0"
-    - もしくは環境変数 SHEET_CSV_URL に同じURL
-    のどちらかで設定しておく想定。
+    inbox の CSV ソース一覧を secrets または環境変数から取得する。
+    - SHEET_CSV_URLS : 複数（secrets ではリスト可。文字列なら改行かカンマ区切り）
+    - SHEET_CSV_URL  : 従来の 1 件（.streamlit/secrets.toml か環境変数）
+    どちらか（または両方）を設定しておく想定。URL のほかローカルの CSV パスも可。
     """
-    url = ""
+    urls: List[str] = []
+    for name in ("SHEET_CSV_URLS", "SHEET_CSV_URL"):
+        raw = None
+        try:
+            raw = st.secrets.get(name)  # type: ignore[attr-defined]
+        except Exception:
+            raw = None
+        if not raw:
+            raw = os.getenv(name, "")
+        items = raw if isinstance(raw, (list, tuple)) else re.split(r"[\n,]+", str(raw))
+        for u in items:
+            u = str(u).strip()
+            if u and u not in urls:
+                urls.append(u)
+    if not urls:
+        raise RuntimeError("SHEET_CSV_URL（または SHEET_CSV_URLS）が secrets か環境変数に設定されていません。")
+    return urls
+
+
+def _fetch_timeout() -> float:
     try:
-        url = st.secrets.get("SHEET_CSV_URL", "")  # type: ignore[attr-defined]
-    except Exception:
-        url = ""
-    if not url:
-        url = os.getenv("SHEET_CSV_URL", "").strip()
-    if not url:
-        raise RuntimeError("SHEET_CSV_URL が secrets か環境変数に設定されていません。")
-    return url
+        return max(1.0, float(get_setting("INBOX_FETCH_TIMEOUT_SEC", "15")))
+    except ValueError:
+        return 15.0
 
 
-def _load_dataframe() -> pd.DataFrame:
-    """
-    Google スプレッドシートの CSV (export?format=csv...) を DataFrame で取得。
-    1行目はヘッダーとして扱う。
-    """
-    url = _get_csv_url()
+def last_good_max_bytes() -> int:
+    try:
+        mb = float(get_setting("INBOX_LAST_GOOD_MAX_MB", "64"))
+    except ValueError:
+        mb = 64.0
+    return max(0, int(mb * 1024 * 1024))
+
+
+# ソースごとの最後に取得できた CSV（取得失敗時の代用、取得の古い順）と、直近の失敗理由
+_SOURCE_LOCK = threading.Lock()
+_LAST_GOOD: "OrderedDict[str, bytes]" = OrderedDict()
+_SOURCE_ERRORS: Dict[str, str] = {}
+
+
+def _remember_good(src: str, raw: bytes):
+    """取得できた内容を覚えておく（合計が上限を超えたら古いものから捨てる）。_SOURCE_LOCK の中で呼ぶ。"""
+    limit = last_good_max_bytes()
+    _LAST_GOOD.pop(src, None)
+    if len(raw) <= limit:
+        _LAST_GOOD[src] = raw
+    total = sum(len(v) for v in _LAST_GOOD.values())
+    while total > limit and _LAST_GOOD:
+        _, old = _LAST_GOOD.popitem(last=False)
+        total -= len(old)
+# 取得・解析用のスレッド。asyncio.run の既定 executor だと終了時に遅いソースの取得を
+# 待ってしまうので、プロセスで共有する別のプールを使う（打ち切った取得は裏で完了し、次回の代用になる）
+_FETCH_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="inbox_fetch")
+
+
+async def _in_thread(fn, *args):
+    # 採取中（?profile=token 等）なら取得スレッドもサンプリングする
+    return await asyncio.get_running_loop().run_in_executor(_FETCH_POOL, propagate_capture(fn), *args)
+
+
+def _fetch_source(src: str, timeout: float) -> bytes:
+    """1 ソースの CSV をバイト列で取得する（スレッドで実行される）"""
+    if re.match(r"^https?://", src, re.I):
+        with urllib.request.urlopen(src, timeout=timeout) as resp:
+            raw = resp.read()
+    else:
+        with open(src, "rb") as f:
+            raw = f.read()
+    with _SOURCE_LOCK:
+        _remember_good(src, raw)
+        _SOURCE_ERRORS.pop(src, None)
+    return raw
+
+
+def _note_failure(src: str, e: BaseException) -> Optional[bytes]:
+    """取得の失敗を記録し、前回取得できた内容があれば返す。"""
+    msg = "タイムアウト" if isinstance(e, asyncio.TimeoutError) else f"{type(e).__name__}: {e}"
+    with _SOURCE_LOCK:
+        _SOURCE_ERRORS[src] = msg
+        return _LAST_GOOD.get(src)
+
+
+def _note_parse_error(src: str, e: BaseException):
+    """CSV として読めない（空・HTML・token 列が無い等）ソースを記録する。"""
+    with _SOURCE_LOCK:
+        _SOURCE_ERRORS[src] = f"読み込めません（{type(e).__name__}: {e}）"
+
+
+async def _fetch_one(src: str, timeout: float) -> bytes:
+    return await asyncio.wait_for(_in_thread(_fetch_source, src, timeout), timeout)
+
+
+async def _fetch_all(sources: List[str], timeout: float) -> List[Tuple[str, Optional[bytes]]]:
+    results = await asyncio.gather(*(_fetch_one(s, timeout) for s in sources), return_exceptions=True)
+    out = []
+    for src, res in zip(sources, results):
+        if isinstance(res, BaseException):
+            res = _note_failure(src, res)
+        out.append((src, res))
+    return out
+
+
+def _run_async(coro):
+    """スクリプトスレッド（イベントループ無し）からも、ループ実行中のスレッドからも呼べるようにする。"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    box: Dict[str, object] = {}
+
+    def runner():
+        try:
+            box["result"] = asyncio.run(coro)
+        except BaseException as e:  # 呼び出し元のスレッドで投げ直す
+            box["error"] = e
+
+    t = threading.Thread(target=runner, name="inbox_fetch")
+    t.start()
+    t.join()
+    if "error" in box:
+        raise box["error"]  # type: ignore[misc]
+    return box.get("result")
+
+
+def fetch_inbox_sources() -> List[Tuple[str, Optional[bytes]]]:
+    """全ソースを同時に取得して (ソース, CSV バイト列 or None) を設定順に返す。"""
+    return _run_async(_fetch_all(_get_csv_urls(), _fetch_timeout()))
+
+
+def inbox_source_errors() -> Dict[str, str]:
+    """直近の取得で失敗したソースと理由（前回内容で代用中のものを含む）"""
+    with _SOURCE_LOCK:
+        return dict(_SOURCE_ERRORS)
+
+
+def _read_frame(raw: bytes, chunksize: Optional[int] = None):
     # UTF-8 BOM 対策で encoding を utf-8-sig にしておく
-    df = pd.read_csv(url, dtype=str, encoding="utf-8-sig")
-    df = df.fillna("")
-    return df
+    return pd.read_csv(io.BytesIO(raw), dtype=str, encoding="utf-8-sig", chunksize=chunksize)
 
 
 def _norm(s: str) -> str:
@@ -77,103 +249,104 @@ def load_from_sheet_by_token(token: str) -> Dict[str, str]:
         X: 処理修理後
         Y: 作業時間_分
     """
-    df = _load_dataframe()
+    sources = _get_csv_urls()
+    rec = _run_async(_lookup_token(sources, token, _fetch_timeout()))
+    if rec is None:
+        failed = inbox_source_errors()
+        note = f"（取得できなかったソース {len(failed)} 件）" if failed else ""
+        raise KeyError(f"token={token!r} の行が見つかりません。{note}")
+    return rec
+
+
+def _find_in_csv(raw: bytes, token: str) -> Optional[Dict[str, str]]:
+    df = _read_frame(raw).fillna("")
 
     # --- どの列が token なのかを「名前」で特定（BOMや全角を吸収） ---
-    norm_cols = [_norm(c) for c in df.columns]
-    try:
-        token_col = df.columns[norm_cols.index("token")]
-    except ValueError:
-        raise RuntimeError(
-            f'CSV のヘッダーに "token" 列が見つかりません。現在のヘッダー: {list(df.columns)!r}'
-        )
+    token_col = _find_token_col(df)
 
     # token で対象行を絞り込む
     sub = df[df[token_col] == token]
     if sub.empty:
-        raise KeyError(f"token={token!r} の行が見つかりません。")
+        return None
 
     # 単一行
     row = sub.iloc[0]
 
-    # DataFrame 上の「列名」と「値」をそのまま記録しておく（デバッグ用）
-    columns = [str(c) for c in sub.columns]
-    values_raw = [("" if v is None else str(v)) for v in row.tolist()]
-
-    # 想定キー（inbox の列順と 1:1 対応させる）
-    pos_keys = [
-        "token",        # index 0  = A列
-        "管理番号",      # 1        = B列
-        "物件名",        # 2        = C列
-        "住所",          # 3        = D列
-        "窓口会社",      # 4        = E列
-        "メーカー",      # 5        = F列
-        "制御方式",      # 6        = G列
-        "契約種別",      # 7        = H列
-        "受信時刻",      # 8        = I列
-        "現着時刻",      # 9        = J列
-        "完了時刻",      # 10       = K列
-        "通報者",        # 11       = L列
-        "受信内容",      # 12       = M列
-        "現着状況",      # 13       = N列
-        "原因",          # 14       = O列
-        "処置内容",      # 15       = P列 ← ここが本命
-        "対応者",        # 16       = Q列
-        "送信者",        # 17       = R列
-        "完了連絡先1",    # 18       = S列
-        "受付番号",      # 19       = T列
-        "受付URL",       # 20       = U列
-        "現着完了登録URL",# 21       = V列
-        "所属",          # 22       = W列
-        "処理修理後",     # 23       = X列
-        "作業時間_分",    # 24       = Y列
-    ]
-
-    # values_raw の長さと pos_keys の長さがズレていればここで補正
-    if len(values_raw) < len(pos_keys):
+    return _row_to_record(
+        [str(c) for c in sub.columns],
+        [("" if v is None else str(v)) for v in row.tolist()],
+    )
+
+
+async def _find_in_source(src: str, token: str, timeout: float) -> Optional[Dict[str, str]]:
+    try:
+        raw = await _fetch_one(src, timeout)
+    except Exception as e:
+        raw = _note_failure(src, e)
+        if raw is None:
+            return None
+    try:
+        return await _in_thread(_find_in_csv, raw, token)
+    except Exception as e:
+        # 空・token 列が無い等、そのソースだけの問題。他のソースの検索は続ける
+        _note_parse_error(src, e)
+        return None
+
+
+async def _lookup_token(sources: List[str], token: str, timeout: float) -> Optional[Dict[str, str]]:
+    """
+    全ソースを同時に探し、どこかで見つかった時点でその行を返す。遅い・止まったソースがあっても、
+    他のソースで見つかればそのソースは待たない。取得の終わったソースどうしでは設定順で先のものを採る。
+    """
+    tasks = [asyncio.ensure_future(_find_in_source(s, token, timeout)) for s in sources]
+    try:
+        pending = set(tasks)
+        while pending:
+            _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in tasks:
+                if t.done() and t.result() is not None:
+                    return t.result()
+        return None
+    finally:
+        for t in tasks:
+            t.cancel()
+
+
+def _find_token_col(df: pd.DataFrame) -> str:
+    """どの列が token なのかを「名前」で特定（BOMや全角を吸収）"""
+    norm_cols = [_norm(c) for c in df.columns]
+    try:
+        return df.columns[norm_cols.index("token")]
+    except ValueError:
+        raise RuntimeError(
+            f'CSV のヘッダーに "token" 列が見つかりません。現在のヘッダー: {list(df.columns)!r}'
+        )
+
+
+def _row_to_record(columns: List[str], values_raw: List[str], with_token: bool = False) -> Dict[str, str]:
+    """
+    inbox の 1 行（列名・値）を、列の“位置”を決め打ちして Step3 用の辞書にする。
+    with_token=True の場合は "token" キーも残す（一括処理用）。
+    """
+    # values_raw の長さと POS_KEYS の長さがズレていればここで補正
+    if len(values_raw) < len(POS_KEYS):
         # 足りない分は空文字で埋める
-        values = values_raw + [""] * (len(pos_keys) - len(values_raw))
+        values = values_raw + [""] * (len(POS_KEYS) - len(values_raw))
     else:
-        # 余っている場合は pos_keys の分だけ使う
-        values = values_raw[: len(pos_keys)]
+        # 余っている場合は POS_KEYS の分だけ使う
+        values = values_raw[: len(POS_KEYS)]
 
     # 位置で dict 化
     data_by_pos = {
         key: (val.strip() if isinstance(val, str) else "")
-        for key, val in zip(pos_keys, values)
+        for key, val in zip(POS_KEYS, values)
     }
 
     # token は返さない
-    rec: Dict[str, str] = {k: v for k, v in data_by_pos.items() if k != "token"}
+    rec: Dict[str, str] = {k: v for k, v in data_by_pos.items() if with_token or k != "token"}
 
     # 念のため、想定キーをすべて埋めておく
-    expected_keys = [
-        "管理番号",
-        "物件名",
-        "住所",
-        "窓口会社",
-        "メーカー",
-        "制御方式",
-        "契約種別",
-        "受信時刻",
-        "現着時刻",
-        "完了時刻",
-        "通報者",
-        "受信内容",
-        "現着状況",
-        "原因",
-        "処置内容",
-        "対応者",
-        "送信者",
-        "完了連絡先1",
-        "受付番号",
-        "受付URL",
-        "現着完了登録URL",
-        "所属",
-        "処理修理後",
-        "作業時間_分",
-    ]
-    for key in expected_keys:
+    for key in EXPECTED_KEYS:
         rec.setdefault(key, "")
 
     # --- デバッグ情報を付与（Step3 の「🛠デバッグ」枠で確認用） ---
@@ -182,4 +355,44 @@ def load_from_sheet_by_token(token: str) -> Dict[str, str]:
     # 行の値（index付き）
     rec["_DEBUG_VALUES"] = " | ".join(f"[{i}]{v}" for i, v in enumerate(values_raw))
 
-    return rec
\ No newline at end of file
+    return rec
+
+
+def load_inbox_records() -> List[Dict[str, str]]:
+    """inbox の全行を load_from_sheet_by_token と同じ形の辞書（token 付き）で返す。"""
+    return list(iter_inbox_records())
+
+
+def iter_inbox_records(chunksize: int = 5000) -> Iterator[Dict[str, str]]:
+    """
+    全ソースの inbox を chunksize 行ずつ読みながら 1 行ずつ辞書（token 付き）で返す。
+    全行を DataFrame に載せないので、大きな inbox でもメモリは一定。
+    同じ token が複数のソースにある場合は、設定順で先のソースの行だけを返す。
+    """
+    seen = set()
+    for src, raw in fetch_inbox_sources():
+        if raw is None:
+            continue
+        try:
+            yield from _iter_source_records(raw, chunksize, seen)
+        except Exception as e:
+            # 空・HTML が返った等のソースは飛ばし、inbox_source_errors() で知らせる
+            _note_parse_error(src, e)
+
+
+def _iter_source_records(raw: bytes, chunksize: int, seen: set) -> Iterator[Dict[str, str]]:
+    columns = None
+    token_idx = 0
+    for chunk in _read_frame(raw, chunksize=chunksize):
+        chunk = chunk.fillna("")
+        if columns is None:
+            columns = [str(c) for c in chunk.columns]
+            token_idx = columns.index(str(_find_token_col(chunk)))
+        for row in chunk.itertuples(index=False, name=None):
+            values = [("" if v is None else str(v)) for v in row]
+            token = values[token_idx].strip() if token_idx < len(values) else ""
+            if token:
+                if token in seen:
+                    continue
+                seen.add(token)
+            yield _row_to_record(columns, values, with_token=True)
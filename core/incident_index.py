@@ -0,0 +1,276 @@
+# report_maker/core/incident_index.py
+# ------------------------------------------------------------
+# 過去案件の全文索引（SQLite FTS5 / trigram）
+#   - 日本語は分かち書きせず 3-gram で索引する（tokenize='trigram'）
+#   - index_records() は内容ハッシュを見て変わった行だけ書き換える（増分更新）
+#   - find_similar() は 管理番号・メーカー・受信内容 から 1 回の MATCH で
+#     bm25 順に上位を返す（数ミリ秒）
+# 保存先は local_store.store_path()（INCIDENT_INDEX_PATH、既定 ./incident_index.sqlite3）
+# ------------------------------------------------------------
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from .local_store import LOCK as _LOCK, connect
+from .parsing import try_parse_datetime
+
+# 索引に保持するレコードのキー（デバッグ用・token 等は持たない）
+RECORD_KEYS = [
+    "管理番号", "物件名", "住所", "窓口会社", "メーカー", "制御方式", "契約種別",
+    "受信時刻", "現着時刻", "完了時刻", "通報者", "受信内容", "現着状況", "原因", "処置内容",
+    "対応者", "送信者", "完了連絡先1", "受付番号", "受付URL", "現着完了登録URL", "所属",
+    "処理修理後", "作業時間_分",
+]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS incidents (
+    id           INTEGER PRIMARY KEY,
+    incident_key TEXT NOT NULL UNIQUE,
+    content_hash TEXT NOT NULL,
+    manageno     TEXT NOT NULL DEFAULT '',
+    maker        TEXT NOT NULL DEFAULT '',
+    received_at  TEXT NOT NULL DEFAULT '',
+    received     TEXT NOT NULL DEFAULT '',
+    status       TEXT NOT NULL DEFAULT '',
+    cause        TEXT NOT NULL DEFAULT '',
+    action       TEXT NOT NULL DEFAULT '',
+    record_json  TEXT NOT NULL,
+    updated_at   REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_incidents_manageno ON incidents(manageno);
+CREATE INDEX IF NOT EXISTS idx_incidents_received_at ON incidents(received_at);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS incidents_fts USING fts5(
+    manageno, maker, received, status, cause, action,
+    content='incidents', content_rowid='id', tokenize='trigram'
+);
+
+CREATE TRIGGER IF NOT EXISTS incidents_ai AFTER INSERT ON incidents BEGIN
+    INSERT INTO incidents_fts(rowid, manageno, maker, received, status, cause, action)
+    VALUES (new.id, new.manageno, new.maker, new.received, new.status, new.cause, new.action);
+END;
+CREATE TRIGGER IF NOT EXISTS incidents_ad AFTER DELETE ON incidents BEGIN
+    INSERT INTO incidents_fts(incidents_fts, rowid, manageno, maker, received, status, cause, action)
+    VALUES ('delete', old.id, old.manageno, old.maker, old.received, old.status, old.cause, old.action);
+END;
+CREATE TRIGGER IF NOT EXISTS incidents_au AFTER UPDATE ON incidents BEGIN
+    INSERT INTO incidents_fts(incidents_fts, rowid, manageno, maker, received, status, cause, action)
+    VALUES ('delete', old.id, old.manageno, old.maker, old.received, old.status, old.cause, old.action);
+    INSERT INTO incidents_fts(rowid, manageno, maker, received, status, cause, action)
+    VALUES (new.id, new.manageno, new.maker, new.received, new.status, new.cause, new.action);
+END;
+"""
+
+# bm25 の列重み（manageno, maker, received, status, cause, action の順）
+_BM25_WEIGHTS = (8.0, 2.0, 3.0, 1.0, 1.0, 0.5)
+# 1 クエリで使う 3-gram の上限（長文貼付けでクエリが肥大しないように）
+_MAX_GRAMS = 48
+
+
+def _connect(path: Optional[str] = None) -> sqlite3.Connection:
+    return connect(_SCHEMA, path)
+
+
+def _s(rec: Dict[str, Optional[str]], key: str) -> str:
+    return (rec.get(key) or "").strip()
+
+
+def _received_at(rec: Dict[str, Optional[str]]) -> str:
+    dt = try_parse_datetime(rec.get("受信時刻"))
+    return dt.strftime("%Y-%m-%d %H:%M") if dt else _s(rec, "受信時刻")
+
+
+def incident_key(rec: Dict[str, Optional[str]]) -> str:
+    """
+    同じ案件を同じキーにする（メール貼付け由来でも inbox 由来でも一致させる）。
+    管理番号・受信時刻・受付番号 が全部空の場合は内容ハッシュで代用する。
+    受付番号の無いレコード（報告書の取り込み）は index_records で既存の行にまとめる。
+    """
+    parts = [_s(rec, "管理番号"), _received_at(rec), _s(rec, "受付番号")]
+    if not any(parts):
+        return "h:" + _content_hash(rec)
+    return "k:" + "|".join(parts)
+
+
+def _record_payload(rec: Dict[str, Optional[str]]) -> Dict[str, str]:
+    return {k: _s(rec, k) for k in RECORD_KEYS}
+
+
+def _content_hash(rec: Dict[str, Optional[str]]) -> str:
+    raw = json.dumps(_record_payload(rec), ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _merge_same_incident(conn: sqlite3.Connection, key: str, rec: Dict[str, Optional[str]]):
+    """
+    受付番号の有無だけが違う同じ案件（管理番号・受信時刻が同じ）を 1 行にまとめる。
+      - 受付番号が無い（報告書の取り込み）→ 既にある行のキーを使う
+      - 受付番号が有る → 受付番号の無い行があれば、そのキーを付け替える
+    どちらも (キー, 既存の値に今回の空でない値を重ねたレコード, 既存行の内容ハッシュ) を返す。
+    まとめる行が無ければ (key, rec, None)。
+    """
+    manageno, received_at = _s(rec, "管理番号"), _received_at(rec)
+    if not (manageno and received_at):
+        return key, rec, None
+    if _s(rec, "受付番号"):
+        bare = "k:" + "|".join([manageno, received_at, ""])
+        row = conn.execute("SELECT content_hash, record_json FROM incidents WHERE incident_key = ?",
+                           (bare,)).fetchone()
+        if row is None:
+            return key, rec, None
+        conn.execute("UPDATE incidents SET incident_key = ? WHERE incident_key = ?", (key, bare))
+    else:
+        row = conn.execute(
+            """
+            SELECT incident_key, content_hash, record_json FROM incidents
+            WHERE manageno = ? AND received_at = ? ORDER BY id LIMIT 1
+            """,
+            (manageno, received_at),
+        ).fetchone()
+        if row is None:
+            return key, rec, None
+        key = row["incident_key"]
+    merged = json.loads(row["record_json"])
+    merged.update({k: v for k, v in _record_payload(rec).items() if v})
+    return key, merged, row["content_hash"]
+
+
+def index_records(records: Iterable[Dict[str, Optional[str]]], path: Optional[str] = None) -> int:
+    """
+    レコードを索引に追加・更新する。内容が変わっていない行は触らない。
+    追加・更新した件数を返す。
+    """
+    conn = _connect(path)
+    changed = 0
+    now = time.time()
+    with _LOCK:
+        known = {}
+        rows = []
+        for rec in records:
+            if not any(_s(rec, k) for k in ("管理番号", "受信内容", "原因", "処置内容")):
+                continue
+            rows.append((incident_key(rec), _content_hash(rec), rec))
+
+        # 既存ハッシュはまとめて引く（SQLite の変数上限に合わせて分割）
+        keys = [r[0] for r in rows]
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            q = f"SELECT incident_key, content_hash FROM incidents WHERE incident_key IN ({','.join('?' * len(chunk))})"
+            known.update(conn.execute(q, chunk).fetchall())
+
+        with conn:
+            for key, chash, rec in rows:
+                if key not in known:
+                    key, rec, stored = _merge_same_incident(conn, key, rec)
+                    known[key] = stored
+                    chash = _content_hash(rec)
+                if known.get(key) == chash:
+                    continue
+                conn.execute(
+                    """
+                    INSERT INTO incidents(incident_key, content_hash, manageno, maker, received_at,
+                                          received, status, cause, action, record_json, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(incident_key) DO UPDATE SET
+                        content_hash=excluded.content_hash, manageno=excluded.manageno,
+                        maker=excluded.maker, received_at=excluded.received_at,
+                        received=excluded.received, status=excluded.status,
+                        cause=excluded.cause, action=excluded.action,
+                        record_json=excluded.record_json, updated_at=excluded.updated_at
+                    """,
+                    (key, chash, _s(rec, "管理番号"), _s(rec, "メーカー"), _received_at(rec),
+                     _s(rec, "受信内容"), _s(rec, "現着状況"), _s(rec, "原因"), _s(rec, "処置内容"),
+                     json.dumps(_record_payload(rec), ensure_ascii=False), now),
+                )
+                known[key] = chash
+                changed += 1
+    return changed
+
+
+def _fts_quote(s: str) -> str:
+    return '"' + s.replace('"', '""') + '"'
+
+
+def _trigrams(text: str) -> List[str]:
+    """空白で区切った各語から 3-gram を作る（出現順・重複なし・上限あり）"""
+    seen = []
+    for word in (text or "").split():
+        for i in range(len(word) - 2):
+            g = word[i:i + 3]
+            if g not in seen:
+                seen.append(g)
+                if len(seen) >= _MAX_GRAMS:
+                    return seen
+    return seen
+
+
+def _build_match(rec: Dict[str, Optional[str]]) -> str:
+    terms = []
+    manageno = _s(rec, "管理番号")
+    if len(manageno) >= 3:
+        terms.append(f"manageno : {_fts_quote(manageno)}")
+    maker = _s(rec, "メーカー")
+    if len(maker) >= 3:
+        terms.append(f"maker : {_fts_quote(maker)}")
+    grams = _trigrams(_s(rec, "受信内容"))
+    if grams:
+        terms.append("{received status cause} : (" + " OR ".join(_fts_quote(g) for g in grams) + ")")
+    return " OR ".join(terms)
+
+
+def find_similar(rec: Dict[str, Optional[str]], limit: int = 5,
+                 path: Optional[str] = None) -> List[Dict[str, str]]:
+    """現在の案件に似た過去案件を bm25 順に返す（自分自身は除く）。"""
+    match = _build_match(rec)
+    if not match:
+        return []
+    conn = _connect(path)
+    weights = ", ".join(str(w) for w in _BM25_WEIGHTS)
+    q = f"""
+        SELECT i.record_json, bm25(incidents_fts, {weights}) AS score
+        FROM incidents_fts JOIN incidents i ON i.id = incidents_fts.rowid
+        WHERE incidents_fts MATCH ? AND i.incident_key != ?
+        ORDER BY score
+        LIMIT ?
+    """
+    with _LOCK:
+        try:
+            rows = conn.execute(q, (match, incident_key(rec), int(limit))).fetchall()
+        except sqlite3.OperationalError:
+            return []
+    out = []
+    for r in rows:
+        d = json.loads(r["record_json"])
+        d["_score"] = f"{-r['score']:.2f}"
+        out.append(d)
+    return out
+
+
+def iter_indexed_records(path: Optional[str] = None, batch_size: int = 1000) -> Iterator[Dict[str, str]]:
+    """索引済みレコードを受信時刻順に少しずつ読み出す（全件をメモリに載せない）。"""
+    conn = _connect(path)
+    last_key = ("", 0)
+    while True:
+        with _LOCK:
+            rows = conn.execute(
+                """
+                SELECT id, received_at, record_json FROM incidents
+                WHERE (received_at, id) > (?, ?)
+                ORDER BY received_at, id LIMIT ?
+                """,
+                (last_key[0], last_key[1], batch_size),
+            ).fetchall()
+        if not rows:
+            return
+        for r in rows:
+            yield json.loads(r["record_json"])
+        last_key = (rows[-1]["received_at"], rows[-1]["id"])
+
+
+def count_indexed(path: Optional[str] = None) -> int:
+    with _LOCK:
+        return _connect(path).execute("SELECT COUNT(*) FROM incidents").fetchone()[0]
@@ -0,0 +1,237 @@
+# report_maker/core/job_pool.py
+# ------------------------------------------------------------
+# 帳票生成用の共有プロセスプール（受付制限付き）
+#   openpyxl の解析・zip 圧縮は GIL を握り続けるため、スクリプトスレッドで直接
+#   実行すると同じプロセスの他セッションまで遅くなる。重い生成は別プロセスへ逃がす。
+#   - 同時実行数   : GEN_POOL_WORKERS（既定 min(4, CPU数)）
+#   - 待ち行列上限 : GEN_QUEUE_MAX（既定 8）。超えたら PoolBusyError で即座に断る
+#   - 1 件の制限時間: GEN_JOB_TIMEOUT_SEC（既定 60 秒、ワーカー側で SIGALRM）
+#   - 待ち行列での待ち時間も GEN_QUEUE_TIMEOUT_SEC（既定 120 秒）で打ち切る
+#   - 一覧出力のような長い一括処理は lane="bulk" で別のプールに流し、対話の生成と
+#     ワーカーを取り合わないようにする（同時実行 BULK_POOL_WORKERS 既定 1、
+#     待ち行列 BULK_QUEUE_MAX 既定 2）
+# ------------------------------------------------------------
+from __future__ import annotations
+
+import itertools
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, Optional
+
+from .settings import get_setting
+
+# 対話の生成用と一括処理用のプール
+LANES = ("interactive", "bulk")
+
+
+class PoolBusyError(RuntimeError):
+    """待ち行列が一杯で新しい生成を受け付けられない"""
+
+
+class JobTimeoutError(RuntimeError):
+    """生成が制限時間内に終わらなかった"""
+
+
+def _int_setting(name: str, default: int) -> int:
+    try:
+        return int(float(get_setting(name, str(default))))
+    except ValueError:
+        return default
+
+
+def pool_workers(lane: str = "interactive") -> int:
+    if lane == "bulk":
+        return max(1, _int_setting("BULK_POOL_WORKERS", 1))
+    return max(1, _int_setting("GEN_POOL_WORKERS", min(4, os.cpu_count() or 1)))
+
+
+def queue_max(lane: str = "interactive") -> int:
+    if lane == "bulk":
+        return max(0, _int_setting("BULK_QUEUE_MAX", 2))
+    return max(0, _int_setting("GEN_QUEUE_MAX", 8))
+
+
+def job_timeout() -> int:
+    return max(1, _int_setting("GEN_JOB_TIMEOUT_SEC", 60))
+
+
+def queue_timeout() -> int:
+    return max(1, _int_setting("GEN_QUEUE_TIMEOUT_SEC", 120))
+
+
+# =======================
+# ワーカー側
+# =======================
+def _on_alarm(signum, frame):
+    raise JobTimeoutError("生成が制限時間を超えたため中断しました。")
+
+
+def _run_in_worker(fn: Callable, args: tuple, timeout: int):
+    """ワーカープロセス内で fn(*args) を制限時間付きで実行する。"""
+    use_alarm = hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.alarm(timeout)
+    try:
+        return fn(*args)
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+
+
+# =======================
+# 親プロセス側
+# =======================
+class _Job:
+    __slots__ = ("job_id", "future", "submitted_at", "seq", "timeout", "lane")
+
+    def __init__(self, job_id: str, future: Future, seq: int, timeout: int, lane: str):
+        self.job_id = job_id
+        self.future = future
+        self.submitted_at = time.time()
+        self.seq = seq
+        self.timeout = timeout
+        self.lane = lane
+
+
+_LOCK = threading.Lock()
+_EXECUTORS: Dict[str, ProcessPoolExecutor] = {}
+_JOBS: Dict[str, _Job] = {}
+_SEQ = itertools.count(1)
+
+# 結果を取りに来ないジョブを破棄するまでの秒数
+_RESULT_TTL = 600
+
+
+def _executor(lane: str) -> ProcessPoolExecutor:
+    ex = _EXECUTORS.get(lane)
+    if ex is None:
+        # Streamlit はスレッドを多数抱えているので fork ではなく spawn で起動する
+        ex = _EXECUTORS[lane] = ProcessPoolExecutor(
+            max_workers=pool_workers(lane),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return ex
+
+
+def _inflight(lane: str = "interactive") -> list:
+    return sorted((j for j in _JOBS.values() if j.lane == lane and not j.future.done()),
+                  key=lambda j: j.seq)
+
+
+def _reap(now: float):
+    for jid in [jid for jid, j in _JOBS.items()
+                if j.future.done() and now - j.submitted_at > _RESULT_TTL]:
+        _JOBS.pop(jid, None)
+
+
+def submit_job(fn: Callable, *args, timeout: Optional[int] = None, lane: str = "interactive") -> str:
+    """
+    fn(*args) をプールに投入してジョブIDを返す。fn はモジュール直下の関数であること（pickle のため）。
+    実行中＋待ちが上限を超える場合は PoolBusyError。
+    timeout を省略した場合は GEN_JOB_TIMEOUT_SEC。lane="bulk" は一括処理用の別プール。
+    """
+    if lane not in LANES:
+        raise ValueError(f"未知の lane です: {lane!r}")
+    now = time.time()
+    with _LOCK:
+        _reap(now)
+        if len(_inflight(lane)) >= pool_workers(lane) + queue_max(lane):
+            raise PoolBusyError(
+                "ただいま一覧出力が混み合っています。しばらく待ってから再度お試しください。"
+                if lane == "bulk" else
+                "ただいま帳票生成が混み合っています。しばらく待ってから再度お試しください。"
+            )
+        timeout = timeout or job_timeout()
+        try:
+            fut = _executor(lane).submit(_run_in_worker, fn, args, timeout)
+        except RuntimeError:
+            # ワーカー異常終了でプールが壊れた場合は作り直す（壊れたプールは待たずに片付ける）
+            broken = _EXECUTORS.pop(lane, None)
+            if broken is not None:
+                broken.shutdown(wait=False, cancel_futures=True)
+            fut = _executor(lane).submit(_run_in_worker, fn, args, timeout)
+        seq = next(_SEQ)
+        job_id = f"job{seq}"
+        _JOBS[job_id] = _Job(job_id, fut, seq, timeout, lane)
+        return job_id
+
+
+def pool_idle() -> bool:
+    """
+    対話用のプールに実行中・待ちのジョブが 1 件も無ければ True
+    （裏方の処理が対話操作と競合しないように使う）
+    """
+    with _LOCK:
+        return not _inflight()
+
+
+def job_status(job_id: str) -> Dict[str, object]:
+    """
+    state: "queued" / "running" / "done" / "error" / "missing"
+    position: 自分より前に待っている件数（queued のときのみ意味を持つ）
+    """
+    now = time.time()
+    with _LOCK:
+        job = _JOBS.get(job_id)
+        if job is None:
+            return {"state": "missing", "position": 0}
+        fut = job.future
+        if not fut.done():
+            inflight = _inflight(job.lane)
+            idx = next((i for i, j in enumerate(inflight) if j.job_id == job_id), 0)
+            position = max(0, idx - pool_workers(job.lane) + 1)
+            waited = now - job.submitted_at
+            if position > 0 and waited > queue_timeout():
+                if fut.cancel():
+                    return {"state": "error", "position": 0,
+                            "error": "待ち時間が上限を超えたため取り消しました。"}
+            # 親側の保険（SIGALRM が使えない環境向け）。実行中のワーカーは止められないので、
+            # 終わるまではジョブを残して実行中の件数に数え続ける
+            if waited > queue_timeout() + job.timeout + 5:
+                if fut.cancel():
+                    return {"state": "error", "position": 0, "error": "生成が取り消されました。"}
+                return {"state": "error", "position": 0,
+                        "error": "生成が制限時間を超えました（処理はまだ終わっていないため、"
+                                 "しばらくは次の生成が待たされることがあります）。"}
+            return {"state": "queued" if position > 0 else "running", "position": position}
+
+    if fut.cancelled():
+        return {"state": "error", "position": 0, "error": "生成が取り消されました。"}
+    err = fut.exception()
+    if err is not None:
+        return {"state": "error", "position": 0, "error": str(err) or type(err).__name__}
+    return {"state": "done", "position": 0}
+
+
+def wait_job(job_id: str, timeout: float) -> Dict[str, object]:
+    """最大 timeout 秒だけ完了を待ってから job_status を返す。"""
+    with _LOCK:
+        job = _JOBS.get(job_id)
+    if job is not None:
+        try:
+            job.future.exception(timeout=timeout)
+        except Exception:
+            pass
+    return job_status(job_id)
+
+
+def take_result(job_id: str):
+    """完了したジョブの結果を取り出し、ジョブを破棄する。"""
+    with _LOCK:
+        job = _JOBS.pop(job_id, None)
+    if job is None:
+        return None
+    return job.future.result(timeout=0)
+
+
+def discard_job(job_id: str):
+    """不要になったジョブを取り消す（実行中なら終わるまで件数には数え続ける）"""
+    with _LOCK:
+        job = _JOBS.get(job_id)
+        if job is not None and (job.future.cancel() or job.future.done()):
+            _JOBS.pop(job_id, None)
@@ -0,0 +1,42 @@
+# report_maker/core/local_store.py
+# ------------------------------------------------------------
+# ローカル SQLite ストアの接続管理
+#   過去案件の索引（incident_index）や物件台帳（property_master）が同じファイルを使う。
+#   保存先は INCIDENT_INDEX_PATH（secrets / 環境変数）、既定は ./incident_index.sqlite3
+# ------------------------------------------------------------
+from __future__ import annotations
+
+import sqlite3
+import threading
+from typing import Dict, Optional, Set, Tuple
+
+from .settings import get_setting
+
+DEFAULT_STORE_PATH = "incident_index.sqlite3"
+
+# 接続はパスごとに 1 本をプロセス内で共有し、読み書きはこのロックで直列化する
+LOCK = threading.RLock()
+_CONNS: Dict[str, sqlite3.Connection] = {}
+_SCHEMAS_APPLIED: Set[Tuple[str, int]] = set()
+
+
+def store_path() -> str:
+    return get_setting("INCIDENT_INDEX_PATH", DEFAULT_STORE_PATH)
+
+
+def connect(schema: str, path: Optional[str] = None) -> sqlite3.Connection:
+    """path の共有接続を返す。schema（CREATE ... IF NOT EXISTS）は初回だけ流す。"""
+    path = path or store_path()
+    with LOCK:
+        conn = _CONNS.get(path)
+        if conn is None:
+            conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            _CONNS[path] = conn
+        key = (path, hash(schema))
+        if key not in _SCHEMAS_APPLIED:
+            conn.executescript(schema)
+            _SCHEMAS_APPLIED.add(key)
+        return conn
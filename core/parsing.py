@@ -1,8 +1,12 @@
 # report_maker/core/parsing.py
+import json
+import logging
+import os
 import re
-from typing import Dict, Optional, Tuple
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
 from datetime import datetime
-from .settings import JST, WEEKDAYS_JA
+from .settings import JST, WEEKDAYS_JA, get_setting
 from .textutil import normalize_text
 
 LABEL_CANON = {
@@ -32,6 +36,169 @@ LABEL_CANON = {
 MULTILINE_KEYS = {"受信内容", "現着状況", "原因", "処置内容"}
 LABEL_REGEX = re.compile(r"^\s*([^\s:：]+(?:・[^\s:：]+)?)\s*[:：]\s*(.*)$")
 
+# =======================
+# メール書式プロファイル
+# =======================
+# 判定に使うのは本文先頭のこの行数まで（件名・差出人・冒頭の定型文が入る範囲）
+SIGNATURE_HEADER_LINES = 20
+
+_BARE_FLAGS = re.compile("").flags
+
+def _check_signature(signature: str):
+    """
+    signature は全プロファイル分を 1 本の選択（名前付きグループ）にまとめて使うので、
+    名前付きグループ・全体に効くインラインフラグ（(?i) など）は他のプロファイルと衝突する。
+    正規表現として誤っていれば re.error、使えない書き方なら ValueError。
+    """
+    pattern = re.compile(signature)
+    if pattern.groupindex:
+        raise ValueError(f"signature に名前付きグループは使えません: {signature!r}")
+    if pattern.flags != _BARE_FLAGS:
+        raise ValueError(f"signature にインラインフラグは使えません（(?i:...) の形なら使えます）: {signature!r}")
+
+class MailProfile:
+    """
+    保守会社ごとのメール書式。
+    signature        : 先頭行に対する正規表現（None は既定プロファイル＝どれにも当たらない時）
+    label_canon      : メール上のラベル → 内部キー
+    multiline_keys   : 次のラベルまで複数行を取り込むキー
+    subject_case     : 件名から 案件種別 を取る正規表現（group 1）
+    subject_manageno : 件名から 管理番号 を取る正規表現（group 1）
+    """
+
+    def __init__(self, name: str, label_canon: Dict[str, str], multiline_keys: Iterable[str],
+                 signature: Optional[str] = None,
+                 subject_case: str = r"^件名:\s*【\s*([^】]+)\s*】",
+                 subject_manageno: str = r"件名:.*?【[^】]+】\s*([A-Z0-9\-]+)"):
+        self.name = name
+        self.signature = signature
+        # メール本文は NFKC 済みで照合するのでラベル側も揃えておく
+        self.label_canon = {normalize_text(k): v for k, v in label_canon.items()}
+        self.multiline_keys = frozenset(multiline_keys)
+        self.subject_case_re = re.compile(subject_case, flags=re.MULTILINE)
+        self.subject_manageno_re = re.compile(subject_manageno, flags=re.IGNORECASE)
+        if signature is not None:
+            _check_signature(signature)  # 書式誤りは登録時に気付けるように
+
+    def __repr__(self):
+        return f"MailProfile({self.name!r})"
+
+DEFAULT_PROFILE = MailProfile("default", LABEL_CANON, MULTILINE_KEYS)
+
+_PROFILES_LOCK = threading.Lock()
+_PROFILES: List[MailProfile] = []
+# (全 signature をまとめた正規表現, グループ番号 → プロファイル) を一緒に差し替える
+_DISPATCH: Tuple[Optional["re.Pattern[str]"], Dict[str, MailProfile]] = (None, {})
+# MAIL_PROFILES_PATH の読み込み状態。失敗した場合はファイルが更新されるまで読み直さない
+_PROFILES_FILE_LOCK = threading.Lock()
+_PROFILES_FILE_LOADED = False
+_PROFILES_FILE_FAILED: Optional[Tuple[str, float]] = None
+_PROFILES_FILE_ERROR = ""
+_log = logging.getLogger(__name__)
+
+def _build_dispatch(profiles: List[MailProfile]):
+    """全プロファイルの signature を 1 本の正規表現（名前付きグループの選択）にまとめる。"""
+    parts, by_group = [], {}
+    for i, p in enumerate(profiles):
+        if p.signature:
+            parts.append(f"(?P<p{i}>{p.signature})")
+            by_group[f"p{i}"] = p
+    return (re.compile("|".join(parts), flags=re.MULTILINE) if parts else None, by_group)
+
+def register_profile(profile: MailProfile):
+    """
+    書式プロファイルを追加する（同名は置き換え）。
+    まとめた正規表現が作れない場合は re.error / ValueError で、登録済みのものは変えない。
+    """
+    global _DISPATCH
+    with _PROFILES_LOCK:
+        profiles = [p for p in _PROFILES if p.name != profile.name] + [profile]
+        dispatch = _build_dispatch(profiles)
+        _PROFILES[:] = profiles
+        _DISPATCH = dispatch
+
+def load_profiles_file(path: str) -> int:
+    """
+    JSON からプロファイルを読み込んで登録する。形式:
+      [{"name": "...", "signature": "...", "labels": {"ラベル": "内部キー", ...},
+        "multiline": ["受信内容", ...], "subject_case": "...", "subject_manageno": "..."}]
+    labels / multiline を省略した場合は既定プロファイルのものを使う。
+    読めない場合は OSError、形式が誤っている場合は ValueError（どちらも 1 件も登録しない）。
+    """
+    with open(path, encoding="utf-8") as f:
+        items = json.load(f)
+    if not isinstance(items, list):
+        raise ValueError("書式プロファイルのファイルはリスト（[...]）で書いてください。")
+    profiles = []
+    for i, it in enumerate(items):
+        try:
+            kwargs = {k: it[k] for k in ("subject_case", "subject_manageno") if it.get(k)}
+            profiles.append(MailProfile(
+                it["name"],
+                it.get("labels") or LABEL_CANON,
+                it.get("multiline") or MULTILINE_KEYS,
+                signature=it.get("signature"),
+                **kwargs,
+            ))
+        except (KeyError, TypeError, AttributeError, ValueError, re.error) as e:
+            raise ValueError(f"書式プロファイルの {i + 1} 件目が正しくありません: {type(e).__name__}: {e}") from e
+    for profile in profiles:
+        register_profile(profile)
+    return len(profiles)
+
+def _file_mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return -1.0
+
+def _ensure_profiles_file_loaded():
+    """
+    MAIL_PROFILES_PATH が設定されていれば 1 回だけ読み込む。
+    読めない・形式が誤っている場合は既定の書式だけで続け（抽出は止めない）、
+    理由を profiles_file_error() で返す。ファイルが更新されたら読み直す。
+    """
+    global _PROFILES_FILE_LOADED, _PROFILES_FILE_FAILED, _PROFILES_FILE_ERROR
+    if _PROFILES_FILE_LOADED:
+        return
+    with _PROFILES_FILE_LOCK:
+        if _PROFILES_FILE_LOADED:
+            return
+        path = get_setting("MAIL_PROFILES_PATH")
+        if not path:
+            _PROFILES_FILE_LOADED = True
+            return
+        attempt = (path, _file_mtime(path))
+        if attempt == _PROFILES_FILE_FAILED:
+            return
+        try:
+            load_profiles_file(path)
+        except (OSError, ValueError) as e:
+            _PROFILES_FILE_FAILED = attempt
+            _PROFILES_FILE_ERROR = f"書式プロファイル（{path}）を読み込めませんでした: {e}"
+            _log.warning(_PROFILES_FILE_ERROR)
+            return
+        _PROFILES_FILE_FAILED = None
+        _PROFILES_FILE_ERROR = ""
+        _PROFILES_FILE_LOADED = True
+
+def profiles_file_error() -> str:
+    """MAIL_PROFILES_PATH の読み込みに失敗していれば理由、無ければ空文字。"""
+    return _PROFILES_FILE_ERROR
+
+def detect_profile(text: str) -> MailProfile:
+    """本文先頭を 1 回だけ走査して書式を決める（試し解析はしない）。"""
+    _ensure_profiles_file_loaded()
+    sig_re, by_group = _DISPATCH
+    if sig_re is None:
+        return DEFAULT_PROFILE
+    t = normalize_text(text)
+    head = "\n".join(t.split("\n", SIGNATURE_HEADER_LINES)[:SIGNATURE_HEADER_LINES])
+    m = sig_re.search(head)
+    if not m:
+        return DEFAULT_PROFILE
+    return by_group.get(m.lastgroup, DEFAULT_PROFILE)
+
 def _strip_url_tail(u: str) -> str:
     return re.sub(r"[)\]＞＞）」】>]+$", "", u.strip())
 
@@ -68,7 +235,12 @@ def first_date_yyyymmdd(*vals) -> str:
     from .settings import JST
     return datetime.now(JST).strftime("%Y%m%d")
 
-def extract_fields(raw_text: str) -> Dict[str, Optional[str]]:
+def extract_fields(raw_text: str, profile: Optional[MailProfile] = None) -> Dict[str, Optional[str]]:
+    if profile is None:
+        profile = detect_profile(raw_text)
+    label_canon = profile.label_canon
+    multiline_keys = profile.multiline_keys
+
     t = normalize_text(raw_text)
     lines = t.split("\n")
 
@@ -81,10 +253,10 @@ def extract_fields(raw_text: str) -> Dict[str, Optional[str]]:
     }
     out: Dict[str, Optional[str]] = {k: None for k in out_keys}
 
-    m_case = re.search(r"^件名:\s*【\s*([^】]+)\s*】", t, flags=re.MULTILINE)
+    m_case = profile.subject_case_re.search(t)
     if m_case:
         out["案件種別(件名)"] = m_case.group(1).strip()
-    m_mane = re.search(r"件名:.*?【[^】]+】\s*([A-Z0-9\-]+)", t, flags=re.IGNORECASE)
+    m_mane = profile.subject_manageno_re.search(t)
     subject_manageno = m_mane.group(1).strip() if m_mane else None
 
     current_multikey: Optional[str] = None
@@ -115,12 +287,12 @@ def extract_fields(raw_text: str) -> Dict[str, Optional[str]]:
 
             raw_label = m.group(1).strip()
             value_part = m.group(2).strip()
-            canon = LABEL_CANON.get(raw_label)
+            canon = label_canon.get(raw_label)
             if canon is None:
                 i += 1
                 continue
 
-            if canon in MULTILINE_KEYS:
+            if canon in multiline_keys:
                 current_multikey = canon
                 buffer = []
                 if value_part:
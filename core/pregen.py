@@ -0,0 +1,287 @@
+# report_maker/core/pregen.py
+# ------------------------------------------------------------
+# inbox の新着行の帳票を先回りで作っておくスケジューラ
+#   ?token= のリンクは inbox に行が入ってすぐ開かれることが多いので、
+#   裏で inbox を定期的に見て、最近の行の .xlsm を作り置きしておく。
+#   - 行の読み取りは token 直行と同じ（_row_to_record → 物件台帳で空欄埋め）。
+#     物件台帳は読むだけで書き込まない
+#   - 作り置きはテンプレートの共有置き場（template_store.share_dir()/pregen）に
+#     report_fingerprint の名前で置く。行の内容・テンプレート・日付のどれかが変われば
+#     fingerprint が変わるので、開いたときは名前が一致するものだけを使えばよい。
+#     置き場は全プロセス共通なので、どのプロセスで開いても作り置きが使える。
+#   - 作り置きを作るのはホスト上で 1 プロセスだけ（ロックファイルを取れたプロセス）。
+#     そのプロセスが終われば、次の周期で他のプロセスが引き継ぐ。
+#   - 生成は一括処理用のプール（lane="bulk"）へ 1 件ずつ、対話用のプールが空いているときだけ
+#     投入する（対話中のユーザーとワーカーを取り合わない）
+#   - 作り置きの件数・ヒット数などは pregen_status()（?debug=1 の表示）で確認できる
+#   設定:
+#     PREGEN_INTERVAL_SEC  … inbox を見に行く間隔（既定 0＝無効。使う場合だけ 60 などを設定する）
+#     PREGEN_RECENT_HOURS  … 受信時刻がこの時間以内の行だけ作る（既定 24）
+#     PREGEN_CACHE_MAX     … 作り置きの上限件数（既定 50、古いものから捨てる）
+# ------------------------------------------------------------
+from __future__ import annotations
+
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows ではロックせず各プロセスで作る
+    fcntl = None
+
+from .excel_writer import report_fingerprint
+from .inbox_loader import iter_inbox_records
+from .job_pool import PoolBusyError, discard_job, pool_idle, submit_job, take_result, wait_job
+from .parsing import try_parse_datetime
+from .property_master import apply_property_master
+from .session_memory import note_external_bytes
+from .settings import JST, get_setting
+from .template_store import fill_shared_template, share_dir
+
+
+def _float_setting(name: str, default: float) -> float:
+    try:
+        return float(get_setting(name, str(default)))
+    except ValueError:
+        return default
+
+
+def interval_seconds() -> float:
+    return max(0.0, _float_setting("PREGEN_INTERVAL_SEC", 0))
+
+
+def recent_hours() -> float:
+    return max(0.0, _float_setting("PREGEN_RECENT_HOURS", 24))
+
+
+def cache_max() -> int:
+    return max(1, int(_float_setting("PREGEN_CACHE_MAX", 50)))
+
+
+def pregen_dir() -> str:
+    path = os.path.join(share_dir(), "pregen")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    return path
+
+
+def _report_path(fp: str) -> str:
+    return os.path.join(pregen_dir(), f"{fp}.xlsm")
+
+
+_LOCK = threading.Lock()
+# 生成に失敗した fingerprint。内容が変わるまで作り直さない（古いものから捨てる）
+_FAILED: "OrderedDict[str, str]" = OrderedDict()
+_STATUS: Dict[str, object] = {"last_poll": None, "built": 0, "hits": 0, "last_error": "", "poller": False}
+_THREAD: Optional[threading.Thread] = None
+# 作り置き担当のロック（取れたらプロセスが終わるまで持ち続ける）
+_LEADER_FD: Optional[int] = None
+
+
+# =======================
+# 作り置きの参照
+# =======================
+def take_pregenerated(fp: str) -> Optional[bytes]:
+    """
+    今の内容から計算した fingerprint の作り置きがあれば返す。
+    無い（行が変わった・日付が変わった・テンプレートが違う・まだ作っていない）場合は None。
+    """
+    try:
+        with open(_report_path(fp), "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    with _LOCK:
+        _STATUS["hits"] += 1
+    return data
+
+
+def _store(fp: str, data: bytes):
+    path = _report_path(fp)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    _prune()
+
+
+def _prune():
+    """作り置きを新しい順に PREGEN_CACHE_MAX 件まで残し、合計サイズをメモリ予算に知らせる。"""
+    directory = pregen_dir()
+    entries = []
+    for name in os.listdir(directory):
+        if not name.endswith(".xlsm") or name.startswith(".tmp_"):
+            continue
+        try:
+            st = os.stat(os.path.join(directory, name))
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, name))
+    entries.sort(reverse=True)
+    total = 0
+    for i, (_, size, name) in enumerate(entries):
+        if i < cache_max():
+            total += size
+            continue
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+    # 置き場は /dev/shm（メモリ）なので、セッションのメモリ予算にも含める
+    note_external_bytes("pregen", total)
+
+
+def pregen_status() -> Dict[str, object]:
+    try:
+        cached = sum(1 for n in os.listdir(pregen_dir()) if n.endswith(".xlsm") and not n.startswith(".tmp_"))
+    except (OSError, RuntimeError):
+        cached = 0
+    with _LOCK:
+        return dict(_STATUS, cached=cached)
+
+
+# =======================
+# スケジューラ本体
+# =======================
+def _candidates(digest: str, now: datetime) -> List[tuple]:
+    """作り置きが無い最近の行を (fp, rec) で新しい順に返す。"""
+    since = now - timedelta(hours=recent_hours())
+    recent = []
+    for rec in iter_inbox_records():
+        token = (rec.get("token") or "").strip()
+        received = try_parse_datetime(rec.get("受信時刻"))
+        if not token or received is None or received < since:
+            continue
+        recent.append((received, {k: v for k, v in rec.items() if k != "token"}))
+    out = []
+    for received, rec in recent:
+        try:
+            apply_property_master(rec)
+        except Exception:
+            pass
+        fp = report_fingerprint(digest, rec)
+        with _LOCK:
+            failed = fp in _FAILED
+        if failed or os.path.exists(_report_path(fp)):
+            continue
+        out.append((received, fp, rec))
+    out.sort(key=lambda x: x[0], reverse=True)
+    return [(fp, rec) for _, fp, rec in out]
+
+
+def _take_result_quietly(job_id: str):
+    try:
+        take_result(job_id)
+    except Exception:
+        pass
+
+
+def _note_failed(fp: str, error: str):
+    with _LOCK:
+        _FAILED[fp] = error
+        _FAILED.move_to_end(fp)
+        while len(_FAILED) > cache_max():
+            _FAILED.popitem(last=False)
+        _STATUS["last_error"] = error
+
+
+def _build_one(digest: str, fp: str, rec: Dict[str, str], stop: threading.Event) -> bool:
+    """1 件作り置きする。対話用のプールが使われている・一括用のプールが一杯なら何もせず False。"""
+    if not pool_idle():
+        return False
+    try:
+        job_id = submit_job(fill_shared_template, digest, rec, lane="bulk")
+    except PoolBusyError:
+        return False
+    while True:
+        st = wait_job(job_id, 1.0)
+        if st["state"] == "done":
+            _store(fp, take_result(job_id))
+            with _LOCK:
+                _STATUS["built"] += 1
+            return True
+        if st["state"] in ("error", "missing"):
+            _take_result_quietly(job_id)
+            _note_failed(fp, str(st.get("error", "")))
+            return True
+        if stop.is_set():
+            discard_job(job_id)
+            return False
+
+
+def _acquire_leadership() -> bool:
+    """作り置き担当のロックを取る（既に持っていれば True）。"""
+    global _LEADER_FD
+    if _LEADER_FD is not None:
+        return True
+    if fcntl is None:
+        return True
+    fd = os.open(os.path.join(share_dir(), "pregen.lock"), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+    _LEADER_FD = fd
+    return True
+
+
+def poll_once(template_digest: Callable[[], Optional[str]], stop: Optional[threading.Event] = None) -> int:
+    """inbox を 1 回見て、プールが空いている間だけ作り置きする。作った件数を返す。"""
+    stop = stop or threading.Event()
+    digest = template_digest()
+    with _LOCK:
+        _STATUS["last_poll"] = datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S")
+    if not digest:
+        return 0
+    built = 0
+    for fp, rec in _candidates(digest, datetime.now(JST)):
+        if stop.is_set() or not _build_one(digest, fp, rec, stop):
+            break
+        built += 1
+    return built
+
+
+def _loop(template_digest: Callable[[], Optional[str]], stop: threading.Event):
+    while not stop.is_set():
+        try:
+            if _acquire_leadership():
+                with _LOCK:
+                    _STATUS["poller"] = True
+                poll_once(template_digest, stop)
+        except Exception as e:
+            # inbox が一時的に読めない等。次の周期でやり直す
+            with _LOCK:
+                _STATUS["last_error"] = f"{type(e).__name__}: {e}"
+        stop.wait(interval_seconds())
+
+
+def start_pregen_scheduler(template_digest: Callable[[], Optional[str]]) -> bool:
+    """
+    スケジューラをプロセスに 1 本だけ起動する（2 回目以降は何もしない）。
+    実際に inbox を見て作り置きするのは、ロックを取れた 1 プロセスだけ。
+    template_digest は既定テンプレートの digest を返す関数（スケジューラのスレッドから呼ばれる）。
+    PREGEN_INTERVAL_SEC が未設定・0 なら起動しない。
+    """
+    global _THREAD
+    if interval_seconds() <= 0:
+        return False
+    with _LOCK:
+        if _THREAD is not None and _THREAD.is_alive():
+            return True
+        _THREAD = threading.Thread(
+            target=_loop, args=(template_digest, threading.Event()),
+            name="inbox_pregen", daemon=True,
+        )
+        _THREAD.start()
+    return True
@@ -0,0 +1,202 @@
+# report_maker/core/preview.py
+# ------------------------------------------------------------
+# 帳票の HTML プレビュー（ブックを作らずに確認する）
+#   テンプレートの SHEET_NAME シートから、印刷範囲のセル配置（列幅・行高・結合セル・
+#   罫線・文字の大きさと寄せ・テンプレートの値）をテンプレートごとに 1 回だけ取り出しておき
+#   （layout_snapshot）、生成時と同じ書き込み値（excel_writer.report_cell_values：
+#   複数行欄の「…」切り詰めや日時ブロックを含む）を重ねて HTML の表にする。
+#   openpyxl の読み込み・保存をしないので、項目の編集ごとに数ミリ秒で描き直せる。
+#   - 書き込まれるセルは薄い黄色で示す（空の項目はテンプレートの値が残る点も生成結果と同じ）
+#   - 数式のセル（窓口会社などの VLOOKUP）は Excel で開くまで計算されないので「（式）」と表示
+# ------------------------------------------------------------
+from __future__ import annotations
+
+import html
+from datetime import date, datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from openpyxl.utils import get_column_letter, range_boundaries
+
+from .excel_writer import report_cell_values
+from .settings import JST, SHEET_NAME
+from .template_store import load_shared_workbook
+
+_FORMULA_TEXT = "（式）"
+_BORDER_WIDTH = {"thin": 1, "hair": 1, "dotted": 1, "dashed": 1, "medium": 2, "double": 3, "thick": 3}
+
+
+def _col_px(width: Optional[float]) -> int:
+    # Excel の列幅（標準フォントの文字数）→ 画面のピクセル（おおよそ）
+    return int(round((width or 0) * 7 + 5))
+
+
+def _row_px(height: Optional[float]) -> int:
+    return int(round((height or 0) * 96 / 72))
+
+
+def _cell_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, datetime):
+        return value.strftime("%Y/%m/%d %H:%M")
+    if isinstance(value, date):
+        return value.strftime("%Y/%m/%d")
+    return str(value)
+
+
+def _border_css(side, edge: str) -> str:
+    style = getattr(side, "style", None)
+    if not style:
+        return ""
+    color = getattr(side.color, "rgb", None) if side.color is not None else None
+    color = f"#{color[-6:]}" if isinstance(color, str) and len(color) >= 6 else "#000"
+    kind = {"double": "double", "dotted": "dotted", "dashed": "dashed"}.get(style, "solid")
+    return f"border-{edge}:{_BORDER_WIDTH.get(style, 1)}px {kind} {color};"
+
+
+def _print_bounds(ws) -> Tuple[int, int, int, int]:
+    """(min_col, min_row, max_col, max_row)。印刷範囲があればそれ、無ければ使用範囲。"""
+    area = ws.print_area
+    if isinstance(area, (list, tuple)):
+        area = area[0] if area else None
+    if area:
+        try:
+            return range_boundaries(str(area).split("!")[-1].replace("$", ""))
+        except ValueError:
+            pass
+    return 1, 1, ws.max_column, ws.max_row
+
+
+def _extract_snapshot(ws) -> Dict[str, object]:
+    min_col, min_row, max_col, max_row = _print_bounds(ws)
+    fmt = ws.sheet_format
+    default_width = fmt.defaultColWidth or ((fmt.baseColWidth or 8) + 0.71)
+    default_height = fmt.defaultRowHeight or 15
+
+    widths: Dict[int, float] = {}
+    hidden_cols = set()
+    for dim in ws.column_dimensions.values():
+        lo, hi = dim.min or 0, dim.max or 0
+        for c in range(lo, hi + 1):
+            if dim.width:
+                widths[c] = dim.width
+            if dim.hidden:
+                hidden_cols.add(c)
+    cols = [c for c in range(min_col, max_col + 1) if c not in hidden_cols]
+
+    rows = []
+    for r in range(min_row, max_row + 1):
+        dim = ws.row_dimensions.get(r)
+        if dim is not None and dim.hidden:
+            continue
+        rows.append((r, _row_px(dim.height if dim is not None and dim.height else default_height)))
+
+    # 結合セル：左上のセル → (行数, 列数)、それ以外の覆われるセルは描かない
+    spans: Dict[Tuple[int, int], Tuple[int, int]] = {}
+    covered = set()
+    for rng in ws.merged_cells.ranges:
+        spans[(rng.min_row, rng.min_col)] = (rng.max_row, rng.max_col)
+        for r in range(rng.min_row, rng.max_row + 1):
+            for c in range(rng.min_col, rng.max_col + 1):
+                if (r, c) != (rng.min_row, rng.min_col):
+                    covered.add((r, c))
+
+    visible_rows = {r for r, _ in rows}
+    visible_cols = set(cols)
+    grid: List[List[Tuple[str, int, int, str, str, bool]]] = []
+    for r, _ in rows:
+        line = []
+        for c in cols:
+            if (r, c) in covered:
+                continue
+            end_r, end_c = spans.get((r, c), (r, c))
+            rowspan = sum(1 for x in range(r, end_r + 1) if x in visible_rows)
+            colspan = sum(1 for x in range(c, end_c + 1) if x in visible_cols)
+            cell = ws.cell(row=r, column=c)
+            # 結合セルの外周は、それぞれの辺にあるセルの罫線を使う
+            css = (
+                _border_css(cell.border.top, "top")
+                + _border_css(cell.border.left, "left")
+                + _border_css(ws.cell(row=r, column=end_c).border.right, "right")
+                + _border_css(ws.cell(row=end_r, column=c).border.bottom, "bottom")
+            )
+            font = cell.font
+            if font is not None:
+                if font.b:
+                    css += "font-weight:bold;"
+                if font.sz and float(font.sz) != 11:
+                    css += f"font-size:{float(font.sz):g}pt;"
+            align = cell.alignment
+            if align is not None and align.horizontal in ("center", "centerContinuous", "right", "left"):
+                css += "text-align:{};".format("center" if align.horizontal == "centerContinuous" else align.horizontal)
+            if cell.fill is not None and cell.fill.fill_type == "solid":
+                rgb = getattr(cell.fill.fgColor, "rgb", None)
+                if isinstance(rgb, str) and len(rgb) >= 6 and rgb[-6:].upper() != "FFFFFF":
+                    css += f"background:#{rgb[-6:]};"
+            value = cell.value
+            is_formula = isinstance(value, str) and value.startswith("=")
+            text = _FORMULA_TEXT if is_formula else _cell_text(value)
+            line.append((f"{get_column_letter(c)}{r}", rowspan, colspan, css, text, is_formula))
+        grid.append(line)
+
+    return {
+        "cols": [_col_px(widths.get(c, default_width)) for c in cols],
+        "rows": [h for _, h in rows],
+        "grid": grid,
+    }
+
+
+@lru_cache(maxsize=8)
+def layout_snapshot(digest: str) -> Dict[str, object]:
+    """
+    共有テンプレート（digest）の SHEET_NAME シートのセル配置を取り出す。
+    テンプレートごとに 1 回だけ解析し、以後はプロセス内で使い回す。
+    """
+    wb = load_shared_workbook(digest)
+    ws = wb[SHEET_NAME] if SHEET_NAME in wb.sheetnames else wb.active
+    return _extract_snapshot(ws)
+
+
+_STYLE = (
+    "<style>"
+    ".rp-wrap{overflow-x:auto;background:#fff;padding:8px;}"
+    ".rp{border-collapse:collapse;table-layout:fixed;font-family:'MS PGothic','Hiragino Sans',sans-serif;"
+    "font-size:11pt;color:#000;}"
+    ".rp td{padding:0 2px;white-space:nowrap;overflow:visible;vertical-align:middle;border:0;}"
+    ".rp td.ov{background:#fff4c2;}"
+    ".rp td.fx{color:#999;font-style:italic;}"
+    "</style>"
+)
+
+
+def render_preview_html(digest: str, data: Dict[str, Optional[str]], now: Optional[datetime] = None) -> str:
+    """生成時と同じ値を重ねた帳票の HTML（st.markdown(unsafe_allow_html=True) で表示する）"""
+    snap = layout_snapshot(digest)
+    values = report_cell_values(data, now or datetime.now(JST))
+    parts = [_STYLE, '<div class="rp-wrap"><table class="rp"><colgroup>']
+    parts.extend(f'<col style="width:{w}px">' for w in snap["cols"])
+    parts.append("</colgroup>")
+    for height, line in zip(snap["rows"], snap["grid"]):
+        parts.append(f'<tr style="height:{height}px">')
+        for coord, rowspan, colspan, css, text, is_formula in line:
+            attrs = ""
+            if rowspan > 1:
+                attrs += f' rowspan="{rowspan}"'
+            if colspan > 1:
+                attrs += f' colspan="{colspan}"'
+            cls = ""
+            if coord in values:
+                text, cls = _cell_text(values[coord]), "ov"
+            elif is_formula:
+                cls = "fx"
+            if cls:
+                attrs += f' class="{cls}"'
+            if css:
+                attrs += f' style="{css}"'
+            parts.append(f"<td{attrs}>{html.escape(text)}</td>")
+        parts.append("</tr>")
+    parts.append("</table></div>")
+    return "".join(parts)
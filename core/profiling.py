@@ -0,0 +1,383 @@
+# report_maker/core/profiling.py
+# ------------------------------------------------------------
+# 遅いリクエストのプロファイル採取
+#   - profile_rerun() で rerun 全体を、stage() で段階（token 読込・生成など）を囲む。
+#     段階ごとの所要時間は常に記録し、採取時に一緒に保存する。
+#   - 採取を指示された範囲（scope: "rerun" / "token" / "generate" など stage 名）は
+#       cprofile : cProfile（決定的）＋サンプリング
+#       sample   : サンプリングのみ（オーバーヘッド小）
+#     で計測し、PROFILE_DIR（既定はアプリのルートの profiles/）に保存する。
+#       <時刻>_<ラベル>_<ms>ms.pstats    … python -m pstats / snakeviz 等で開く
+#       <時刻>_<ラベル>_<ms>ms.collapsed … flamegraph.pl / speedscope で開く（折り畳みスタック形式）
+#       <時刻>_<ラベル>_<ms>ms.json      … 段階ごとの所要時間・採取条件
+#   - PROFILE_SLOW_MS（既定 5000、0 で無効）を超えた rerun は、指示が無くても
+#     段階ごとの所要時間を自動で保存する。PROFILE_SLOW_SAMPLE_MS（既定 0＝しない）を
+#     設定したときだけ、その間隔のサンプリング結果も一緒に保存する（rerun ごとに回すので既定では止めておく）。
+#   - サンプリングは採取中のスレッドに加えて、propagate_capture() で包んだ関数を
+#     実行する別スレッド（inbox の取得スレッド等）も数える。cProfile は採取を始めたスレッドだけ。
+#   - プロセスプールで動く生成は run_profiled() で包んでワーカー側で採取する。
+# ------------------------------------------------------------
+from __future__ import annotations
+
+import cProfile
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Mapping, Optional, Tuple
+
+from .settings import JST, get_setting
+
+ENGINES = ("cprofile", "sample")
+
+_APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _float_setting(name: str, default: float) -> float:
+    try:
+        return float(get_setting(name, str(default)))
+    except ValueError:
+        return default
+
+
+def profile_dir() -> str:
+    """
+    保存先。相対パスはアプリのルート（app.py のあるディレクトリ）を基準にする
+    （起動時のカレントディレクトリや生成ワーカーによって保存先が変わらないように）。
+    """
+    path = get_setting("PROFILE_DIR", "profiles")
+    return path if os.path.isabs(path) else os.path.join(_APP_ROOT, path)
+
+
+def slow_ms() -> float:
+    return max(0.0, _float_setting("PROFILE_SLOW_MS", 5000))
+
+
+def sample_interval() -> float:
+    return max(1.0, _float_setting("PROFILE_SAMPLE_MS", 5)) / 1000.0
+
+
+def slow_sample_interval() -> float:
+    """遅い rerun 用の常時サンプリングの間隔（秒）。0 ならサンプリングしない。"""
+    ms = _float_setting("PROFILE_SLOW_SAMPLE_MS", 0)
+    return max(1.0, ms) / 1000.0 if ms > 0 else 0.0
+
+
+def keep_count() -> int:
+    return max(1, int(_float_setting("PROFILE_KEEP", 100)))
+
+
+def requested_capture(query: Optional[Mapping[str, str]] = None) -> Tuple[Optional[str], str]:
+    """
+    採取の指示を (scope, engine) で返す。指示が無ければ (None, "cprofile")。
+      環境変数  PROFILE_CAPTURE=rerun / token:sample / generate:cprofile など
+      クエリ    ?profile=rerun&engine=sample&admin=<PROFILE_ADMIN_KEY>
+                （PROFILE_ADMIN_KEY が設定されていて一致する場合のみ）
+    """
+    raw = get_setting("PROFILE_CAPTURE", "")
+    if not raw and query:
+        admin_key = get_setting("PROFILE_ADMIN_KEY", "")
+        if admin_key and query.get("admin") == admin_key and query.get("profile"):
+            raw = f"{query.get('profile')}:{query.get('engine') or 'cprofile'}"
+    if not raw:
+        return None, "cprofile"
+    scope, _, engine = raw.partition(":")
+    engine = engine if engine in ENGINES else "cprofile"
+    return (scope.strip() or "rerun"), engine
+
+
+# =======================
+# サンプリング
+# =======================
+class _Sampler:
+    """登録された採取ごとに、対象スレッドのスタックを採取ごとの間隔で数える（プロセスに 1 本）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # key -> [対象スレッド, 数えた結果, 間隔, 次に数える時刻]
+        self._targets: Dict[int, list] = {}
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, key: int, thread_id: int, interval: float) -> Counter:
+        counts: Counter = Counter()
+        with self._lock:
+            self._targets[key] = [{thread_id}, counts, interval, time.perf_counter() + interval]
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="profile_sampler", daemon=True)
+                self._thread.start()
+        return counts
+
+    def unregister(self, key: int):
+        with self._lock:
+            self._targets.pop(key, None)
+
+    def add_thread(self, key: int, thread_id: int):
+        with self._lock:
+            target = self._targets.get(key)
+            if target is not None:
+                target[0].add(thread_id)
+
+    def remove_thread(self, key: int, thread_id: int):
+        with self._lock:
+            target = self._targets.get(key)
+            if target is not None:
+                target[0].discard(thread_id)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._targets:
+                    self._thread = None
+                    return
+                wake = min(t[3] for t in self._targets.values())
+            time.sleep(max(0.0, wake - time.perf_counter()))
+            now = time.perf_counter()
+            with self._lock:
+                due = []
+                for target in self._targets.values():
+                    if target[3] <= now:
+                        target[3] = now + target[2]
+                        due.append((list(target[0]), target[1]))
+            if not due:
+                continue
+            frames = sys._current_frames()
+            for tids, counts in due:
+                for tid in tids:
+                    frame = frames.get(tid)
+                    if frame is not None:
+                        counts[_collapse(frame)] += 1
+
+
+def _collapse(frame) -> str:
+    parts = []
+    while frame is not None:
+        co = frame.f_code
+        parts.append(f"{co.co_name} ({os.path.basename(co.co_filename)}:{co.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+_SAMPLER = _Sampler()
+# cProfile はプロセス内で同時に 1 つしか有効にできない版があるので、使う側を 1 つに絞る
+_CPROFILE_LOCK = threading.Lock()
+
+
+class _Capture:
+    def __init__(self, engine: str, interval: Optional[float] = None):
+        self.engine = engine
+        self.interval = interval or sample_interval()
+        self.profiler: Optional[cProfile.Profile] = None
+        self.samples: Counter = Counter()
+        self._key = id(self)
+        self._token = None
+
+    def start(self):
+        if self.engine == "cprofile" and _CPROFILE_LOCK.acquire(blocking=False):
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.samples = _SAMPLER.register(self._key, threading.get_ident(), self.interval)
+        self._token = _ACTIVE.set(_ACTIVE.get() + (self,))
+
+    def stop(self):
+        _ACTIVE.reset(self._token)
+        _SAMPLER.unregister(self._key)
+        if self.profiler is not None:
+            self.profiler.disable()
+            _CPROFILE_LOCK.release()
+
+
+# 今のコンテキストで採取中の _Capture（stage の採取は rerun の採取の内側で重なることがある）
+_ACTIVE: ContextVar[Tuple[_Capture, ...]] = ContextVar("profile_captures", default=())
+
+
+def propagate_capture(fn):
+    """
+    採取中なら、fn を別スレッドで実行している間そのスレッドもサンプリング対象にする関数を返す。
+    スレッドプールへ渡す前（採取中のスレッド側）で包むこと。採取していなければ fn をそのまま返す。
+    """
+    caps = _ACTIVE.get()
+    if not caps:
+        return fn
+
+    def run(*args, **kwargs):
+        tid = threading.get_ident()
+        for cap in caps:
+            _SAMPLER.add_thread(cap._key, tid)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            for cap in caps:
+                _SAMPLER.remove_thread(cap._key, tid)
+
+    return run
+
+
+# =======================
+# 保存
+# =======================
+def _safe(label: str) -> str:
+    return re.sub(r"[^0-9A-Za-z_.-]+", "_", label)[:60] or "run"
+
+
+def _prune(directory: str):
+    try:
+        names = [n for n in os.listdir(directory) if n.endswith(".json")]
+    except OSError:
+        return
+    names.sort()
+    for name in names[:-keep_count()]:
+        base = os.path.join(directory, name[:-len(".json")])
+        for ext in (".json", ".pstats", ".collapsed"):
+            try:
+                os.remove(base + ext)
+            except OSError:
+                pass
+
+
+def _save(label: str, trigger: str, elapsed_ms: float, stages: List[Dict[str, object]],
+          cap: Optional[_Capture], extra: Optional[Dict[str, object]] = None) -> str:
+    directory = profile_dir()
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now(JST).strftime("%Y%m%d-%H%M%S-%f")
+    base = os.path.join(directory, f"{stamp}_{_safe(label)}_{int(elapsed_ms)}ms")
+    files = []
+    if cap is not None and cap.profiler is not None:
+        cap.profiler.dump_stats(base + ".pstats")
+        files.append(base + ".pstats")
+    if cap is not None and cap.samples:
+        with open(base + ".collapsed", "w", encoding="utf-8") as f:
+            for stack, n in cap.samples.most_common():
+                f.write(f"{stack} {n}\n")
+        files.append(base + ".collapsed")
+    meta = {
+        "label": label,
+        "trigger": trigger,
+        "elapsed_ms": round(elapsed_ms, 1),
+        "engine": cap.engine if cap is not None else None,
+        "samples": sum(cap.samples.values()) if cap is not None else 0,
+        "sample_interval_ms": round(cap.interval * 1000, 1) if cap is not None else None,
+        "stages": stages,
+        "files": [os.path.basename(p) for p in files],
+        "pid": os.getpid(),
+    }
+    meta.update(extra or {})
+    with open(base + ".json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=1)
+    _prune(directory)
+    return base
+
+
+# =======================
+# 計測の入口
+# =======================
+class _Run:
+    def __init__(self, label: str, scope: Optional[str], engine: str, extra: Dict[str, object]):
+        self.label = label
+        self.scope = scope
+        self.engine = engine
+        self.extra = extra
+        self.t0 = time.perf_counter()
+        self.stages: List[Dict[str, object]] = []
+        self.last_saved: Optional[str] = None
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.t0) * 1000
+
+
+_CURRENT: ContextVar[Optional[_Run]] = ContextVar("profile_run", default=None)
+
+
+@contextmanager
+def profile_rerun(label: str, scope: Optional[str] = None, engine: str = "cprofile", **extra):
+    """
+    rerun 全体を囲む。scope == "rerun" なら rerun 全体を採取して保存する。
+    それ以外でも PROFILE_SLOW_MS を超えたら段階ごとの所要時間を保存する
+    （PROFILE_SLOW_SAMPLE_MS を設定していればサンプリング結果も）。
+    st.rerun() / st.stop() の例外（BaseException）が抜けても計測は閉じる。
+    """
+    run = _Run(label, scope, engine, extra)
+    token = _CURRENT.set(run)
+    threshold = slow_ms()
+    cap = None
+    if scope == "rerun":
+        cap = _Capture(engine)
+    elif threshold > 0 and slow_sample_interval() > 0:
+        cap = _Capture("sample", slow_sample_interval())
+    if cap is not None:
+        cap.start()
+    try:
+        yield run
+    finally:
+        if cap is not None:
+            cap.stop()
+        _CURRENT.reset(token)
+        elapsed = run.elapsed_ms()
+        try:
+            if scope == "rerun":
+                run.last_saved = _save(label, "requested", elapsed, run.stages, cap, extra)
+            elif threshold > 0 and elapsed >= threshold:
+                run.last_saved = _save(label, f"slow>={int(threshold)}ms", elapsed, run.stages, cap, extra)
+        except OSError:
+            # 保存できなくても本処理は止めない
+            pass
+
+
+@contextmanager
+def stage(name: str):
+    """段階の所要時間を記録する。採取範囲が name なら、この段階だけを採取して保存する。"""
+    run = _CURRENT.get()
+    if run is None:
+        yield
+        return
+    cap = _Capture(run.engine) if run.scope == name else None
+    if cap is not None:
+        cap.start()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        if cap is not None:
+            cap.stop()
+        entry = {"stage": name, "start_ms": round((start - run.t0) * 1000, 1),
+                 "ms": round((end - start) * 1000, 1)}
+        run.stages.append(entry)
+        if cap is not None:
+            try:
+                run.last_saved = _save(f"{run.label}-{name}", "requested", entry["ms"], [entry], cap, run.extra)
+            except OSError:
+                pass
+
+
+def run_profiled(label: str, engine: str, fn, *args):
+    """
+    プロセスプールのワーカー側で fn(*args) を採取付きで実行する（モジュール直下の関数なので pickle できる）。
+    結果はそのまま返し、プロファイルはワーカーから PROFILE_DIR に保存する。
+    """
+    cap = _Capture(engine)
+    cap.start()
+    t0 = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        cap.stop()
+        ms = (time.perf_counter() - t0) * 1000
+        try:
+            _save(f"{label}-worker", "requested", ms,
+                  [{"stage": getattr(fn, "__name__", "job"), "start_ms": 0.0, "ms": round(ms, 1)}], cap)
+        except OSError:
+            pass
+
+
+def wrap_job(label: str, fn, args: tuple) -> Tuple[object, tuple]:
+    """採取範囲が "generate" のときだけ、プールへ投げるジョブを run_profiled で包む。"""
+    run = _CURRENT.get()
+    if run is None or run.scope != "generate":
+        return fn, args
+    return run_profiled, (label, run.engine, fn) + tuple(args)
@@ -0,0 +1,218 @@
+# report_maker/core/property_master.py
+# ------------------------------------------------------------
+# 物件台帳（管理番号 → 物件名・住所・窓口会社・メーカー・制御方式・契約種別）
+#   - inbox の行や過去の抽出結果から作る。受信時刻が新しい方の非空値で上書きし、
+#     空欄では消さない（増分更新。変わらない行は書き込まない）
+#   - 参照はプロセス内 LRU（(台帳ファイル, 管理番号) ごと）→ SQLite（local_store）の順。
+#     ネットワークには出ない。他の接続（別のサーバプロセス・tools/import_reports.py）が書き込むと
+#     PRAGMA data_version が変わるので、そのときは LRU を捨てて読み直す。確認は台帳ファイルごとに
+#     PROPERTY_SYNC_SEC（既定 2 秒）に 1 回まで（pregen のように続けて引く場合に毎回問い合わせない）
+#   - 台帳への反映は「inbox から索引を更新」・生成した案件・報告書の取り込みのとき
+#     （作り置きスケジューラ（pregen）は参照するだけで書き込まない）
+#   - apply_property_master() で抽出結果の空欄を埋め、食い違いを返す
+# ------------------------------------------------------------
+from __future__ import annotations
+
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .local_store import LOCK as _DB_LOCK, connect, store_path
+from .parsing import try_parse_datetime
+from .settings import get_setting
+
+PROPERTY_KEYS = ["物件名", "住所", "窓口会社", "メーカー", "制御方式", "契約種別"]
+
+_COLS = ["name", "address", "contact", "maker", "control", "contract"]
+_KEY_TO_COL = dict(zip(PROPERTY_KEYS, _COLS))
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS properties (
+    manageno    TEXT PRIMARY KEY,
+    {", ".join(f"{c} TEXT NOT NULL DEFAULT ''" for c in _COLS)},
+    seen_at     TEXT NOT NULL DEFAULT '',
+    updated_at  REAL NOT NULL
+);
+"""
+
+_MISSING = object()
+
+
+class _LRU:
+    """(台帳ファイル, 管理番号) → 台帳行（無い場合は None もキャッシュする）"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data: "OrderedDict[Tuple[str, str], Optional[Dict[str, str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]):
+        with self._lock:
+            if key not in self._data:
+                return _MISSING
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key: Tuple[str, str], value: Optional[Dict[str, str]]):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def _cache_size() -> int:
+    try:
+        return max(16, int(get_setting("PROPERTY_CACHE_SIZE", "4096")))
+    except ValueError:
+        return 4096
+
+
+def _sync_interval() -> float:
+    try:
+        return max(0.0, float(get_setting("PROPERTY_SYNC_SEC", "2")))
+    except ValueError:
+        return 2.0
+
+
+_CACHE = _LRU(_cache_size())
+# 台帳ファイル → (最後に見た PRAGMA data_version, 確認した時刻)
+_DATA_VERSION: Dict[str, Tuple[int, float]] = {}
+
+
+def _connect(path: Optional[str] = None) -> sqlite3.Connection:
+    return connect(_SCHEMA, path)
+
+
+def _sync_cache(conn: sqlite3.Connection, key: str):
+    """
+    他の接続が台帳を書き換えていれば LRU（無い、という結果も含む）を捨てる。_DB_LOCK 内で呼ぶ。
+    直前の確認から PROPERTY_SYNC_SEC 経っていなければ問い合わせない。
+    """
+    now = time.monotonic()
+    last = _DATA_VERSION.get(key)
+    if last is not None and now - last[1] < _sync_interval():
+        return
+    version = conn.execute("PRAGMA data_version").fetchone()[0]
+    if last is not None and last[0] != version:
+        _CACHE.clear()
+    _DATA_VERSION[key] = (version, now)
+
+
+def _s(rec: Dict[str, Optional[str]], key: str) -> str:
+    return (rec.get(key) or "").strip()
+
+
+def _seen_at(rec: Dict[str, Optional[str]]) -> str:
+    dt = try_parse_datetime(rec.get("受信時刻"))
+    return dt.strftime("%Y-%m-%d %H:%M") if dt else ""
+
+
+def _row_to_dict(row: sqlite3.Row) -> Dict[str, str]:
+    return {k: row[c] for k, c in _KEY_TO_COL.items()}
+
+
+def update_properties(records: Iterable[Dict[str, Optional[str]]], path: Optional[str] = None) -> int:
+    """
+    レコードから台帳を更新する。受信時刻が台帳より古いレコードは空欄埋めにだけ使う。
+    実際に書き換えた管理番号の数を返す。
+    """
+    # 同じ管理番号は受信時刻の古い順に畳み込んでから DB と突き合わせる
+    latest: Dict[str, Dict[str, str]] = {}
+    for rec in sorted(records, key=_seen_at):
+        manageno = _s(rec, "管理番号")
+        if not manageno:
+            continue
+        cur = latest.setdefault(manageno, {"seen_at": ""})
+        for k in PROPERTY_KEYS:
+            if _s(rec, k):
+                cur[k] = _s(rec, k)
+        cur["seen_at"] = max(cur["seen_at"], _seen_at(rec))
+    if not latest:
+        return 0
+
+    conn = _connect(path)
+    store = path or store_path()
+    changed = 0
+    now = time.time()
+    with _DB_LOCK:
+        existing: Dict[str, sqlite3.Row] = {}
+        keys = list(latest)
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            q = f"SELECT * FROM properties WHERE manageno IN ({','.join('?' * len(chunk))})"
+            existing.update((r["manageno"], r) for r in conn.execute(q, chunk))
+
+        with conn:
+            for manageno, new in latest.items():
+                old = existing.get(manageno)
+                merged = _row_to_dict(old) if old is not None else {k: "" for k in PROPERTY_KEYS}
+                newer = old is None or new["seen_at"] >= old["seen_at"]
+                for k in PROPERTY_KEYS:
+                    v = new.get(k, "")
+                    if v and (newer or not merged[k]):
+                        merged[k] = v
+                seen_at = max(new["seen_at"], old["seen_at"] if old is not None else "")
+                if old is not None and merged == _row_to_dict(old) and seen_at == old["seen_at"]:
+                    continue
+                conn.execute(
+                    f"""
+                    INSERT INTO properties(manageno, {", ".join(_COLS)}, seen_at, updated_at)
+                    VALUES (?, {", ".join("?" * len(_COLS))}, ?, ?)
+                    ON CONFLICT(manageno) DO UPDATE SET
+                        {", ".join(f"{c}=excluded.{c}" for c in _COLS)},
+                        seen_at=excluded.seen_at, updated_at=excluded.updated_at
+                    """,
+                    (manageno, *[merged[k] for k in PROPERTY_KEYS], seen_at, now),
+                )
+                _CACHE.put((store, manageno), merged)
+                changed += 1
+    return changed
+
+
+def lookup_property(manageno: Optional[str], path: Optional[str] = None) -> Optional[Dict[str, str]]:
+    """管理番号の台帳行を返す（無ければ None）。"""
+    manageno = (manageno or "").strip()
+    if not manageno:
+        return None
+    conn = _connect(path)
+    key = (path or store_path(), manageno)
+    with _DB_LOCK:
+        _sync_cache(conn, key[0])
+        hit = _CACHE.get(key)
+        if hit is not _MISSING:
+            return hit
+        row = conn.execute("SELECT * FROM properties WHERE manageno = ?", (manageno,)).fetchone()
+        val = _row_to_dict(row) if row is not None else None
+        _CACHE.put(key, val)
+    return val
+
+
+def apply_property_master(rec: Dict[str, Optional[str]], path: Optional[str] = None) -> List[str]:
+    """
+    rec の空欄を台帳の値で埋め（rec を直接書き換える）、
+    値があって台帳と食い違う項目を「項目: 入力=… / 台帳=…」の形で返す。
+    """
+    try:
+        master = lookup_property(rec.get("管理番号"), path)
+    except sqlite3.Error:
+        return []
+    if not master:
+        return []
+    notes = []
+    for k in PROPERTY_KEYS:
+        mv = master.get(k) or ""
+        if not mv:
+            continue
+        cur = _s(rec, k)
+        if not cur:
+            rec[k] = mv
+        elif cur != mv:
+            notes.append(f"{k}: 入力={cur} / 台帳={mv}")
+    return notes
@@ -0,0 +1,301 @@
+# report_maker/core/report_importer.py
+# ------------------------------------------------------------
+# 過去に生成した 緊急出動報告書（.xlsm）の一括取り込み
+#   excel_writer のセル配置（FIELD_CELLS / DT_BLOCKS / MULTILINE_BLOCKS）を逆にたどって
+#   レコードに戻し、過去案件の索引（incident_index）と物件台帳（property_master）に入れる。
+#   - openpyxl は使わず、zip 内のシート XML を直接 iterparse する。
+#     必要なセルは 37 行目までなので、そこで読むのをやめる（1 ファイル数ミリ秒）。
+#   - 共有文字列も必要な番号に届いた時点で読むのをやめる。
+#   - ファイルの解析はプロセスプールで並列に行い、DB への書き込みは親プロセスだけが
+#     まとめて行う（SQLite の書き込みは 1 本に絞る）。
+#   - テンプレートの見本値がそのまま残っているセル（入力が無かった欄）は空欄として扱う
+#     （案件ごとに変わる欄と日時のみ）。
+# ------------------------------------------------------------
+from __future__ import annotations
+
+import multiprocessing
+import os
+import posixpath
+import re
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from xml.etree.ElementTree import iterparse
+
+from .excel_writer import DT_BLOCKS, DT_COLUMNS, FIELD_CELLS, MULTILINE_BLOCKS
+from .incident_index import index_records
+from .parsing import minutes_between
+from .property_master import update_properties
+from .settings import SHEET_NAME
+from .textutil import sanitize_filename
+
+_NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+# 読むセルと最終行
+_DT_PARTS = ("Y", "Mo", "D", "H", "Min")
+_WANTED = (
+    {cell for _, cell in FIELD_CELLS}
+    | {f"{DT_COLUMNS[p]}{row}" for _, row in DT_BLOCKS for p in _DT_PARTS}
+    | {f"{col}{row + i}" for _, col, row, n in MULTILINE_BLOCKS for i in range(n)}
+)
+_LAST_ROW = max(int(re.sub(r"\D", "", c)) for c in _WANTED)
+
+# テンプレートの見本値と同じなら空欄扱いにする欄（案件ごとに変わるもの）。
+# メーカー・制御方式・所属 は見本と同じ値の実案件が多いので、見本と同じでも残す。
+_CASE_SPECIFIC_KEYS = {"管理番号", "通報者", "対応者", "処理修理後"}
+
+_FILE_PREFIX = "緊急出動報告書_"
+_DAY_SUFFIX = re.compile(r"_(\d{8})$")
+_COPY_SUFFIX = re.compile(r"\s*\(\d+\)$")  # ブラウザが付ける「 (1)」
+
+
+# =======================
+# シート XML の読み取り
+# =======================
+def _sheet_part(zf: zipfile.ZipFile) -> str:
+    """SHEET_NAME のシート（無ければ先頭シート）の zip 内パスを返す。"""
+    rid = None
+    for _, el in iterparse(zf.open("xl/workbook.xml")):
+        if el.tag == f"{_NS_MAIN}sheet":
+            if rid is None or el.get("name") == SHEET_NAME:
+                rid = el.get(f"{_NS_REL}id")
+                if el.get("name") == SHEET_NAME:
+                    break
+    if rid is None:
+        raise ValueError("シートが見つかりません。")
+    for _, el in iterparse(zf.open("xl/_rels/workbook.xml.rels")):
+        if el.tag == f"{_NS_PKG_REL}Relationship" and el.get("Id") == rid:
+            target = el.get("Target") or ""
+            if target.startswith("/"):
+                return target.lstrip("/")
+            return posixpath.normpath(posixpath.join("xl", target))
+    raise ValueError("シートの参照先が見つかりません。")
+
+
+def _text_of(el) -> str:
+    """<si> / <is> の文字列（ふりがな rPh は除く）"""
+    t = el.find(f"{_NS_MAIN}t")
+    if t is not None:
+        return t.text or ""
+    return "".join((r.findtext(f"{_NS_MAIN}t") or "") for r in el.findall(f"{_NS_MAIN}r"))
+
+
+def _shared_strings(zf: zipfile.ZipFile, wanted: Iterable[int]) -> Dict[int, str]:
+    wanted = set(wanted)
+    if not wanted or "xl/sharedStrings.xml" not in zf.NameToInfo:
+        return {}
+    last = max(wanted)
+    out = {}
+    idx = 0
+    for _, el in iterparse(zf.open("xl/sharedStrings.xml")):
+        if el.tag != f"{_NS_MAIN}si":
+            continue
+        if idx in wanted:
+            out[idx] = _text_of(el)
+        el.clear()
+        if idx >= last:
+            break
+        idx += 1
+    return out
+
+
+def _number(s: str):
+    try:
+        f = float(s)
+    except ValueError:
+        return s
+    return int(f) if f.is_integer() else f
+
+
+def read_report_cells(path: str) -> Dict[str, object]:
+    """報告書ファイルから、取り込みに使うセルの値だけを {"C12": 値, ...} で返す。"""
+    raw: Dict[str, Tuple[Optional[str], str]] = {}
+    with zipfile.ZipFile(path) as zf:
+        for _, el in iterparse(zf.open(_sheet_part(zf))):
+            tag = el.tag
+            if tag == f"{_NS_MAIN}c":
+                ref = el.get("r")
+                if ref in _WANTED:
+                    t = el.get("t")
+                    if t == "inlineStr":
+                        is_el = el.find(f"{_NS_MAIN}is")
+                        raw[ref] = ("str", _text_of(is_el) if is_el is not None else "")
+                    else:
+                        v = el.findtext(f"{_NS_MAIN}v")
+                        if v is not None:
+                            raw[ref] = (t, v)
+                el.clear()
+            elif tag == f"{_NS_MAIN}row":
+                if int(el.get("r") or 0) >= _LAST_ROW:
+                    break
+                el.clear()
+
+        shared = _shared_strings(zf, (int(v) for t, v in raw.values() if t == "s"))
+
+    cells: Dict[str, object] = {}
+    for ref, (t, v) in raw.items():
+        if t == "s":
+            cells[ref] = shared.get(int(v), "")
+        elif t in ("str", "e"):
+            cells[ref] = v
+        elif t == "b":
+            cells[ref] = v == "1"
+        else:
+            cells[ref] = _number(v)
+    return cells
+
+
+# =======================
+# セル値 → レコード
+# =======================
+def _int_or_none(v) -> Optional[int]:
+    if isinstance(v, int):
+        return v
+    if isinstance(v, float) and v.is_integer():
+        return int(v)
+    if isinstance(v, str) and re.fullmatch(r"\s*\d{1,4}\s*", v):
+        return int(v)
+    return None
+
+
+def _dt_parts(cells: Dict[str, object], row: int) -> Tuple[Optional[int], ...]:
+    return tuple(_int_or_none(cells.get(f"{DT_COLUMNS[p]}{row}")) for p in _DT_PARTS)
+
+
+def _format_dt(parts: Tuple[Optional[int], ...]) -> str:
+    y, mo, d, hh, mm = parts
+    if y is None or mo is None or d is None:
+        return ""
+    if hh is None or mm is None:
+        return f"{y:04d}/{mo:02d}/{d:02d}"
+    return f"{y:04d}/{mo:02d}/{d:02d} {hh:02d}:{mm:02d}"
+
+
+def _cell_text(v) -> str:
+    if v is None:
+        return ""
+    return str(v).strip()
+
+
+def property_name_from_filename(path: str, manageno: str) -> str:
+    """build_filename の「緊急出動報告書_{管理番号}_{物件名}_{日付}.xlsm」から物件名を戻す。"""
+    stem = _COPY_SUFFIX.sub("", os.path.splitext(os.path.basename(path))[0])
+    stem = _DAY_SUFFIX.sub("", stem)
+    head = f"{_FILE_PREFIX}{sanitize_filename(manageno.replace('/', '_'))}_"
+    if manageno and stem.startswith(head):
+        return stem[len(head):]
+    return ""
+
+
+def cells_to_record(cells: Dict[str, object], template_cells: Optional[Dict[str, object]] = None,
+                    path: str = "") -> Dict[str, str]:
+    """
+    セル値を fill_template_xlsx の入力と同じ形のレコードに戻す。
+    案件ごとに変わる欄・日時が template_cells と同じ値のまま（入力が無くテンプレートの
+    見本が残った）なら空欄にする。
+    """
+    tpl = template_cells or {}
+    rec: Dict[str, str] = {}
+
+    for key, cell in FIELD_CELLS:
+        v = cells.get(cell)
+        leftover = key in _CASE_SPECIFIC_KEYS and cell in tpl and v == tpl[cell]
+        rec[key] = "" if leftover else _cell_text(v)
+
+    for key, row in DT_BLOCKS:
+        parts = _dt_parts(cells, row)
+        rec[key] = "" if tpl and parts == _dt_parts(tpl, row) else _format_dt(parts)
+
+    # 複数行欄は書き込み時に毎回クリアされるので、見本値の判定は要らない
+    for key, col, row, n in MULTILINE_BLOCKS:
+        lines = [_cell_text(cells.get(f"{col}{row + i}")) for i in range(n)]
+        rec[key] = "\n".join(ln for ln in lines if ln)
+
+    rec["物件名"] = property_name_from_filename(path, rec["管理番号"]) if path else ""
+    mins = minutes_between(rec["現着時刻"], rec["完了時刻"])
+    rec["作業時間_分"] = str(mins) if mins is not None and mins >= 0 else ""
+    return rec
+
+
+@lru_cache(maxsize=4)
+def _template_cells(template_path: Optional[str]) -> Dict[str, object]:
+    if not template_path:
+        return {}
+    return read_report_cells(template_path)
+
+
+def parse_report_file(path: str, template_path: Optional[str] = None) -> Tuple[str, Optional[Dict[str, str]], str]:
+    """
+    1 ファイルを読んで (path, レコード or None, エラー文) を返す。プロセスプールから呼ぶ想定。
+    例外は投げずにエラー文で返す（1 ファイルの破損で全体を止めない）。
+    壊れ方によって zlib.error・EOFError・NotImplementedError 等も出るので、種類は絞らない。
+    """
+    try:
+        rec = cells_to_record(read_report_cells(path), _template_cells(template_path), path)
+    except Exception as e:
+        return path, None, f"{type(e).__name__}: {e}"
+    if not any(rec.get(k) for k in ("管理番号", "受信時刻", "受信内容")):
+        return path, None, "報告書の入力欄が空です。"
+    return path, rec, ""
+
+
+# =======================
+# 一括取り込み
+# =======================
+def find_report_files(root: str) -> Iterator[str]:
+    """root 以下の .xlsm / .xlsx を列挙する（Excel の一時ファイル ~$ は除く）"""
+    if os.path.isfile(root):
+        yield root
+        return
+    for dirpath, _, files in os.walk(root):
+        for name in sorted(files):
+            if name.startswith("~$") or not name.lower().endswith((".xlsm", ".xlsx")):
+                continue
+            yield os.path.join(dirpath, name)
+
+
+def import_reports(paths: Iterable[str], *, template_path: Optional[str] = None,
+                   workers: Optional[int] = None, chunksize: int = 32, batch_size: int = 500,
+                   store: Optional[str] = None,
+                   on_progress: Optional[Callable[[Dict[str, object]], None]] = None) -> Dict[str, object]:
+    """
+    paths の報告書を並列に読み、batch_size 件ごとに索引と物件台帳へ書き込む。
+    戻り値: {"files", "imported", "indexed", "skipped", "errors": [(path, 理由)], "seconds"}
+    """
+    stats: Dict[str, object] = {"files": 0, "imported": 0, "indexed": 0, "skipped": 0,
+                                "errors": [], "seconds": 0.0}
+    started = time.time()
+    batch: List[Dict[str, str]] = []
+
+    def flush():
+        if batch:
+            stats["indexed"] += index_records(batch, path=store)
+            update_properties(batch, path=store)
+            batch.clear()
+        stats["seconds"] = time.time() - started
+        if on_progress is not None:
+            on_progress(stats)
+
+    parse = partial(parse_report_file, template_path=template_path)
+    workers = workers or os.cpu_count() or 1
+    try:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=multiprocessing.get_context("spawn")) as ex:
+            for path, rec, err in ex.map(parse, paths, chunksize=chunksize):
+                stats["files"] += 1
+                if rec is None:
+                    stats["skipped"] += 1
+                    stats["errors"].append((path, err))
+                else:
+                    stats["imported"] += 1
+                    batch.append(rec)
+                if len(batch) >= batch_size:
+                    flush()
+    finally:
+        # ワーカーの異常終了等で中断しても、読めた分は書き込んでおく
+        flush()
+    return stats
@@ -0,0 +1,238 @@
+# report_maker/core/session_memory.py
+# ------------------------------------------------------------
+# セッション単位のメモリ概算とアイドルセッションの退避
+#   - 生成済みブックなどの「重いデータ」は session_state ではなく
+#     ここのレジストリ（プロセス共有・セッションID単位）に置く。
+#     （テンプレートはセッションに持たず template_store の共有置き場を使う）
+#   - 全セッション合計が予算（SESSION_MEMORY_BUDGET_MB）を超えたら、
+#     一定時間操作の無いセッションから重いデータを捨てる。重いデータは生成済みブック等の
+#     キャッシュだけなので、戻ってきたセッションでは get_heavy() が None を返し、
+#     呼び出し側が作り直す。
+#     まとめ出力・一覧出力の完成品のように作り直す手段の無いもの（ジョブの結果）は
+#     put_heavy(..., evictable=False) で置き、退避の対象にしない（合計には含める。
+#     次の出力で置き換わるか、セッションが忘れられた時点で消える）。
+#   - セッションに属さない重いデータ（作り置きの帳票など）も note_external_bytes() で
+#     合計に含め、予算の判定に使う。
+#   - 各セッションが使っているテンプレートの digest も覚えておき、
+#     template_store が使われなくなったテンプレートの mmap を閉じる判断に使う。
+# ------------------------------------------------------------
+from __future__ import annotations
+
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+from .settings import get_setting
+
+_LOCK = threading.RLock()
+_SESSIONS: Dict[str, "_SessionEntry"] = {}
+# セッションに属さない重いデータ（名前 → バイト数）
+_EXTERNAL: Dict[str, int] = {}
+
+_FALLBACK_SESSION_ID = "_bare"
+
+
+def budget_bytes() -> int:
+    try:
+        return int(float(get_setting("SESSION_MEMORY_BUDGET_MB", "512")) * 2**20)
+    except ValueError:
+        return 512 * 2**20
+
+
+def _idle_seconds() -> float:
+    try:
+        return float(get_setting("SESSION_IDLE_EVICT_SEC", "600"))
+    except ValueError:
+        return 600.0
+
+
+def _forget_seconds() -> float:
+    try:
+        return float(get_setting("SESSION_FORGET_SEC", "86400"))
+    except ValueError:
+        return 86400.0
+
+
+def approx_size(obj, _depth: int = 0) -> int:
+    """dict / list / str / bytes を辿ってざっくりバイト数を見積もる。"""
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, memoryview):
+        return obj.nbytes
+    size = sys.getsizeof(obj, 0)
+    if _depth >= 4:
+        return size
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += approx_size(k, _depth + 1) + approx_size(v, _depth + 1)
+    elif isinstance(obj, (list, tuple, set)):
+        for v in obj:
+            size += approx_size(v, _depth + 1)
+    return size
+
+
+class _HeavyItem:
+    __slots__ = ("value", "size", "tag", "evictable")
+
+    def __init__(self, value, tag: Optional[str], evictable: bool = True):
+        self.value = value
+        self.size = approx_size(value)
+        self.tag = tag
+        self.evictable = evictable
+
+
+class _SessionEntry:
+    def __init__(self, sid: str):
+        self.sid = sid
+        self.last_seen = time.time()
+        self.state_bytes = 0
+        self.template_digest: Optional[str] = None
+        self.items: Dict[str, _HeavyItem] = {}
+        self.evictions = 0
+
+    def heavy_bytes(self) -> int:
+        return sum(it.size for it in self.items.values())
+
+    def total_bytes(self) -> int:
+        return self.state_bytes + self.heavy_bytes()
+
+
+def current_session_id() -> str:
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        if ctx is not None:
+            return ctx.session_id
+    except Exception:
+        pass
+    return _FALLBACK_SESSION_ID
+
+
+def _entry(sid: Optional[str] = None) -> _SessionEntry:
+    sid = sid or current_session_id()
+    ent = _SESSIONS.get(sid)
+    if ent is None:
+        ent = _SESSIONS[sid] = _SessionEntry(sid)
+    return ent
+
+
+def touch_session(state=None):
+    """
+    rerun の先頭で呼ぶ。最終アクセス時刻と session_state の概算サイズを更新し、
+    予算超過なら他のアイドルセッションを退避する。
+    """
+    state_bytes = 0
+    digest = None
+    if state is not None:
+        try:
+            state_bytes = sum(approx_size(k) + approx_size(v) for k, v in state.items())
+            digest = state.get("template_digest")
+        except Exception:
+            state_bytes = 0
+    with _LOCK:
+        ent = _entry()
+        ent.last_seen = time.time()
+        ent.state_bytes = state_bytes
+        ent.template_digest = digest
+    enforce_budget()
+
+
+def note_template_digest(digest: Optional[str]):
+    """rerun の途中でテンプレートが変わった場合に、現在のセッションの digest を更新する。"""
+    with _LOCK:
+        _entry().template_digest = digest
+
+
+def live_template_digests() -> Set[str]:
+    """このプロセスのセッションが使っているテンプレートの digest"""
+    with _LOCK:
+        return {e.template_digest for e in _SESSIONS.values() if e.template_digest}
+
+
+def note_external_bytes(name: str, nbytes: int):
+    """セッションに属さない重いデータの現在のサイズを知らせる（0 で取り消し）。"""
+    with _LOCK:
+        if nbytes > 0:
+            _EXTERNAL[name] = nbytes
+        else:
+            _EXTERNAL.pop(name, None)
+
+
+def put_heavy(name: str, value, *, tag: Optional[str] = None, evictable: bool = True):
+    """
+    現在のセッションに重いデータを登録する（None なら削除）。
+    予算超過時は捨てられることがあるので、作り直せるキャッシュだけを置く。
+    作り直せないもの（ジョブの完成品）は evictable=False にする。
+    """
+    with _LOCK:
+        ent = _entry()
+        ent.items.pop(name, None)
+        if value is not None:
+            ent.items[name] = _HeavyItem(value, tag, evictable)
+
+
+def get_heavy(name: str, tag: Optional[str] = None):
+    """
+    現在のセッションの重いデータを返す。捨てられていれば None。
+    tag を指定した場合、登録時の tag と一致しなければ None。
+    """
+    with _LOCK:
+        it = _entry().items.get(name)
+        if it is None or (tag is not None and it.tag != tag):
+            return None
+        return it.value
+
+
+def enforce_budget():
+    """合計が予算を超えていれば、古いアイドルセッションから順に重いデータを捨てる。"""
+    now = time.time()
+    sid_now = current_session_id()
+    with _LOCK:
+        for sid in [s for s, e in _SESSIONS.items() if now - e.last_seen > _forget_seconds()]:
+            _SESSIONS.pop(sid)
+
+        total = sum(e.total_bytes() for e in _SESSIONS.values()) + sum(_EXTERNAL.values())
+        budget = budget_bytes()
+        if total <= budget:
+            return
+
+        idle = sorted(
+            (e for e in _SESSIONS.values()
+             if e.sid != sid_now and now - e.last_seen > _idle_seconds()),
+            key=lambda e: e.last_seen,
+        )
+        for ent in idle:
+            evictable = [(n, it) for n, it in ent.items.items() if it.evictable]
+            for name, it in sorted(evictable, key=lambda kv: kv[1].size, reverse=True):
+                del ent.items[name]
+                ent.evictions += 1
+                total -= it.size
+                if total <= budget:
+                    return
+
+
+def total_tracked_bytes() -> int:
+    with _LOCK:
+        return sum(e.total_bytes() for e in _SESSIONS.values()) + sum(_EXTERNAL.values())
+
+
+def session_memory_report(limit: int = 20) -> List[Dict[str, object]]:
+    """デバッグ表示用：概算サイズの大きい順にセッションを並べる。"""
+    now = time.time()
+    sid_now = current_session_id()
+    with _LOCK:
+        rows = [
+            {
+                "session": (e.sid[:8] + ("（自分）" if e.sid == sid_now else "")),
+                "合計KB": round(e.total_bytes() / 1024, 1),
+                "state KB": round(e.state_bytes / 1024, 1),
+                "重いデータKB": round(e.heavy_bytes() / 1024, 1),
+                "保持中": ", ".join(e.items),
+                "破棄回数": e.evictions,
+                "アイドル秒": int(now - e.last_seen),
+            }
+            for e in _SESSIONS.values()
+        ]
+    rows.sort(key=lambda r: r["合計KB"], reverse=True)
+    return rows[:limit]
@@ -1,4 +1,5 @@
 # report_maker/core/settings.py
+import os
 from datetime import timezone, timedelta
 
 JST = timezone(timedelta(hours=9))
@@ -11,3 +12,18 @@ WEEKDAYS_JA = ["月", "火", "水", "木", "金", "土", "日"]
 REQUIRED_KEYS = [
     "通報者", "受信内容", "現着状況", "原因", "処置内容", "処理修理後", "所属",
 ]
+
+def get_setting(name: str, default: str = "") -> str:
+    """
+    secrets → 環境変数 の順で設定値を取得する（どちらも無ければ default）。
+    get_passcode と同じ優先順位。
+    """
+    try:
+        import streamlit as st
+        val = st.secrets.get(name)
+        if val:
+            return str(val)
+    except Exception:
+        pass
+    env_val = os.getenv(name, "").strip()
+    return env_val or default
@@ -2,6 +2,8 @@
 import copy
 import os
 import streamlit as st
+from .session_memory import get_heavy, note_template_digest, put_heavy
+from .template_store import open_template, publish_template
 
 def get_passcode() -> str:
     try:
@@ -42,3 +44,33 @@ def set_working_value(key: str, value: str):
     else:
         ensure_extracted()
         st.session_state.extracted[key] = value
+
+def get_template_bytes():
+    """
+    現在のセッションのテンプレート（共有置き場を mmap した読み取り専用の memoryview）。
+    置き場から消えていれば None。
+    """
+    return open_template(st.session_state.get("template_digest"))
+
+def set_template_bytes(data: bytes):
+    """
+    テンプレートを共有置き場に置き、セッションには digest だけを持たせる。
+    同じ内容のテンプレートは全セッション・全プロセスで 1 つを共有する。
+    """
+    if not data:
+        st.session_state.template_digest = None
+        return
+    st.session_state.template_digest = publish_template(data)
+    note_template_digest(st.session_state.template_digest)
+
+def set_template_digest(digest: str):
+    """既に共有置き場にあるテンプレート（template_store.publish_template_file 等）を使う。"""
+    st.session_state.template_digest = digest
+    note_template_digest(digest)
+
+def get_cached_workbook(fingerprint: str):
+    """fingerprint が一致する生成済みブックがあれば返す。"""
+    return get_heavy("workbook", tag=fingerprint)
+
+def put_cached_workbook(fingerprint: str, data: bytes):
+    put_heavy("workbook", data, tag=fingerprint)
@@ -0,0 +1,141 @@
+# report_maker/core/summary_writer.py
+# ------------------------------------------------------------
+# 月次一覧（1 案件 1 行の .xlsx）をストリーミングで書き出す
+#   - openpyxl の write-only モードで 1 行ずつ追記する（行はワークシートの
+#     一時ファイルに流れるので、10 万行でもメモリはほぼ一定）
+#   - 入力は inbox（iter_inbox_records）か過去案件索引（iter_indexed_records）の
+#     ジェネレータで、全件をリストに載せない
+#   - 受信/現着/完了時刻は日時型、所要時間は時間型（[h]:mm）、作業時間_分 は整数
+# ------------------------------------------------------------
+from __future__ import annotations
+
+import io
+import re
+from datetime import timedelta
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter
+
+from .inbox_loader import EXPECTED_KEYS, iter_inbox_records
+from .incident_index import iter_indexed_records
+from .parsing import try_parse_datetime
+
+DATETIME_KEYS = {"受信時刻", "現着時刻", "完了時刻"}
+INT_KEYS = {"作業時間_分"}
+
+# 所要時間の列（列名, 開始キー, 終了キー）
+DURATION_COLUMNS = [
+    ("受付〜現着", "受信時刻", "現着時刻"),
+    ("作業時間", "現着時刻", "完了時刻"),
+    ("受付〜完了", "受信時刻", "完了時刻"),
+]
+
+SUMMARY_COLUMNS = list(EXPECTED_KEYS) + [c[0] for c in DURATION_COLUMNS]
+
+DATETIME_FORMAT = "yyyy/mm/dd hh:mm"
+DURATION_FORMAT = "[h]:mm"
+
+# 列幅（指定の無い列は 14）
+_COL_WIDTHS = {"受信内容": 40, "現着状況": 40, "原因": 40, "処置内容": 40, "住所": 30, "物件名": 24}
+
+
+def parse_year_month(s: Optional[str]) -> Optional[Tuple[int, int]]:
+    """'2025/01', '2025-1', '202501' などを (2025, 1) にする。"""
+    m = re.match(r"^\s*(\d{4})\D?(\d{1,2})\s*$", s or "")
+    if not m or not 1 <= int(m.group(2)) <= 12:
+        return None
+    return int(m.group(1)), int(m.group(2))
+
+
+def record_in_scope(rec: Dict[str, Optional[str]], manageno: str = "",
+                    ym: Optional[Tuple[int, int]] = None) -> bool:
+    """管理番号（完全一致）と 受信時刻 の年月で絞り込む。条件が空なら通す。"""
+    manageno = (manageno or "").strip()
+    if manageno and (rec.get("管理番号") or "").strip() != manageno:
+        return False
+    if ym:
+        dt = try_parse_datetime(rec.get("受信時刻"))
+        if dt is None or (dt.year, dt.month) != ym:
+            return False
+    return True
+
+
+def _naive(dt):
+    # Excel はタイムゾーンを持てないので JST の壁時計時刻で書く
+    return dt.replace(tzinfo=None) if dt is not None else None
+
+
+def _row_cells(ws, rec: Dict[str, Optional[str]]) -> list:
+    row = []
+    parsed = {k: try_parse_datetime(rec.get(k)) for k in DATETIME_KEYS}
+    for key in EXPECTED_KEYS:
+        raw = (rec.get(key) or "").strip()
+        if key in DATETIME_KEYS and parsed[key] is not None:
+            c = WriteOnlyCell(ws, value=_naive(parsed[key]))
+            c.number_format = DATETIME_FORMAT
+            row.append(c)
+        elif key in INT_KEYS and re.fullmatch(r"-?\d+", raw):
+            row.append(int(raw))
+        else:
+            row.append(raw or None)
+    for _, start, end in DURATION_COLUMNS:
+        s, e = parsed[start], parsed[end]
+        if s is not None and e is not None and e >= s:
+            c = WriteOnlyCell(ws, value=timedelta(seconds=(e - s).total_seconds()))
+            c.number_format = DURATION_FORMAT
+            row.append(c)
+        else:
+            row.append(None)
+    return row
+
+
+def write_summary_xlsx(records: Iterable[Dict[str, Optional[str]]], dest, sheet_title: str = "一覧") -> int:
+    """
+    records を 1 行ずつ dest（パス or バイナリファイル）に書き出し、書いた行数を返す。
+    records はジェネレータのまま渡すこと（リスト化しない）。
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_title)
+    for idx, key in enumerate(SUMMARY_COLUMNS, start=1):
+        ws.column_dimensions[get_column_letter(idx)].width = _COL_WIDTHS.get(key, 14)
+    ws.freeze_panes = "A2"
+
+    bold = Font(bold=True)
+    header = []
+    for key in SUMMARY_COLUMNS:
+        c = WriteOnlyCell(ws, value=key)
+        c.font = bold
+        header.append(c)
+    ws.append(header)
+
+    n = 0
+    for rec in records:
+        ws.append(_row_cells(ws, rec))
+        n += 1
+
+    ws.auto_filter.ref = f"A1:{get_column_letter(len(SUMMARY_COLUMNS))}{n + 1}"
+    wb.save(dest)
+    return n
+
+
+def iter_source_records(source: str) -> Iterator[Dict[str, str]]:
+    """source: "inbox"（inbox シート）または "archive"（過去案件索引）"""
+    if source == "inbox":
+        return iter_inbox_records()
+    if source == "archive":
+        return iter_indexed_records()
+    raise ValueError(f"未知の出力元です: {source!r}")
+
+
+def build_summary_xlsx(source: str, manageno: str = "", month: str = "") -> Tuple[bytes, int]:
+    """
+    一覧 .xlsx を作って (バイト列, 行数) を返す。プロセスプールから呼ぶ想定。
+    """
+    ym = parse_year_month(month)
+    records = (r for r in iter_source_records(source) if record_in_scope(r, manageno, ym))
+    out = io.BytesIO()
+    n = write_summary_xlsx(records, out)
+    return out.getvalue(), n
@@ -0,0 +1,370 @@
+# report_maker/core/template_store.py
+# ------------------------------------------------------------
+# テンプレートの共有置き場（メモリマップ・読み取り専用）
+#   サーバを複数プロセスで動かしても、テンプレートはホスト上に 1 つだけ置き、
+#   各プロセス・各生成ワーカーはそれを mmap して読む（ページキャッシュを共有するので
+#   プロセスを増やしてもテンプレート分のメモリは増えない）。セッションには digest だけを持つ。
+#   - <digest>.xlsm            : テンプレート本体（内容の sha1 で名前を付ける）
+#   - <digest>.<版>.wb.pickle : 解析済みブック（openpyxl の読み込み結果）。最初に必要になった
+#                               プロセスが作り、以後は解析（約 1.6 秒）の代わりに読み戻す（約 0.8 秒）
+#   ファイルは一時名で書いてから rename するので、途中のファイルを他プロセスが読むことはない。
+#   置き場は TEMPLATE_SHARE_DIR（既定 /dev/shm/report_maker、無ければ一時ディレクトリ）。
+#   /dev/shm はメモリなので、置くテンプレートは TEMPLATE_SHARE_MAX 件（既定 8）までとし、
+#   使われた時刻（mtime）の古いものから解析済みブックごと消す。各プロセスの mmap も、
+#   どのセッションも使わなくなったテンプレートのものは release_unused_templates() で閉じる。
+#   生成ワーカーはセッションを持たないので、ジョブごとに今使う digest 以外の mmap と
+#   先に解析したブックを手放す（ワーカーが入れ替わらなくても古いテンプレートを抱え続けない）。
+#   置き場（本体と解析済みブック）も /dev/shm のメモリなので、note_shared_store_bytes() で
+#   セッションのメモリ予算に含める。
+#   token 直行時は warm_shared_template() で、inbox の取得を待つ間に生成ワーカーへ解析させておく。
+# ------------------------------------------------------------
+from __future__ import annotations
+
+import hashlib
+import io
+import mmap
+import os
+import pickle
+import stat
+import sys
+import tempfile
+import threading
+import zipfile
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Union
+
+import openpyxl
+
+from .excel_writer import fill_binder_loaded, fill_loaded_template, load_template_workbook
+from .session_memory import note_external_bytes
+from .settings import get_setting
+
+_LOCK = threading.Lock()
+# digest → (mmap, memoryview)。プロセスが生きている間は開いたままにする
+_MAPS: Dict[str, tuple] = {}
+# 生成ワーカーで先に解析しておいたブック（warm_shared_template、最新の 1 件だけ）
+_SPARE: Dict[str, object] = {}
+
+# 解析済みブックの形式はライブラリの版に依存するので、ファイル名に含める
+_ARTIFACT_VERSION = f"py{sys.version_info[0]}{sys.version_info[1]}-openpyxl{openpyxl.__version__}"
+
+
+def share_dir() -> str:
+    path = get_setting("TEMPLATE_SHARE_DIR", "")
+    if not path:
+        base = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        path = os.path.join(base, "report_maker")
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    # pickle を読むので、他ユーザーが書き込める置き場は使わない
+    st = os.stat(path)
+    if (hasattr(os, "getuid") and st.st_uid != os.getuid()) or st.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise RuntimeError(f"テンプレート置き場の権限が安全ではありません: {path}")
+    return path
+
+
+def share_max() -> int:
+    try:
+        return max(1, int(float(get_setting("TEMPLATE_SHARE_MAX", "8"))))
+    except ValueError:
+        return 8
+
+
+def template_path(digest: str) -> str:
+    return os.path.join(share_dir(), f"{digest}.xlsm")
+
+
+def _artifact_path(digest: str) -> str:
+    return os.path.join(share_dir(), f"{digest}.{_ARTIFACT_VERSION}.wb.pickle")
+
+
+def _write_atomic(path: str, data) -> None:
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def publish_template(data: Union[bytes, memoryview]) -> str:
+    """テンプレートを共有置き場に置き（既にあれば何もしない）、digest を返す。"""
+    if not data:
+        raise ValueError("テンプレートのバイト列が空です。")
+    digest = hashlib.sha1(data).hexdigest()
+    path = template_path(digest)
+    if not (os.path.exists(path) and os.path.getsize(path) == len(data)):
+        _write_atomic(path, data)
+    else:
+        _touch(path)
+    evict_shared_templates(keep=(digest,))
+    return digest
+
+
+def _touch(path: str):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def evict_shared_templates(keep: Iterable[str] = ()) -> int:
+    """
+    置き場のテンプレートを使われた順に TEMPLATE_SHARE_MAX 件まで残し、古いものを
+    解析済みブックごと消す（keep の digest は残す）。消した件数を返す。
+    他プロセスが mmap 中のファイルを消しても、その mmap は有効なまま
+    （必要になれば ensure_template_file が書き戻す）。
+    """
+    directory = share_dir()
+    keep = set(keep)
+    entries = []
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return 0
+    for name in names:
+        if name.endswith(".xlsm") and not name.startswith(".tmp_"):
+            try:
+                entries.append((os.path.getmtime(os.path.join(directory, name)), name[:-len(".xlsm")]))
+            except OSError:
+                continue
+    entries.sort(reverse=True)
+    live = {d for _, d in entries[:share_max()]} | keep
+    removed = 0
+    for _, digest in entries:
+        if digest in live:
+            continue
+        try:
+            os.remove(template_path(digest))
+            removed += 1
+        except OSError:
+            pass
+    # 本体の無い解析済みブック（消したもの・古い版のもの）も消す
+    for name in names:
+        if name.endswith(".wb.pickle"):
+            digest = name.split(".", 1)[0]
+            if digest not in live or not name.endswith(f".{_ARTIFACT_VERSION}.wb.pickle"):
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+    return removed
+
+
+@lru_cache(maxsize=8)
+def _publish_file_cached(path: str, mtime_ns: int, size: int) -> str:
+    with open(path, "rb") as f:
+        return publish_template(f.read())
+
+
+def publish_template_file(path: str) -> str:
+    """ファイルのテンプレートを共有置き場に置く。更新されていなければ読み直さない。"""
+    st = os.stat(path)
+    digest = _publish_file_cached(path, st.st_mtime_ns, st.st_size)
+    if not os.path.exists(template_path(digest)):
+        # 置き場が掃除された場合は置き直す
+        _publish_file_cached.cache_clear()
+        digest = _publish_file_cached(path, st.st_mtime_ns, st.st_size)
+    return digest
+
+
+def _map_file(path: str) -> tuple:
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return mm, memoryview(mm)
+
+
+def open_template(digest: Optional[str]) -> Optional[memoryview]:
+    """共有置き場のテンプレートを読み取り専用の memoryview で返す（コピーしない）。無ければ None。"""
+    if not digest:
+        return None
+    with _LOCK:
+        entry = _MAPS.get(digest)
+        if entry is None:
+            try:
+                entry = _MAPS[digest] = _map_file(template_path(digest))
+            except (OSError, ValueError):
+                return None
+            # 使われたことを置き場の掃除（evict_shared_templates）に知らせる
+            _touch(template_path(digest))
+        return entry[1]
+
+
+def release_unused_templates(live: Iterable[str]) -> int:
+    """
+    live（このプロセスのセッションが使っている digest）以外の mmap を手放す。
+    参照を外すだけなので、読み込み中の memoryview があればそれが無くなった時点で閉じられる。
+    手放した件数を返す。
+    """
+    live = set(live)
+    with _LOCK:
+        stale = [d for d in _MAPS if d not in live]
+        for digest in stale:
+            del _MAPS[digest]
+    return len(stale)
+
+
+def _keep_only(digest: str) -> None:
+    """生成ワーカー用：digest 以外のテンプレートの mmap と先に解析したブックを手放す。"""
+    release_unused_templates((digest,))
+    with _LOCK:
+        for stale in [d for d in _SPARE if d != digest]:
+            del _SPARE[stale]
+
+
+def shared_store_bytes() -> int:
+    """置き場のテンプレート本体と解析済みブックの合計バイト数"""
+    directory = share_dir()
+    total = 0
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return 0
+    for name in names:
+        if name.endswith((".xlsm", ".wb.pickle")) and not name.startswith(".tmp_"):
+            try:
+                total += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                continue
+    return total
+
+
+def note_shared_store_bytes() -> int:
+    """置き場の使用量をセッションのメモリ予算に知らせる（解析済みブックはワーカーが作るので都度数える）。"""
+    total = shared_store_bytes()
+    note_external_bytes("template_share", total)
+    return total
+
+
+def ensure_template_file(digest: str) -> bool:
+    """
+    ワーカーへ digest を渡す前に呼ぶ。置き場のファイルが消えていても、
+    このプロセスが mmap 中なら書き戻す。使える状態なら True。
+    """
+    if os.path.exists(template_path(digest)):
+        return True
+    with _LOCK:
+        entry = _MAPS.get(digest)
+    if entry is None:
+        return False
+    _write_atomic(template_path(digest), entry[1])
+    return True
+
+
+class _MappedReader(io.RawIOBase):
+    """memoryview 上の読み取り専用ファイル。読んだ範囲だけをコピーし、全体は複製しない。"""
+
+    def __init__(self, view: memoryview):
+        self._view = view
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        else:
+            self._pos = len(self._view) + offset
+        return self._pos
+
+    def readinto(self, b) -> int:
+        n = max(0, min(len(b), len(self._view) - self._pos))
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+
+def template_reader(digest: str) -> io.BufferedReader:
+    view = open_template(digest)
+    if view is None:
+        raise FileNotFoundError(f"共有テンプレートが見つかりません（{digest[:8]}）。テンプレートを読み込み直してください。")
+    return io.BufferedReader(_MappedReader(view))
+
+
+def _load_artifact(digest: str):
+    try:
+        mm, view = _map_file(_artifact_path(digest))
+    except (OSError, ValueError):
+        return None
+    try:
+        return pickle.loads(view)
+    except Exception:
+        return None
+    finally:
+        view.release()
+        mm.close()
+
+
+def _save_artifact(digest: str, wb) -> None:
+    vba, wb.vba_archive = wb.vba_archive, None
+    try:
+        data = pickle.dumps(wb, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        # 版によって pickle できない場合は、毎回解析するだけにする
+        return
+    finally:
+        wb.vba_archive = vba
+    try:
+        _write_atomic(_artifact_path(digest), data)
+    except OSError:
+        pass
+
+
+def load_shared_workbook(digest: str):
+    """
+    共有テンプレートを解析済みブックにする（load_template_workbook の共有置き場版）。
+    解析済みブックの pickle があればそれを読み戻し、無ければ解析して作っておく。
+    返したブックは書き込みで変更されるので 1 回しか使えない。
+    """
+    wb = _load_artifact(digest)
+    if wb is None:
+        wb = load_template_workbook(template_reader(digest))
+        _save_artifact(digest, wb)
+    else:
+        # VBA 部分は保存時にテンプレート本体の zip から直接コピーされる
+        wb.vba_archive = zipfile.ZipFile(template_reader(digest))
+    return wb
+
+
+def warm_shared_template(digest: str) -> None:
+    """
+    生成ワーカーで共有テンプレートを先に解析しておく（token 直行時、inbox の取得と並行して投入する）。
+    同じワーカーに来た次の fill_shared_template はこのブックを使う。解析済みブックの pickle も
+    無ければここで作るので、別のワーカーに回った生成も解析の代わりに読み戻すだけで済む。
+    """
+    _keep_only(digest)
+    with _LOCK:
+        if digest in _SPARE:
+            return
+    wb = load_shared_workbook(digest)
+    with _LOCK:
+        _SPARE[digest] = wb
+
+
+def fill_shared_template(digest: str, data: Dict[str, Optional[str]]) -> bytes:
+    """fill_template_xlsx の共有置き場版（プロセスプールへは digest だけを渡す）"""
+    _keep_only(digest)
+    with _LOCK:
+        wb = _SPARE.pop(digest, None)
+    if wb is None:
+        wb = load_shared_workbook(digest)
+    return fill_loaded_template(wb, data)
+
+
+def fill_shared_binder(digest: str, records: List[Dict[str, Optional[str]]]) -> bytes:
+    """fill_binder_xlsx の共有置き場版"""
+    _keep_only(digest)
+    return fill_binder_loaded(load_shared_workbook(digest), records)
@@ -0,0 +1,54 @@
+# tests/test_binder.py
+# 複数の報告書を 1 ファイルにまとめる綴り（fill_binder_xlsx）
+import io
+import os
+
+import pytest
+from openpyxl import load_workbook
+
+from core.excel_writer import binder_sheet_title, build_binder_filename, fill_binder_xlsx
+from core.settings import SHEET_NAME
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REC = {
+    "管理番号": "HK-0001",
+    "メーカー": "三菱",
+    "受信時刻": "2025/01/10 09:12",
+    "現着時刻": "2025/01/10 09:48",
+    "完了時刻": "2025/01/10 10:30",
+    "受信内容": "かご内インターホン不通",
+    "処置内容": "1\n2\n3\n4\n5\n6\n7",
+    "処理修理後": "   ",
+}
+
+
+@pytest.fixture(scope="module")
+def template_bytes():
+    with open(os.path.join(ROOT_DIR, "template.xlsm"), "rb") as f:
+        return f.read()
+
+
+def test_binder_sheet_title_dedupes():
+    used = set()
+    first = binder_sheet_title(REC, used)
+    second = binder_sheet_title(REC, used)
+    assert first == "HK-0001_20250110"
+    assert second == "HK-0001_20250110_2"
+
+
+def test_fill_binder_xlsx_one_sheet_per_record(template_bytes):
+    other = dict(REC, 管理番号="HK-0002", 受信時刻="2025/01/12 08:00",
+                 現着時刻="2025/01/12 08:30", 完了時刻="2025/01/12 09:00")
+    data = fill_binder_xlsx(template_bytes, [REC, other])
+    wb = load_workbook(io.BytesIO(data), keep_vba=True)
+    titles = ["HK-0001_20250110", "HK-0002_20250112"]
+    assert all(t in wb.sheetnames for t in titles)
+    assert SHEET_NAME not in wb.sheetnames
+    assert [wb[t]["C12"].value for t in titles] == ["HK-0001", "HK-0002"]
+    assert build_binder_filename([REC, other]) == "緊急出動報告書_綴り_複数物件_20250110-20250112.xlsm"
+
+
+def test_fill_binder_xlsx_requires_records(template_bytes):
+    with pytest.raises(ValueError):
+        fill_binder_xlsx(template_bytes, [])
@@ -0,0 +1,66 @@
+# tests/test_columnar_export.py
+# 列指向エクスポート（Parquet / Arrow IPC / JSON Lines）
+import io
+import json
+
+import pytest
+
+from core import columnar_export
+from core.columnar_export import build_columnar_export, resolve_format, typed_row, write_records
+from core.incident_index import index_records
+
+RECORDS = [
+    {"管理番号": "HK-0001", "受信時刻": "2025/01/10 09:12", "現着時刻": "2025/01/10 09:48",
+     "完了時刻": "2025/01/10 10:30", "受信内容": "インターホン不通", "受付番号": "1", "作業時間_分": "42"},
+    {"管理番号": "HK-0002", "受信時刻": "2025/02/01 08:00", "受信内容": "異音", "受付番号": "2"},
+]
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    """過去案件索引を一時ファイルに作り、出力元 "archive" がそれを読むようにする。"""
+    path = str(tmp_path / "index.sqlite3")
+    monkeypatch.setenv("INCIDENT_INDEX_PATH", path)
+    index_records(RECORDS, path=path)
+    return path
+
+
+def test_typed_row_minutes():
+    row = typed_row(RECORDS[0])
+    assert row["受付〜現着_分"] == 36
+    assert row["作業時間_分"] == 42
+    assert row["受付〜完了_分"] == 78
+    assert typed_row(RECORDS[1])["作業時間_分"] is None
+
+
+def test_write_records_jsonl():
+    out = io.BytesIO()
+    assert write_records(RECORDS, out, "jsonl") == (2, "jsonl")
+    first = json.loads(out.getvalue().decode("utf-8").splitlines()[0])
+    assert first["管理番号"] == "HK-0001"
+    assert first["受信時刻"].startswith("2025-01-10T09:12:00")
+
+
+def test_resolve_format_falls_back_without_pyarrow(monkeypatch):
+    monkeypatch.setattr(columnar_export, "pa", None)
+    assert resolve_format("parquet") == "jsonl"
+    with pytest.raises(ValueError):
+        resolve_format("csv")
+
+
+def test_parquet_and_arrow_round_trip(archive):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    data, n = build_columnar_export("archive", "parquet", manageno="HK-0001")
+    table = pq.read_table(io.BytesIO(data))
+    assert n == table.num_rows == 1
+    assert table.column("作業時間_分").to_pylist() == [42]
+    # Parquet に秒の単位は無いので、読み戻すとミリ秒になる
+    assert table.schema.field("受信時刻").type.tz == "Asia/Tokyo"
+    assert table.column("受信時刻").to_pylist()[0].strftime("%Y/%m/%d %H:%M") == "2025/01/10 09:12"
+
+    data, n = build_columnar_export("archive", "arrow")
+    table = pa.ipc.open_stream(data).read_all()
+    assert n == table.num_rows == 2
+    assert str(table.schema.field("受信時刻").type) == "timestamp[s, tz=Asia/Tokyo]"
@@ -0,0 +1,99 @@
+# tests/test_inbox_loader.py
+# 複数 inbox ソースの同時取得（止まった・失敗したソースがあっても token を引けること）
+import threading
+import time
+
+import pytest
+
+from core import inbox_loader
+from core.inbox_loader import inbox_source_errors, iter_inbox_records, load_from_sheet_by_token
+from tools.loadtest import write_inbox_stub
+
+
+@pytest.fixture(autouse=True)
+def isolated_sources(monkeypatch):
+    monkeypatch.setattr(inbox_loader, "_LAST_GOOD", inbox_loader.OrderedDict())
+    monkeypatch.setattr(inbox_loader, "_SOURCE_ERRORS", {})
+    monkeypatch.delenv("SHEET_CSV_URL", raising=False)
+    monkeypatch.setenv("INBOX_FETCH_TIMEOUT_SEC", "30")
+
+
+@pytest.fixture
+def inbox_csv(tmp_path):
+    path = str(tmp_path / "inbox.csv")
+    return path, write_inbox_stub(path, 5)
+
+
+@pytest.fixture
+def stalled_source(tmp_path, monkeypatch):
+    """取得が終わらないソース（テストの終わりに解放する）"""
+    path = str(tmp_path / "stalled.csv")
+    release = threading.Event()
+    real_fetch = inbox_loader._fetch_source
+
+    def fetch(src, timeout):
+        if src == path:
+            release.wait(60)
+        return real_fetch(src, timeout)
+
+    monkeypatch.setattr(inbox_loader, "_fetch_source", fetch)
+    yield path
+    release.set()
+
+
+def _sources(monkeypatch, *paths):
+    monkeypatch.setenv("SHEET_CSV_URLS", "\n".join(paths))
+
+
+def test_stalled_first_source_does_not_block_lookup(monkeypatch, inbox_csv, stalled_source):
+    path, tokens = inbox_csv
+    _sources(monkeypatch, stalled_source, path)
+    t0 = time.perf_counter()
+    rec = load_from_sheet_by_token(tokens[2])
+    assert time.perf_counter() - t0 < 5
+    assert rec["管理番号"] == "HK-0002"
+
+
+def test_failing_source_is_reported_and_skipped(monkeypatch, inbox_csv, tmp_path):
+    path, tokens = inbox_csv
+    missing = str(tmp_path / "missing.csv")
+    html = tmp_path / "login.csv"
+    html.write_text("<html><body>login</body></html>", encoding="utf-8")
+    _sources(monkeypatch, missing, str(html), path)
+
+    assert load_from_sheet_by_token(tokens[0])["管理番号"] == "HK-0000"
+    assert [r["token"] for r in iter_inbox_records()] == tokens
+    errors = inbox_source_errors()
+    assert set(errors) == {missing, str(html)}
+    assert errors[str(html)].startswith("読み込めません")
+
+
+def test_missing_token_raises(monkeypatch, inbox_csv):
+    path, _ = inbox_csv
+    _sources(monkeypatch, path)
+    with pytest.raises(KeyError):
+        load_from_sheet_by_token("no-such-token")
+
+
+def test_failed_fetch_falls_back_to_last_good(monkeypatch, inbox_csv, tmp_path):
+    path, tokens = inbox_csv
+    _sources(monkeypatch, path)
+    load_from_sheet_by_token(tokens[0])
+    tmp_path.joinpath("inbox.csv").unlink()
+    assert load_from_sheet_by_token(tokens[1])["管理番号"] == "HK-0001"
+    assert path in inbox_source_errors()
+
+
+def test_last_good_is_bounded(monkeypatch, tmp_path):
+    paths = []
+    for i in range(3):
+        p = str(tmp_path / f"inbox{i}.csv")
+        write_inbox_stub(p, 5)
+        paths.append(p)
+    size = len(open(paths[0], "rb").read())
+    # 2 ソース分だけ覚えられる上限
+    monkeypatch.setenv("INBOX_LAST_GOOD_MAX_MB", str((2 * size + 10) / 1024 / 1024))
+    _sources(monkeypatch, *paths)
+    list(iter_inbox_records())
+    assert len(inbox_loader._LAST_GOOD) == 2
+    assert sum(len(v) for v in inbox_loader._LAST_GOOD.values()) <= 2 * size + 10
@@ -0,0 +1,56 @@
+# tests/test_incident_index.py
+# 過去案件の全文索引（index_records の増分更新・find_similar）
+import pytest
+
+from core.incident_index import (
+    count_indexed, find_similar, incident_key, index_records, iter_indexed_records,
+)
+
+RECORDS = [
+    {"管理番号": "HK-0001", "メーカー": "三菱", "受信時刻": "2025/01/10 09:12", "受付番号": "1",
+     "受信内容": "エレベーター停止 かご内閉じ込め"},
+    {"管理番号": "HK-0002", "メーカー": "日立", "受信時刻": "2025/01/11 10:00", "受付番号": "2",
+     "受信内容": "エスカレーター異音"},
+    {"管理番号": "HK-0003", "メーカー": "三菱", "受信時刻": "2025/01/12 11:30", "受付番号": "3",
+     "受信内容": "エレベーター停止 扉が閉まらない"},
+]
+
+
+@pytest.fixture
+def store(tmp_path):
+    path = str(tmp_path / "index.sqlite3")
+    index_records(RECORDS, path=path)
+    return path
+
+
+def test_incident_key_normalizes_received_time():
+    a = dict(RECORDS[0], 受信時刻="2025-01-10 09:12")
+    assert incident_key(a) == incident_key(RECORDS[0]) == "k:HK-0001|2025-01-10 09:12|1"
+
+
+def test_index_records_is_incremental(store):
+    assert count_indexed(store) == 3
+    assert index_records(RECORDS, path=store) == 0
+    changed = dict(RECORDS[1], 原因="ステップ破損")
+    assert index_records([changed], path=store) == 1
+    assert count_indexed(store) == 3
+
+
+def test_index_records_skips_empty_rows(store):
+    assert index_records([{"物件名": "テストビル"}], path=store) == 0
+
+
+def test_find_similar_ranks_matching_text_and_excludes_self(store):
+    similar = find_similar(RECORDS[0], path=store)
+    assert [r["管理番号"] for r in similar][0] == "HK-0003"
+    assert all(r["管理番号"] != "HK-0001" for r in similar)
+    assert all("_score" in r for r in similar)
+
+
+def test_find_similar_without_terms(store):
+    assert find_similar({"受信内容": "停"}, path=store) == []
+
+
+def test_iter_indexed_records_in_received_order(store):
+    got = [r["管理番号"] for r in iter_indexed_records(store, batch_size=2)]
+    assert got == ["HK-0001", "HK-0002", "HK-0003"]
@@ -0,0 +1,103 @@
+# tests/test_job_pool.py
+# 共有プロセスプール（受付制限・lane・結果の受け取り）
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from core import job_pool
+from core.job_pool import (
+    PoolBusyError, discard_job, job_status, pool_idle, submit_job, take_result, wait_job,
+)
+
+
+@pytest.fixture(autouse=True)
+def isolated_pool(monkeypatch):
+    """テストごとに空のプールを使い、終わったらワーカーを止める。"""
+    monkeypatch.setenv("GEN_POOL_WORKERS", "1")
+    monkeypatch.setenv("GEN_QUEUE_MAX", "1")
+    monkeypatch.setenv("BULK_POOL_WORKERS", "1")
+    monkeypatch.setenv("BULK_QUEUE_MAX", "0")
+    executors = {}
+    monkeypatch.setattr(job_pool, "_EXECUTORS", executors)
+    monkeypatch.setattr(job_pool, "_JOBS", {})
+    yield
+    for ex in executors.values():
+        ex.shutdown(wait=True, cancel_futures=True)
+
+
+def test_submit_and_take_result():
+    job_id = submit_job(pow, 2, 10)
+    assert wait_job(job_id, 30)["state"] == "done"
+    assert take_result(job_id) == 1024
+    assert job_status(job_id)["state"] == "missing"
+
+
+def test_error_is_reported_as_state():
+    job_id = submit_job(int, "x")
+    st = wait_job(job_id, 30)
+    assert st["state"] == "error"
+    assert "invalid literal" in st["error"]
+
+
+def test_admission_limit_and_queue_position():
+    running = submit_job(time.sleep, 1)
+    queued = submit_job(time.sleep, 0)
+    with pytest.raises(PoolBusyError):
+        submit_job(time.sleep, 0)
+    assert job_status(queued) == {"state": "queued", "position": 1}
+    assert not pool_idle()
+    assert wait_job(running, 30)["state"] == "done"
+    assert wait_job(queued, 30)["state"] == "done"
+    take_result(running)
+    take_result(queued)
+    assert pool_idle()
+
+
+def test_bulk_lane_does_not_block_interactive():
+    bulk = submit_job(time.sleep, 1, lane="bulk")
+    with pytest.raises(PoolBusyError, match="一覧出力"):
+        submit_job(time.sleep, 0, lane="bulk")
+    # 対話の lane は一括処理と別に受け付け、pool_idle も対話側だけを見る
+    assert pool_idle()
+    job_id = submit_job(pow, 3, 2)
+    assert wait_job(job_id, 30)["state"] == "done"
+    assert take_result(job_id) == 9
+    discard_job(bulk)
+
+
+def test_unknown_lane():
+    with pytest.raises(ValueError):
+        submit_job(pow, 1, 1, lane="batch")
+
+
+class _BrokenExecutor:
+    def __init__(self):
+        self.shutdown_args = None
+
+    def submit(self, *args, **kwargs):
+        raise BrokenProcessPool("worker died")
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shutdown_args = (wait, cancel_futures)
+
+
+def test_broken_executor_is_shut_down_and_replaced():
+    broken = job_pool._EXECUTORS["interactive"] = _BrokenExecutor()
+    job_id = submit_job(pow, 2, 3)
+    assert broken.shutdown_args == (False, True)
+    assert job_pool._EXECUTORS["interactive"] is not broken
+    assert wait_job(job_id, 30)["state"] == "done"
+    assert take_result(job_id) == 8
+
+
+def test_parent_timeout_keeps_running_job_counted():
+    job_id = submit_job(time.sleep, 3, timeout=30)
+    assert wait_job(job_id, 0.5)["state"] in ("queued", "running")
+    job_pool._JOBS[job_id].submitted_at -= 3600
+    st = job_status(job_id)
+    assert st["state"] == "error"
+    assert "中断" not in st["error"]
+    # ワーカーはまだ動いているので、空いたことにはしない
+    assert not pool_idle()
+    assert wait_job(job_id, 30)["state"] == "done"
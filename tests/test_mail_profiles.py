@@ -0,0 +1,140 @@
+# tests/test_mail_profiles.py
+# メール書式プロファイル（detect_profile / register_profile / load_profiles_file）
+import json
+import re
+
+import pytest
+
+from core import parsing
+from core.parsing import DEFAULT_PROFILE, MailProfile, detect_profile, extract_fields
+
+ACME_MAIL = """件名: 【故障完了】 AC-0001
+ACME 昇降機サービス
+管理番号: AC-0001
+発生日時: 2025/01/10 09:12
+対応内容: 部品交換
+再起動
+"""
+
+
+@pytest.fixture(autouse=True)
+def isolated_profiles(monkeypatch):
+    """登録済みプロファイルと MAIL_PROFILES_PATH の読み込み状態をテストごとに空にする。"""
+    monkeypatch.setattr(parsing, "_PROFILES", [])
+    monkeypatch.setattr(parsing, "_DISPATCH", (None, {}))
+    monkeypatch.setattr(parsing, "_PROFILES_FILE_LOADED", False)
+    monkeypatch.setattr(parsing, "_PROFILES_FILE_FAILED", None)
+    monkeypatch.setattr(parsing, "_PROFILES_FILE_ERROR", "")
+    monkeypatch.delenv("MAIL_PROFILES_PATH", raising=False)
+
+
+def _acme(**kw) -> MailProfile:
+    return MailProfile(
+        "acme",
+        {"管理番号": "管理番号", "発生日時": "受信時刻", "対応内容": "処置内容"},
+        ["処置内容"],
+        signature=r"^ACME 昇降機サービス",
+        **kw,
+    )
+
+
+def test_detect_profile_defaults_without_profiles():
+    assert detect_profile(ACME_MAIL) is DEFAULT_PROFILE
+
+
+def test_register_profile_dispatches_by_signature():
+    parsing.register_profile(_acme())
+    assert detect_profile(ACME_MAIL).name == "acme"
+    assert detect_profile("管理番号: X-1\n") is DEFAULT_PROFILE
+
+    out = extract_fields(ACME_MAIL)
+    assert out["受信時刻"] == "2025/01/10 09:12"
+    assert out["処置内容"] == "部品交換\n再起動"
+
+
+def test_signature_only_checks_header_lines():
+    parsing.register_profile(_acme())
+    late = "\n" * parsing.SIGNATURE_HEADER_LINES + "ACME 昇降機サービス\n"
+    assert detect_profile(late) is DEFAULT_PROFILE
+
+
+def test_register_profile_replaces_same_name():
+    parsing.register_profile(_acme())
+    parsing.register_profile(MailProfile("acme", {}, [], signature=r"^OTHER"))
+    assert len(parsing._PROFILES) == 1
+    assert detect_profile(ACME_MAIL) is DEFAULT_PROFILE
+    assert detect_profile("OTHER\n").name == "acme"
+
+
+@pytest.mark.parametrize("signature", [r"^(?P<vendor>ACME)", r"(?i)^acme", r"(?x)^ACME  # comment"])
+def test_signature_rejects_group_names_and_inline_flags(signature):
+    with pytest.raises(ValueError):
+        MailProfile("bad", {}, [], signature=signature)
+
+
+def test_failed_registration_keeps_existing_profiles(monkeypatch):
+    parsing.register_profile(_acme())
+    bad = MailProfile("other", {}, [], signature=r"^OTHER")
+    # 検査をすり抜けた signature でも、まとめた正規表現が作れなければ何も変えない
+    bad.signature = r"^(?P<p0>OTHER)"
+    with pytest.raises(re.error):
+        parsing.register_profile(bad)
+    assert [p.name for p in parsing._PROFILES] == ["acme"]
+    assert detect_profile(ACME_MAIL).name == "acme"
+
+
+def test_scoped_inline_flags_are_allowed():
+    parsing.register_profile(MailProfile("other", {}, [], signature=r"^(?i:other) maker"))
+    assert detect_profile("OTHER maker\n").name == "other"
+
+
+def test_load_profiles_file(tmp_path):
+    path = tmp_path / "profiles.json"
+    path.write_text(json.dumps([
+        {"name": "acme", "signature": "^ACME 昇降機サービス",
+         "labels": {"発生日時": "受信時刻"}, "multiline": ["処置内容"]},
+        {"name": "plain", "signature": "^PLAIN"},
+    ], ensure_ascii=False), encoding="utf-8")
+    assert parsing.load_profiles_file(str(path)) == 2
+    assert detect_profile(ACME_MAIL).name == "acme"
+    # labels を省略したものは既定のラベルを使う
+    plain = detect_profile("PLAIN\n")
+    assert plain.name == "plain" and plain.label_canon == DEFAULT_PROFILE.label_canon
+
+
+@pytest.mark.parametrize("content", [
+    "{not json",
+    json.dumps({"name": "x"}),
+    json.dumps([{"signature": "^X"}]),
+    json.dumps([{"name": "ok", "signature": "^OK"}, {"name": "bad", "signature": "(unclosed"}]),
+])
+def test_load_profiles_file_rejects_bad_file_without_partial_registration(tmp_path, content):
+    path = tmp_path / "profiles.json"
+    path.write_text(content, encoding="utf-8")
+    with pytest.raises(ValueError):
+        parsing.load_profiles_file(str(path))
+    assert parsing._PROFILES == []
+
+
+def test_bad_profiles_path_does_not_break_extraction(tmp_path, monkeypatch):
+    path = tmp_path / "profiles.json"
+    path.write_text("{not json", encoding="utf-8")
+    monkeypatch.setenv("MAIL_PROFILES_PATH", str(path))
+
+    out = extract_fields("管理番号: X-1\n")
+    assert out["管理番号"] == "X-1"
+    assert "読み込めませんでした" in parsing.profiles_file_error()
+    assert parsing._PROFILES_FILE_LOADED is False
+
+    # 直したファイルは次の呼び出しで読み込まれる
+    path.write_text(json.dumps([{"name": "acme", "signature": "^ACME 昇降機サービス"}]), encoding="utf-8")
+    parsing._PROFILES_FILE_FAILED = None  # mtime の分解能に依存しないように
+    assert detect_profile(ACME_MAIL).name == "acme"
+    assert parsing.profiles_file_error() == ""
+    assert parsing._PROFILES_FILE_LOADED is True
+
+
+def test_missing_profiles_path_is_reported(tmp_path, monkeypatch):
+    monkeypatch.setenv("MAIL_PROFILES_PATH", str(tmp_path / "missing.json"))
+    assert detect_profile(ACME_MAIL) is DEFAULT_PROFILE
+    assert "missing.json" in parsing.profiles_file_error()
@@ -0,0 +1,44 @@
+# tests/test_parsing.py
+# メール本文からの項目抽出（extract_fields）
+from core.parsing import extract_fields
+
+MAIL = """件名: 【故障完了】 HK-0007 テストビル
+管理番号: HK-0007
+物件名: テストビル
+住所: 札幌市中央区北1条西1丁目
+メーカー: テストメーカー
+受信時刻: 2025/01/10 09:12
+現着時刻: 2025/01/10 09:48
+完了時刻: 2025/01/10 10:30
+受信内容: かご内インターホン不通
+原因: 配線端子のゆるみ
+処置内容: 端子増し締め
+動作確認実施
+対応者: 山田
+受付番号: 7
+"""
+
+
+def test_extract_fields_basic_labels():
+    rec = extract_fields(MAIL)
+    assert rec["管理番号"] == "HK-0007"
+    assert rec["物件名"] == "テストビル"
+    assert rec["メーカー"] == "テストメーカー"
+    assert rec["受付番号"] == "7"
+    assert rec["案件種別(件名)"] == "故障完了"
+
+
+def test_extract_fields_multiline_and_times():
+    rec = extract_fields(MAIL)
+    assert rec["処置内容"] == "端子増し締め\n動作確認実施"
+    assert rec["受信時刻"] == "2025/01/10 09:12"
+    assert rec["完了時刻"] == "2025/01/10 10:30"
+    # 現着〜完了 の分数を計算する
+    assert rec["作業時間_分"] == "42"
+
+
+def test_extract_fields_missing_labels_are_none():
+    rec = extract_fields("管理番号: HK-0001\n")
+    assert rec["管理番号"] == "HK-0001"
+    assert rec["原因"] is None
+    assert rec["受付URL"] is None
@@ -0,0 +1,63 @@
+# tests/test_preview.py
+# 帳票の HTML プレビュー（render_preview_html）と、生成と共用する書き込み値（report_cell_values）
+import os
+from datetime import datetime
+
+from core.excel_writer import report_cell_values
+from core.preview import render_preview_html
+from core.settings import JST
+from core.template_store import publish_template
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+NOW = datetime(2025, 2, 3, 12, 0, tzinfo=JST)
+
+REC = {
+    "管理番号": "HK-0001",
+    "メーカー": "三菱",
+    "受信時刻": "2025/01/10 09:12",
+    "現着時刻": "2025/01/10 09:48",
+    "完了時刻": "2025/01/10 10:30",
+    "受信内容": "かご内インターホン不通",
+    "処置内容": "1\n2\n3\n4\n5\n6\n7",
+    "処理修理後": "   ",
+}
+
+
+def test_report_cell_values_fields_and_date():
+    values = report_cell_values(REC, NOW)
+    assert values["C12"] == "HK-0001"
+    assert values["J12"] == "三菱"
+    assert (values["B5"], values["D5"], values["F5"]) == (2025, 2, 3)
+    # 空白だけの 処理修理後 や空の項目は書かない（テンプレートの値を残す）
+    assert "C35" not in values
+    assert "C14" not in values
+
+
+def test_report_cell_values_datetime_blocks():
+    values = report_cell_values(REC, NOW)
+    # 受信時刻（13 行目）：年月日は数値、時・分は 2 桁の文字列
+    assert (values["C13"], values["F13"], values["H13"]) == (2025, 1, 10)
+    assert (values["M13"], values["O13"]) == ("09", "12")
+    assert (values["M36"], values["O36"]) == ("10", "30")
+
+
+def test_report_cell_values_multiline_clears_and_truncates():
+    values = report_cell_values(REC, NOW)
+    # 受信内容は 4 行欄：1 行目に値、残りは空文字で上書きする
+    assert [values[f"C{r}"] for r in range(15, 19)] == ["かご内インターホン不通", "", "", ""]
+    # 処置内容は 5 行欄：超えた分は最終行が「…」で終わる
+    lines = [values[f"C{r}"] for r in range(30, 35)]
+    assert lines[:4] == ["1", "2", "3", "4"]
+    assert lines[4].endswith("…")
+
+
+def test_render_preview_html_overlays_values(tmp_path, monkeypatch):
+    monkeypatch.setenv("TEMPLATE_SHARE_DIR", str(tmp_path / "share"))
+    with open(os.path.join(ROOT_DIR, "template.xlsm"), "rb") as f:
+        digest = publish_template(f.read())
+    html = render_preview_html(digest, REC, NOW)
+    assert html.count("<table") == 1
+    assert 'class="ov"' in html
+    assert "HK-0001" in html
+    assert "かご内インターホン不通" in html
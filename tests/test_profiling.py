@@ -0,0 +1,91 @@
+# tests/test_profiling.py
+# 遅いリクエストのプロファイル採取（段階の採取・別スレッドのサンプリング・遅い rerun の保存）
+import glob
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from core import profiling
+from core.profiling import profile_rerun, propagate_capture, stage
+
+
+@pytest.fixture(autouse=True)
+def profile_env(tmp_path, monkeypatch):
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path))
+    monkeypatch.setenv("PROFILE_SAMPLE_MS", "1")
+    for name in ("PROFILE_SLOW_MS", "PROFILE_SLOW_SAMPLE_MS", "PROFILE_CAPTURE"):
+        monkeypatch.delenv(name, raising=False)
+    return tmp_path
+
+
+def _busy_in_worker(seconds: float) -> int:
+    end = time.perf_counter() + seconds
+    n = 0
+    while time.perf_counter() < end:
+        n += 1
+    return n
+
+
+def _saved(tmp_path, suffix: str):
+    return sorted(glob.glob(os.path.join(str(tmp_path), f"*{suffix}")))
+
+
+def test_stage_capture_samples_worker_threads(profile_env):
+    pool = ThreadPoolExecutor(max_workers=1)
+    try:
+        with profile_rerun("t", scope="token", engine="sample"):
+            with stage("token"):
+                pool.submit(propagate_capture(_busy_in_worker), 0.2).result()
+    finally:
+        pool.shutdown()
+    collapsed = _saved(profile_env, ".collapsed")
+    assert collapsed
+    with open(collapsed[0], encoding="utf-8") as f:
+        assert "_busy_in_worker" in f.read()
+
+
+def test_propagate_capture_is_noop_without_capture():
+    assert propagate_capture(_busy_in_worker) is _busy_in_worker
+
+
+def test_slow_rerun_saves_timings_without_sampling_by_default(profile_env, monkeypatch):
+    monkeypatch.setenv("PROFILE_SLOW_MS", "1")
+    with profile_rerun("slow"):
+        with stage("init"):
+            time.sleep(0.01)
+    assert _saved(profile_env, ".collapsed") == []
+    (meta_path,) = _saved(profile_env, ".json")
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    assert meta["samples"] == 0
+    assert [s["stage"] for s in meta["stages"]] == ["init"]
+
+
+def test_slow_rerun_sampling_is_opt_in(profile_env, monkeypatch):
+    monkeypatch.setenv("PROFILE_SLOW_MS", "1")
+    monkeypatch.setenv("PROFILE_SLOW_SAMPLE_MS", "2")
+    with profile_rerun("slow"):
+        _busy_in_worker(0.1)
+    assert _saved(profile_env, ".collapsed")
+    (meta_path,) = _saved(profile_env, ".json")
+    with open(meta_path, encoding="utf-8") as f:
+        assert json.load(f)["sample_interval_ms"] == 2.0
+
+
+def test_sampler_stops_when_nothing_is_registered():
+    with profile_rerun("idle", scope="rerun", engine="sample"):
+        pass
+    time.sleep(0.05)
+    assert profiling._SAMPLER._thread is None
+
+
+def test_relative_profile_dir_is_anchored_to_app_root(tmp_path, monkeypatch):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("PROFILE_DIR")
+    assert profiling.profile_dir() == os.path.join(root, "profiles")
+    monkeypatch.setenv("PROFILE_DIR", str(tmp_path / "abs"))
+    assert profiling.profile_dir() == str(tmp_path / "abs")
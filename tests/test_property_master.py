@@ -0,0 +1,48 @@
+# tests/test_property_master.py
+# 物件台帳：台帳ファイルごとのキャッシュと、他の接続の書き込みへの追従
+import sqlite3
+
+import pytest
+
+from core import property_master
+from core.property_master import lookup_property, update_properties
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(monkeypatch):
+    monkeypatch.setattr(property_master, "_CACHE", property_master._LRU(64))
+    monkeypatch.setattr(property_master, "_DATA_VERSION", {})
+
+
+def _rec(name: str):
+    return {"管理番号": "HK-1", "物件名": name, "受信時刻": "2025/01/01 10:00"}
+
+
+def test_cache_is_per_store(tmp_path):
+    a, b = str(tmp_path / "a.sqlite3"), str(tmp_path / "b.sqlite3")
+    update_properties([_rec("Aビル")], path=a)
+    assert lookup_property("HK-1", path=a)["物件名"] == "Aビル"
+    assert lookup_property("HK-1", path=b) is None
+    update_properties([_rec("Bビル")], path=b)
+    assert lookup_property("HK-1", path=a)["物件名"] == "Aビル"
+    assert lookup_property("HK-1", path=b)["物件名"] == "Bビル"
+
+
+def _write_from_other_connection(path: str, name: str):
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.execute("UPDATE properties SET name = ? WHERE manageno = 'HK-1'", (name,))
+    conn.close()
+
+
+def test_other_writer_is_seen_after_sync_interval(tmp_path, monkeypatch):
+    path = str(tmp_path / "store.sqlite3")
+    update_properties([_rec("旧ビル")], path=path)
+    monkeypatch.setenv("PROPERTY_SYNC_SEC", "3600")
+    assert lookup_property("HK-1", path=path)["物件名"] == "旧ビル"
+    _write_from_other_connection(path, "新ビル")
+    # 間隔内は data_version を問い合わせない
+    assert lookup_property("HK-1", path=path)["物件名"] == "旧ビル"
+
+    monkeypatch.setenv("PROPERTY_SYNC_SEC", "0")
+    assert lookup_property("HK-1", path=path)["物件名"] == "新ビル"
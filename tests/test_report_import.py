@@ -0,0 +1,134 @@
+# tests/test_report_import.py
+# 報告書の取り込み（生成 → 取り込み → 類似案件）と索引での案件の突き合わせ
+import os
+import struct
+import zipfile
+
+import pytest
+
+from core.excel_writer import build_filename, fill_template_xlsx
+from core.incident_index import count_indexed, find_similar, index_records, iter_indexed_records
+from core.report_importer import _sheet_part, import_reports, parse_report_file
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE = os.path.join(ROOT_DIR, "template.xlsm")
+
+INBOX_REC = {
+    "管理番号": "HK-1234",
+    "物件名": "テストビル",
+    "メーカー": "三菱",
+    "受信時刻": "2025/03/04 10:15",
+    "現着時刻": "2025/03/04 10:50",
+    "完了時刻": "2025/03/04 11:30",
+    "受信内容": "エレベーター停止 かご内閉じ込め",
+    "受付番号": "R-0001",
+    "受付URL": "https://example.invalid/r/0001",
+}
+
+OTHER_REC = {
+    "管理番号": "HK-9999",
+    "受信時刻": "2025/02/01 08:00",
+    "受信内容": "エレベーター停止 扉が閉まらない",
+    "受付番号": "R-0002",
+}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return str(tmp_path / "index.sqlite3")
+
+
+@pytest.fixture
+def report_file(tmp_path):
+    """INBOX_REC から報告書を作り、原因・処置内容を書き足した状態で保存する。"""
+    with open(TEMPLATE, "rb") as f:
+        template = f.read()
+    data = dict(INBOX_REC, 原因="ドアスイッチ不良", 処置内容="スイッチ交換")
+    path = tmp_path / build_filename(data)
+    path.write_bytes(fill_template_xlsx(template, data))
+    return str(path)
+
+
+def _records(store):
+    return list(iter_indexed_records(store))
+
+
+def test_parse_report_file_round_trip(report_file):
+    _, rec, err = parse_report_file(report_file, TEMPLATE)
+    assert err == ""
+    assert rec["管理番号"] == "HK-1234"
+    assert rec["物件名"] == "テストビル"
+    assert rec["受信時刻"].startswith("2025/03/04 10:15")
+    assert rec["処置内容"] == "スイッチ交換"
+    # 報告書には受付番号の欄が無い
+    assert rec.get("受付番号", "") == ""
+
+
+@pytest.mark.parametrize("inbox_first", [True, False])
+def test_import_merges_with_inbox_record(store, report_file, inbox_first):
+    if inbox_first:
+        index_records([INBOX_REC], path=store)
+    stats = import_reports([report_file], template_path=TEMPLATE, workers=1, store=store)
+    assert stats["imported"] == 1
+    if not inbox_first:
+        index_records([INBOX_REC], path=store)
+    index_records([OTHER_REC], path=store)
+
+    assert count_indexed(store) == 2
+    merged = next(r for r in _records(store) if r["管理番号"] == "HK-1234")
+    # 受付番号・URL は inbox の値、原因・処置内容 は報告書の値が残る
+    assert merged["受付番号"] == "R-0001"
+    assert merged["受付URL"] == INBOX_REC["受付URL"]
+    assert merged["処置内容"] == "スイッチ交換"
+
+    # 別の案件から探すと、取り込んだ案件は 1 回だけ出る
+    similar = find_similar({"受信内容": "エレベーター停止", "受付番号": "R-0003"}, path=store)
+    assert [r["管理番号"] for r in similar].count("HK-1234") == 1
+
+    # 自分自身（inbox のレコード）からは、取り込んだ報告書も含めて出てこない
+    similar = find_similar(INBOX_REC, path=store)
+    assert all(r["管理番号"] != "HK-1234" for r in similar)
+
+
+def test_reimport_is_unchanged(store, report_file):
+    index_records([INBOX_REC], path=store)
+    import_reports([report_file], template_path=TEMPLATE, workers=1, store=store)
+    stats = import_reports([report_file], template_path=TEMPLATE, workers=1, store=store)
+    assert stats["indexed"] == 0
+    assert count_indexed(store) == 1
+
+
+def _corrupt_sheet_data(src: str, dest) -> str:
+    """シート XML の圧縮データの途中を壊す（zip の目次は正常なまま、展開で zlib.error になる）。"""
+    data = bytearray(open(src, "rb").read())
+    with zipfile.ZipFile(src) as zf:
+        info = zf.getinfo(_sheet_part(zf))
+    name_len, extra_len = struct.unpack("<HH", data[info.header_offset + 26:info.header_offset + 30])
+    start = info.header_offset + 30 + name_len + extra_len
+    end = start + min(info.compress_size, 400)
+    data[start + 10:end] = b"\xff" * (end - start - 10)
+    dest.write_bytes(bytes(data))
+    return str(dest)
+
+
+def _truncate(src: str, dest) -> str:
+    data = open(src, "rb").read()
+    dest.write_bytes(data[: len(data) // 2])
+    return str(dest)
+
+
+@pytest.mark.parametrize("damage", [_corrupt_sheet_data, _truncate])
+def test_parse_report_file_reports_broken_file(tmp_path, report_file, damage):
+    path = damage(report_file, tmp_path / "broken.xlsm")
+    got_path, rec, err = parse_report_file(path, TEMPLATE)
+    assert (got_path, rec) == (path, None)
+    assert err
+
+
+def test_import_skips_broken_files_and_keeps_the_rest(store, report_file, tmp_path):
+    broken = _corrupt_sheet_data(report_file, tmp_path / "broken.xlsm")
+    stats = import_reports([broken, report_file], template_path=TEMPLATE, workers=1, store=store)
+    assert (stats["files"], stats["imported"], stats["skipped"]) == (2, 1, 1)
+    assert stats["errors"][0][0] == broken
+    assert stats["errors"][0][1].startswith("error:")  # zlib.error
+    assert count_indexed(store) == 1
@@ -0,0 +1,31 @@
+# tests/test_session_memory.py
+# メモリ予算の退避：作り直せるキャッシュだけを捨て、ジョブの完成品は残すこと
+import time
+
+import pytest
+
+from core import session_memory
+from core.session_memory import enforce_budget, get_heavy, put_heavy
+
+
+@pytest.fixture(autouse=True)
+def isolated_sessions(monkeypatch):
+    monkeypatch.setattr(session_memory, "_SESSIONS", {})
+    monkeypatch.setattr(session_memory, "_EXTERNAL", {})
+    monkeypatch.setenv("SESSION_MEMORY_BUDGET_MB", "0.5")
+
+
+def test_eviction_keeps_job_outputs(monkeypatch):
+    sid = {"now": "idle"}
+    monkeypatch.setattr(session_memory, "current_session_id", lambda: sid["now"])
+    put_heavy("workbook", b"x" * 400_000, tag="fp")
+    put_heavy("binder", b"y" * 400_000, tag="binder.xlsm", evictable=False)
+    session_memory._SESSIONS["idle"].last_seen = time.time() - 3600
+
+    sid["now"] = "active"
+    enforce_budget()
+
+    sid["now"] = "idle"
+    assert get_heavy("workbook", tag="fp") is None
+    assert get_heavy("binder", tag="binder.xlsm") is not None
+    assert session_memory._SESSIONS["idle"].evictions == 1
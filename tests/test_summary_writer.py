@@ -0,0 +1,66 @@
+# tests/test_summary_writer.py
+# 月次一覧（1 案件 1 行の .xlsx）のストリーミング書き出し
+import io
+from datetime import datetime, timedelta
+
+import pytest
+from openpyxl import load_workbook
+
+from core.incident_index import index_records
+from core.summary_writer import (
+    SUMMARY_COLUMNS, build_summary_xlsx, parse_year_month, record_in_scope, write_summary_xlsx,
+)
+
+RECORDS = [
+    {"管理番号": "HK-0001", "受信時刻": "2025/01/10 09:12", "現着時刻": "2025/01/10 09:48",
+     "完了時刻": "2025/01/10 10:30", "受信内容": "インターホン不通", "受付番号": "1", "作業時間_分": "42"},
+    {"管理番号": "HK-0002", "受信時刻": "2025/02/01 08:00", "受信内容": "異音", "受付番号": "2"},
+]
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    """過去案件索引を一時ファイルに作り、出力元 "archive" がそれを読むようにする。"""
+    path = str(tmp_path / "index.sqlite3")
+    monkeypatch.setenv("INCIDENT_INDEX_PATH", path)
+    index_records(RECORDS, path=path)
+    return path
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("2025/01", (2025, 1)), ("2025-1", (2025, 1)), ("202512", (2025, 12)), ("2025/13", None), ("", None),
+])
+def test_parse_year_month(raw, expected):
+    assert parse_year_month(raw) == expected
+
+
+def test_record_in_scope():
+    assert record_in_scope(RECORDS[0], "HK-0001", (2025, 1))
+    assert not record_in_scope(RECORDS[0], "HK-0002")
+    assert not record_in_scope(RECORDS[0], "", (2025, 2))
+
+
+def test_write_summary_xlsx_types():
+    out = io.BytesIO()
+    assert write_summary_xlsx(iter(RECORDS), out) == 2
+    ws = load_workbook(io.BytesIO(out.getvalue()))["一覧"]
+    header = [c.value for c in ws[1]]
+    assert header == SUMMARY_COLUMNS
+    row = {k: c.value for k, c in zip(header, ws[2])}
+    assert row["受信時刻"] == datetime(2025, 1, 10, 9, 12)
+    assert row["作業時間_分"] == 42
+    assert row["作業時間"] == timedelta(minutes=42)
+    assert ws.auto_filter.ref == f"A1:{ws.cell(row=1, column=len(header)).column_letter}3"
+
+
+def test_build_summary_xlsx_filters_archive(archive):
+    data, n = build_summary_xlsx("archive", month="2025/02")
+    assert n == 1
+    ws = load_workbook(io.BytesIO(data))["一覧"]
+    assert ws.max_row == 2
+    assert ws["A2"].value == "HK-0002"
+
+
+def test_build_summary_xlsx_unknown_source():
+    with pytest.raises(ValueError):
+        build_summary_xlsx("nowhere")
@@ -0,0 +1,50 @@
+# tests/test_template_store.py
+# 共有置き場：生成ワーカーが古いテンプレートを抱え続けないこと、置き場の使用量を予算に含めること
+import os
+
+import pytest
+
+from core import session_memory, template_store
+from core.template_store import (
+    fill_shared_template, note_shared_store_bytes, publish_template, warm_shared_template,
+)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE = os.path.join(ROOT_DIR, "template.xlsm")
+
+
+@pytest.fixture(autouse=True)
+def isolated_store(tmp_path, monkeypatch):
+    monkeypatch.setenv("TEMPLATE_SHARE_DIR", str(tmp_path / "share"))
+    monkeypatch.setattr(template_store, "_MAPS", {})
+    monkeypatch.setattr(template_store, "_SPARE", {})
+    monkeypatch.setattr(session_memory, "_EXTERNAL", {})
+
+
+@pytest.fixture
+def two_digests():
+    with open(TEMPLATE, "rb") as f:
+        data = f.read()
+    # 末尾の余白だけ違う 2 つ目のテンプレート（zip としてはそのまま読める）
+    return publish_template(data), publish_template(data + b"\0")
+
+
+def test_worker_job_releases_other_templates(two_digests):
+    old, new = two_digests
+    warm_shared_template(old)
+    assert set(template_store._MAPS) == {old}
+    assert set(template_store._SPARE) == {old}
+
+    assert fill_shared_template(new, {"管理番号": "HK-1"})[:2] == b"PK"
+    assert set(template_store._MAPS) == {new}
+    assert template_store._SPARE == {}
+
+
+def test_shared_store_bytes_are_reported(two_digests):
+    old, _ = two_digests
+    before = note_shared_store_bytes()
+    warm_shared_template(old)  # 解析済みブックの pickle ができる
+    assert os.path.exists(template_store._artifact_path(old))
+    total = note_shared_store_bytes()
+    assert total > before
+    assert session_memory._EXTERNAL["template_share"] == total
@@ -0,0 +1,61 @@
+# tests/test_token_prefetch.py
+# ?token= 直行時に、テンプレートの解析（生成ワーカー）と inbox の取得が並行すること
+import os
+import time
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+from core import inbox_loader, job_pool, template_store
+from tools.loadtest import write_inbox_stub
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT_DIR, "app.py")
+TEMPLATE = os.path.join(ROOT_DIR, "template.xlsm")
+
+
+@pytest.fixture
+def app_env(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT_DIR)
+    csv_path = str(tmp_path / "inbox.csv")
+    tokens = write_inbox_stub(csv_path, 3)
+    monkeypatch.setenv("SHEET_CSV_URL", csv_path)
+    monkeypatch.setenv("TEMPLATE_SHARE_DIR", str(tmp_path / "share"))
+    monkeypatch.setenv("INCIDENT_INDEX_PATH", str(tmp_path / "index.sqlite3"))
+    monkeypatch.setenv("PREGEN_INTERVAL_SEC", "0")
+    monkeypatch.setenv("INBOX_FETCH_TIMEOUT_SEC", "60")
+    monkeypatch.setenv("GEN_POOL_WORKERS", "1")
+    executors = {}
+    monkeypatch.setattr(job_pool, "_EXECUTORS", executors)
+    monkeypatch.setattr(job_pool, "_JOBS", {})
+    yield tokens
+    for ex in executors.values():
+        ex.shutdown(wait=True, cancel_futures=True)
+
+
+def test_template_parse_overlaps_inbox_fetch(app_env, monkeypatch):
+    digest = template_store.publish_template_file(TEMPLATE)
+    # 生成ワーカーの解析が終わると、解析済みブックが共有置き場に保存される
+    artifact = template_store._artifact_path(digest)
+    assert not os.path.exists(artifact)
+
+    seen = {}
+    real_fetch = inbox_loader._fetch_source
+
+    def slow_fetch(src, timeout):
+        # 取得に時間がかかるソース：その間にワーカーの解析が終わるかを見る
+        deadline = time.monotonic() + 60
+        while not os.path.exists(artifact) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        seen["parsed_during_fetch"] = os.path.exists(artifact)
+        return real_fetch(src, timeout)
+
+    monkeypatch.setattr(inbox_loader, "_fetch_source", slow_fetch)
+
+    at = AppTest.from_file(APP_PATH, default_timeout=90)
+    at.query_params["token"] = app_env[0]
+    at.run()
+
+    assert seen == {"parsed_during_fetch": True}
+    assert at.session_state["step"] == 3
+    assert at.session_state["extracted"]["管理番号"] == "HK-0000"
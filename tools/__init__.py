@@ -0,0 +1,2 @@
+# 空でOK（パッケージ認識用）
+# report_maker/tools/__init__.py
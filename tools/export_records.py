@@ -0,0 +1,55 @@
+# report_maker/tools/export_records.py
+# ------------------------------------------------------------
+# 案件レコードを分析用の列指向形式で書き出す
+#
+# 使い方（リポジトリ直下で）:
+#   python -m tools.export_records --source archive --format parquet -o incidents.parquet
+#   python -m tools.export_records --source inbox --format arrow -o - | 分析側の読み込み
+#
+# -o - で標準出力へ書く（arrow は IPC ストリームなので、そのままパイプで渡せる）。
+# pyarrow が無い環境では JSON Lines になる。
+# ------------------------------------------------------------
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from typing import List, Optional
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from core.columnar_export import FORMATS, resolve_format, write_records  # noqa: E402
+from core.summary_writer import iter_source_records, parse_year_month, record_in_scope  # noqa: E402
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="案件レコードを Parquet / Arrow IPC / JSON Lines で書き出す")
+    p.add_argument("--source", choices=["inbox", "archive"], default="archive",
+                   help="inbox（inbox シート）または archive（過去案件索引）")
+    p.add_argument("--format", choices=sorted(FORMATS), default="parquet")
+    p.add_argument("--manageno", default="", help="管理番号で絞り込む")
+    p.add_argument("--month", default="", help="受信時刻の年月で絞り込む（例 2025/01）")
+    p.add_argument("--batch", type=int, default=10000, help="1 バッチの件数")
+    p.add_argument("-o", "--output", default="-", help="出力先（- で標準出力）")
+    args = p.parse_args(argv)
+
+    fmt = resolve_format(args.format)
+    if fmt != args.format:
+        print("pyarrow が無いため JSON Lines で書き出します。", file=sys.stderr)
+
+    ym = parse_year_month(args.month)
+    records = (r for r in iter_source_records(args.source) if record_in_scope(r, args.manageno, ym))
+    if args.output == "-":
+        n, _ = write_records(records, sys.stdout.buffer, fmt, args.batch)
+        sys.stdout.buffer.flush()
+    else:
+        with open(args.output, "wb") as f:
+            n, _ = write_records(records, f, fmt, args.batch)
+    print(f"{n} 件を {fmt} で書き出しました。", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
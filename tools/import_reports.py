@@ -0,0 +1,80 @@
+# report_maker/tools/import_reports.py
+# ------------------------------------------------------------
+# 過去の 緊急出動報告書（.xlsm）を一括で過去案件索引・物件台帳へ取り込む
+#
+# 使い方（リポジトリ直下で）:
+#   python -m tools.import_reports /path/to/reports --workers 8
+#
+# フォルダ以下の .xlsm / .xlsx を再帰的に読む。同じ案件を取り込み直しても
+# 内容が変わっていなければ索引は書き換えない（何度流してもよい）。
+# 保存先は --store、省略時は INCIDENT_INDEX_PATH（既定 ./incident_index.sqlite3）。
+# ------------------------------------------------------------
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from core.report_importer import find_report_files, import_reports  # noqa: E402
+
+DEFAULT_TEMPLATE = os.path.join(ROOT_DIR, "template.xlsm")
+
+
+def _progress_printer(every: float = 2.0):
+    last = [0.0]
+
+    def _print(stats: Dict[str, object]):
+        now = time.time()
+        if now - last[0] < every:
+            return
+        last[0] = now
+        secs = max(stats["seconds"], 1e-6)
+        print(f"  {stats['files']} files ({stats['files'] / secs * 60:.0f} files/min) "
+              f"imported={stats['imported']} skipped={stats['skipped']}", flush=True)
+    return _print
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="過去の報告書 .xlsm を過去案件索引へ一括取り込み")
+    p.add_argument("paths", nargs="+", help="報告書ファイルまたはフォルダ")
+    p.add_argument("--workers", type=int, default=0, help="解析プロセス数（0 なら CPU 数）")
+    p.add_argument("--chunksize", type=int, default=32, help="1 回にワーカーへ渡すファイル数")
+    p.add_argument("--batch", type=int, default=500, help="DB へまとめて書き込む件数")
+    p.add_argument("--store", default=None, help="SQLite ファイル（省略時は INCIDENT_INDEX_PATH）")
+    p.add_argument("--template", default=DEFAULT_TEMPLATE,
+                   help="生成に使ったテンプレート（見本値が残った欄を空欄として扱うため）")
+    args = p.parse_args(argv)
+
+    template = args.template if args.template and os.path.exists(args.template) else None
+    if template is None:
+        print("テンプレートが見つからないため、見本値の判定をせずに取り込みます。", file=sys.stderr)
+
+    files = (f for root in args.paths for f in find_report_files(root))
+    stats = import_reports(
+        files,
+        template_path=template,
+        workers=args.workers or None,
+        chunksize=args.chunksize,
+        batch_size=args.batch,
+        store=args.store,
+        on_progress=_progress_printer(),
+    )
+
+    secs = max(stats["seconds"], 1e-6)
+    print(f"done: {stats['files']} files in {secs:.1f}s ({stats['files'] / secs * 60:.0f} files/min), "
+          f"imported={stats['imported']} indexed={stats['indexed']} skipped={stats['skipped']}")
+    for path, err in stats["errors"][:20]:
+        print(f"  skip: {path}: {err}")
+    if len(stats["errors"]) > 20:
+        print(f"  ...ほか {len(stats['errors']) - 20} 件")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
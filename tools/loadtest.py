@@ -0,0 +1,393 @@
+# report_maker/tools/loadtest.py
+# ------------------------------------------------------------
+# 同時セッション負荷試験
+#   Streamlit の AppTest（ヘッドレス実行）で app.py を複数セッション同時に動かし、
+#   Step1 → Step2 → Step3 → ダウンロード可能 までを通す。
+#   - paste : パスコード入力 → 本文貼付 → 抽出 → 生成
+#   - token : ?token=xxx 直行 → 生成
+#   inbox はローカル CSV スタブ（SHEET_CSV_URL にファイルパスを渡す）で代用する。
+#
+# 使い方（リポジトリ直下で）:
+#   python -m tools.loadtest --levels 1,2,4,8 --sessions 8 --flow both
+#
+# AppTest はスクリプトをこのプロセス内で実行し、生成はこのプロセスの生成プールのワーカーで動くため、
+# このプロセスとワーカーの CPU / RSS の合計を「サーバ 1 プロセス分」の値として出す。
+# 作り置きスケジューラ（PREGEN_INTERVAL_SEC）は計測中は止めておく。
+# AppTest は全インスタンスが同じ session_id（"test session id"）で動き、また run() のたびに
+# プロセス共有の Runtime を差し替え・破棄するので、スレッドで並走させると
+# セッション単位のメモリ管理が 1 セッション扱いになり、他セッションの rerun 中に Runtime が消える。
+# 計測中だけ _shared_runtime() で、セッションごとに別の session_id で走らせ、
+# 破棄後も共有のモックを返すようにする（終われば元に戻す）。
+# 貼付け本文もセッションごとに変えている（セッション単位のキャッシュに当たらないように）。
+# ------------------------------------------------------------
+from __future__ import annotations
+
+import argparse
+import csv
+import itertools
+import multiprocessing
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+from streamlit.runtime import Runtime
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1 import app_test as _app_test
+from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_PATH = os.path.join(ROOT_DIR, "app.py")
+
+PASSCODE = "loadtest"
+
+SAMPLE_MAIL = """件名: 【故障完了】 HK-{n:04d} テストビル
+管理番号: HK-{n:04d}
+物件名: テストビル
+住所: 札幌市中央区北1条西1丁目
+窓口会社: テスト管理
+メーカー: テストメーカー
+制御方式: インバータ
+契約種別: POG
+受信時刻: 2025/01/10 09:12
+通報者: 管理人
+現着時刻: 2025/01/10 09:48
+完了時刻: 2025/01/10 10:30
+受信内容: かご内インターホン不通
+現着状況: インターホン応答なし
+原因: 配線端子のゆるみ
+処置内容: 端子増し締め
+動作確認実施
+対応者: 山田
+送信者: 受付センター
+受付番号: {n}
+"""
+
+_MAIL_SEQ = itertools.count(1)
+_MAIL_SEQ_LOCK = threading.Lock()
+
+
+def _next_mail() -> str:
+    with _MAIL_SEQ_LOCK:
+        n = next(_MAIL_SEQ)
+    return SAMPLE_MAIL.format(n=n)
+
+
+# inbox の列順（core/inbox_loader.py の pos_keys と同じ並び）
+INBOX_HEADER = [
+    "token", "管理番号", "物件名", "住所", "窓口会社", "メーカー", "制御方式", "契約種別",
+    "受信時刻", "現着時刻", "完了時刻", "通報者", "受信内容", "現着状況", "原因", "処置内容",
+    "対応者", "送信者", "完了連絡先1", "受付番号", "受付URL", "現着完了登録URL", "所属",
+    "処理修理後", "作業時間_分",
+]
+
+
+def write_inbox_stub(path: str, rows: int) -> List[str]:
+    """負荷試験用の inbox CSV を作成し、token の一覧を返す。"""
+    tokens = []
+    with open(path, "w", encoding="utf-8-sig", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(INBOX_HEADER)
+        for i in range(rows):
+            token = f"tok{i:05d}"
+            tokens.append(token)
+            w.writerow([
+                token, f"HK-{i:04d}", f"テストビル{i}", "札幌市中央区北1条西1丁目", "テスト管理",
+                "テストメーカー", "インバータ", "POG",
+                "2025/01/10 09:12", "2025/01/10 09:48", "2025/01/10 10:30",
+                "管理人", "かご内インターホン不通", "インターホン応答なし", "配線端子のゆるみ",
+                "端子増し締め\n動作確認実施", "山田", "受付センター", "", str(100000 + i),
+                "", "", "札幌支店", "平常運転", "42",
+            ])
+    return tokens
+
+
+# =======================
+# AppTest 並走用の共有 Runtime
+# =======================
+# 今のスレッドで rerun しているセッションの session_id（_Session._timed で設定する）
+_RUNNING = threading.local()
+
+
+class _SessionScriptRunner(LocalScriptRunner):
+    """固定の "test session id" の代わりに、実行中のセッションの session_id で走らせる。"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._session_id = getattr(_RUNNING, "session_id", self._session_id)
+
+
+@contextmanager
+def _shared_runtime() -> Iterator[None]:
+    """
+    AppTest が Runtime._instance を None に戻しても共有のモックを返し、
+    セッションごとの session_id で走らせる。抜けたら元に戻す。
+    """
+    from unittest.mock import MagicMock
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+
+    shared = MagicMock(spec=Runtime)
+    shared.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    shared.cache_storage_manager = MemoryCacheStorageManager()
+
+    saved = (Runtime.__dict__["instance"], Runtime.__dict__["exists"], _app_test.LocalScriptRunner)
+    Runtime.instance = classmethod(lambda cls: cls._instance or shared)
+    Runtime.exists = classmethod(lambda cls: True)
+    _app_test.LocalScriptRunner = _SessionScriptRunner
+    try:
+        yield
+    finally:
+        Runtime.instance, Runtime.exists, _app_test.LocalScriptRunner = saved
+
+
+# =======================
+# リソース計測
+# =======================
+# 生成は共有プロセスプール（core/job_pool.py）のワーカーで動くので、
+# CPU と RSS はこのプロセスとワーカー（子プロセス）の合計で見る。
+def _proc_rss(pid) -> int:
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _proc_cpu(pid) -> float:
+    with open(f"/proc/{pid}/stat") as f:
+        # comm 欄に空白を含むことがあるので ")" の後ろから数える（utime, stime は 14, 15 番目）
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def _worker_pids() -> List[int]:
+    return [p.pid for p in multiprocessing.active_children() if p.pid]
+
+
+def _rss_bytes() -> int:
+    """このプロセスとプールのワーカーの RSS の合計（/proc が無い環境では自プロセスの最大 RSS で代用）"""
+    try:
+        total = _proc_rss("self")
+    except Exception:
+        ru = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return ru if sys.platform == "darwin" else ru * 1024
+    for pid in _worker_pids():
+        try:
+            total += _proc_rss(pid)
+        except (OSError, ValueError, IndexError):
+            pass  # 計測中に終了したワーカー
+    return total
+
+
+def _cpu_seconds() -> float:
+    """このプロセス＋終了した子プロセス＋動いているワーカーの CPU 時間の合計"""
+    total = 0.0
+    for who in (resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN):
+        ru = resource.getrusage(who)
+        total += ru.ru_utime + ru.ru_stime
+    for pid in _worker_pids():
+        try:
+            total += _proc_cpu(pid)
+        except (OSError, ValueError, IndexError):
+            pass
+    return total
+
+
+class _RssSampler(threading.Thread):
+    """一定間隔で RSS を採取し、ピークを記録する。"""
+
+    def __init__(self, interval: float = 0.05):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = 0
+        self._stop_evt = threading.Event()
+
+    def run(self):
+        while not self._stop_evt.is_set():
+            self.peak = max(self.peak, _rss_bytes())
+            self._stop_evt.wait(self.interval)
+
+    def stop(self) -> int:
+        self._stop_evt.set()
+        self.join()
+        return max(self.peak, _rss_bytes())
+
+
+# =======================
+# セッションシナリオ
+# =======================
+class _Session:
+    """1 オペレータ分のセッション。rerun ごとの所要時間を記録する。"""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.session_id = f"loadtest-{uuid.uuid4().hex[:12]}"
+        self.latencies: List[float] = []
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+
+    def _timed(self, fn):
+        _RUNNING.session_id = self.session_id
+        t0 = time.perf_counter()
+        fn()
+        self.latencies.append(time.perf_counter() - t0)
+
+    def _check(self, where: str):
+        if self.at.exception:
+            raise RuntimeError(f"{where}: {self.at.exception[0].message}")
+
+    def _assert_download_ready(self):
+        self._check("Step3")
+        buttons = self.at.get("download_button")
+        if not buttons or buttons[0].proto.disabled:
+            raise RuntimeError("Step3: ダウンロードボタンが有効になっていません。")
+
+    def run_paste(self):
+        at = self.at
+        self._timed(lambda: at.run())
+        self._check("Step1")
+        at.text_input[0].input(PASSCODE)
+        self._timed(lambda: at.button[0].click().run())
+        self._check("Step2")
+        for ti in at.text_input:
+            if ti.label == "所属":
+                ti.input("札幌支店")
+            elif ti.label.startswith("処理修理後"):
+                ti.input("平常運転")
+        at.text_area[0].input(_next_mail())
+        extract = next(b for b in at.button if b.label == "抽出する")
+        self._timed(lambda: extract.click().run())
+        self._assert_download_ready()
+
+    def run_token(self, token: str):
+        at = self.at
+        at.query_params["token"] = token
+        self._timed(lambda: at.run())
+        # _maybe_load_by_token 内の st.rerun() は AppTest では同一 run 内で処理される
+        if at.session_state["step"] != 3:
+            self._timed(lambda: at.run())
+        self._assert_download_ready()
+
+
+def _run_one(flow: str, token: Optional[str], timeout: float) -> Dict[str, object]:
+    s = _Session(timeout)
+    err = None
+    try:
+        if flow == "paste":
+            s.run_paste()
+        else:
+            s.run_token(token or "")
+    except Exception as e:
+        err = f"{type(e).__name__}: {e}"
+    return {"flow": flow, "latencies": s.latencies, "error": err}
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    vs = sorted(values)
+    k = (len(vs) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(vs) - 1)
+    return vs[lo] + (vs[hi] - vs[lo]) * (k - lo)
+
+
+def run_level(concurrency: int, sessions: int, flows: List[str], tokens: List[str],
+              timeout: float) -> Dict[str, object]:
+    """同時実行数 concurrency で sessions 件のセッションを流し、集計を返す。"""
+    jobs = []
+    for i in range(sessions):
+        flow = flows[i % len(flows)]
+        jobs.append((flow, tokens[i % len(tokens)] if flow == "token" else None))
+
+    sampler = _RssSampler()
+    sampler.start()
+    cpu0, wall0 = _cpu_seconds(), time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        results = list(ex.map(lambda j: _run_one(j[0], j[1], timeout), jobs))
+    wall = time.perf_counter() - wall0
+    cpu = _cpu_seconds() - cpu0
+    peak_rss = sampler.stop()
+
+    lat = [x for r in results for x in r["latencies"]]
+    errors = [r["error"] for r in results if r["error"]]
+    return {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "reruns": len(lat),
+        "p50": _percentile(lat, 50),
+        "p90": _percentile(lat, 90),
+        "p99": _percentile(lat, 99),
+        "max": max(lat) if lat else float("nan"),
+        "mean": statistics.fmean(lat) if lat else float("nan"),
+        "wall": wall,
+        "cpu": cpu,
+        "cpu_util": cpu / wall if wall > 0 else 0.0,
+        "rss_mb": _rss_bytes() / 2**20,
+        "peak_rss_mb": peak_rss / 2**20,
+        "errors": errors,
+    }
+
+
+def _print_report(rows: List[Dict[str, object]]):
+    print()
+    print(f"{'conc':>5} {'sess':>5} {'reruns':>6} {'p50ms':>8} {'p90ms':>8} {'p99ms':>8} "
+          f"{'maxms':>8} {'cpu%':>6} {'rssMB':>7} {'peakMB':>7} {'err':>4}")
+    for r in rows:
+        print(f"{r['concurrency']:>5} {r['sessions']:>5} {r['reruns']:>6} "
+              f"{r['p50'] * 1000:>8.1f} {r['p90'] * 1000:>8.1f} {r['p99'] * 1000:>8.1f} "
+              f"{r['max'] * 1000:>8.1f} {r['cpu_util'] * 100:>6.0f} "
+              f"{r['rss_mb']:>7.1f} {r['peak_rss_mb']:>7.1f} {len(r['errors']):>4}")
+    for r in rows:
+        for e in r["errors"][:3]:
+            print(f"  [conc={r['concurrency']}] {e}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    p = argparse.ArgumentParser(description="Streamlit アプリの同時セッション負荷試験")
+    p.add_argument("--levels", default="1,2,4,8", help="同時実行数（カンマ区切り）")
+    p.add_argument("--sessions", type=int, default=0,
+                   help="各レベルで流すセッション数（0 なら同時実行数の 2 倍）")
+    p.add_argument("--flow", choices=["paste", "token", "both"], default="both")
+    p.add_argument("--rows", type=int, default=200, help="inbox スタブの行数")
+    p.add_argument("--timeout", type=float, default=60.0, help="1 rerun あたりのタイムアウト秒")
+    args = p.parse_args(argv)
+
+    levels = [int(x) for x in args.levels.split(",") if x.strip()]
+    flows = ["paste", "token"] if args.flow == "both" else [args.flow]
+
+    # アプリは相対パスで template.xlsm を探すため、リポジトリ直下で動かす
+    os.chdir(ROOT_DIR)
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+
+    with tempfile.TemporaryDirectory() as tmp, _shared_runtime():
+        csv_path = os.path.join(tmp, "inbox.csv")
+        tokens = write_inbox_stub(csv_path, args.rows)
+        os.environ["SHEET_CSV_URL"] = csv_path
+        os.environ["APP_PASSCODE"] = PASSCODE
+        # 作り置きスケジューラの裏の生成が計測に混ざらないようにする
+        os.environ["PREGEN_INTERVAL_SEC"] = "0"
+
+        # 初回の import / テンプレ読込を計測から外すためのウォームアップ
+        _run_one(flows[0], tokens[0], args.timeout)
+
+        rows = []
+        for c in levels:
+            n = args.sessions or c * 2
+            r = run_level(c, n, flows, tokens, args.timeout)
+            rows.append(r)
+            print(f"concurrency={c} done: p90={r['p90'] * 1000:.1f}ms "
+                  f"cpu={r['cpu_util'] * 100:.0f}% peak_rss={r['peak_rss_mb']:.1f}MB", flush=True)
+
+    _print_report(rows)
+    return 1 if any(r["errors"] for r in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,6 +3,9 @@ import streamlit as st
 from core.state import get_working_dict, set_working_value
 from core.settings import REQUIRED_KEYS
 from core.textutil import split_lines
+from core.incident_index import find_similar
+from core.session_memory import session_memory_report, total_tracked_bytes, budget_bytes
+from core.pregen import interval_seconds, pregen_status
 
 def is_required_missing(data: dict, key: str) -> bool:
     return key in REQUIRED_KEYS and not (data.get(key) or "").strip()
@@ -34,3 +37,40 @@ def render_field(label: str, key: str, max_lines: int = 1, placeholder: str = ""
         else:
             st.markdown("<span class='missing'>未入力</span>" if missing else display_text(val, max_lines=max_lines),
                         unsafe_allow_html=True)
+
+def render_memory_debug(limit: int = 20):
+    with st.expander("🛠 デバッグ: セッションメモリ", expanded=False):
+        total_mb = total_tracked_bytes() / 2**20
+        st.caption(f"合計（概算）: {total_mb:.1f} MB / 予算: {budget_bytes() / 2**20:.0f} MB")
+        st.dataframe(session_memory_report(limit), use_container_width=True, hide_index=True)
+
+def render_pregen_debug():
+    with st.expander("🛠 デバッグ: 作り置き", expanded=False):
+        if interval_seconds() <= 0:
+            st.caption("作り置きスケジューラは無効です（PREGEN_INTERVAL_SEC 未設定）。")
+            return
+        s = pregen_status()
+        st.caption(
+            f"担当プロセス: {'このプロセス' if s['poller'] else '別プロセス'} / 最終確認: {s['last_poll'] or '—'} / "
+            f"作り置き {s['cached']} 件 / 作成 {s['built']} 件 / 使用 {s['hits']} 件"
+        )
+        if s["last_error"]:
+            st.caption(f"直近のエラー: {s['last_error']}")
+
+def render_similar_panel(data: dict, limit: int = 5):
+    """サイドバーに類似の過去案件を出す（原因・処置内容の参考用）"""
+    with st.sidebar:
+        st.markdown("**🔎 類似の過去案件**")
+        try:
+            hits = find_similar(data, limit=limit)
+        except Exception as e:
+            st.caption(f"索引を参照できません: {e}")
+            return
+        if not hits:
+            st.caption("該当なし（inbox から索引を更新すると候補が増えます）")
+        for h in hits:
+            head = " / ".join(x for x in (h.get("受信時刻"), h.get("管理番号"), h.get("物件名")) if x)
+            with st.expander(head or "（無題）", expanded=False):
+                st.markdown("**受信内容**<br>" + display_text(h.get("受信内容") or "", 0), unsafe_allow_html=True)
+                st.markdown("**原因**<br>" + display_text(h.get("原因") or "", 0), unsafe_allow_html=True)
+                st.markdown("**処置内容**<br>" + display_text(h.get("処置内容") or "", 0), unsafe_allow_html=True)
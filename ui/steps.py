@@ -6,11 +6,12 @@
 # ------------------------------------------------------------
 import os
 import sys
+import time
 import traceback
 
 import streamlit as st
 
-from core.settings import REQUIRED_KEYS
+from core.settings import REQUIRED_KEYS, get_setting
 from core.state import (
     get_passcode,
     ensure_extracted,
@@ -18,11 +19,38 @@ from core.state import (
     cancel_edit,
     save_edit,
     get_working_dict,
+    get_template_bytes,
+    set_template_bytes,
+    set_template_digest,
+    get_cached_workbook,
+    put_cached_workbook,
 )
-from core.parsing import extract_fields, minutes_between
-from core.excel_writer import fill_template_xlsx, build_filename
-from core.inbox_loader import load_from_sheet_by_token
-from ui.components import render_field
+from core.session_memory import get_heavy, live_template_digests, put_heavy, touch_session
+from core.job_pool import PoolBusyError, submit_job, wait_job, take_result, discard_job
+from core.parsing import extract_fields, minutes_between, profiles_file_error, try_parse_datetime
+from core.excel_writer import (
+    build_filename,
+    report_fingerprint,
+    build_binder_filename,
+)
+from core.template_store import (
+    ensure_template_file,
+    fill_shared_binder,
+    fill_shared_template,
+    note_shared_store_bytes,
+    publish_template_file,
+    release_unused_templates,
+    warm_shared_template,
+)
+from core.inbox_loader import inbox_source_errors, load_from_sheet_by_token, load_inbox_records
+from core.incident_index import index_records, count_indexed
+from core.property_master import apply_property_master, update_properties
+from core.profiling import profile_rerun, requested_capture, stage, wrap_job
+from core.pregen import start_pregen_scheduler, take_pregenerated
+from core.preview import render_preview_html
+from core.columnar_export import FORMATS as COLUMNAR_FORMATS, build_columnar_export, resolve_format
+from core.summary_writer import build_summary_xlsx, parse_year_month, record_in_scope
+from ui.components import render_field, render_memory_debug, render_pregen_debug, render_similar_panel
 
 
 # =======================
@@ -33,12 +61,15 @@ def _init_session():
         st.session_state.step = 1
     if "authed" not in st.session_state:
         st.session_state.authed = False
+    if "passcode_authed" not in st.session_state:
+        # token 直行でも authed になるので、一括出力はパスコードでのログインを別に確認する
+        st.session_state.passcode_authed = False
     if "extracted" not in st.session_state:
         st.session_state.extracted = None
     if "affiliation" not in st.session_state:
         st.session_state.affiliation = ""
-    if "template_xlsx_bytes" not in st.session_state:
-        st.session_state.template_xlsx_bytes = None
+    if "template_digest" not in st.session_state:
+        st.session_state.template_digest = None
     if "edit_mode" not in st.session_state:
         st.session_state.edit_mode = False
     if "edit_buffer" not in st.session_state:
@@ -47,26 +78,39 @@ def _init_session():
         st.session_state.token_loaded = False
     if "processing_after" not in st.session_state:
         st.session_state.processing_after = ""
+    if "prefetch" not in st.session_state:
+        st.session_state.prefetch = None
+    if "gen_job" not in st.session_state:
+        st.session_state.gen_job = None
+    if "binder_job" not in st.session_state:
+        st.session_state.binder_job = None
+    if "summary_job" not in st.session_state:
+        st.session_state.summary_job = None
+    if "master_notes" not in st.session_state:
+        st.session_state.master_notes = []
     ensure_extracted()
 
 
 # =======================
 # テンプレート確保
 # =======================
+DEFAULT_TEMPLATE_PATH = "template.xlsm"
+
+
 def _ensure_template_loaded():
     """
-    st.session_state.template_xlsx_bytes が空の場合、
+    テンプレートが未登録（または共有置き場から消えた）場合、
     カレントディレクトリの template.xlsm を探して読み込む。
     Step2, Step3 の両方から呼ぶ。
+    既定テンプレは共有置き場に 1 度だけ置き、全セッションで共有する。
     """
-    if st.session_state.get("template_xlsx_bytes"):
+    if st.session_state.get("template_digest") and get_template_bytes() is not None:
         return
 
-    default_path = "template.xlsm"
+    default_path = DEFAULT_TEMPLATE_PATH
     if os.path.exists(default_path):
         try:
-            with open(default_path, "rb") as f:
-                st.session_state.template_xlsx_bytes = f.read()
+            set_template_digest(publish_template_file(default_path))
             # 何度も出るとうるさいので toast 程度に
             st.toast(f"テンプレートを読み込みました: {default_path}")
         except Exception as e:
@@ -89,6 +133,81 @@ def _fmt_minutes(v):
     return f"{v}分"
 
 
+# =======================
+# token 直行の下準備（inbox の行の取得・生成の先行投入）
+# =======================
+def _warn_source_errors():
+    """取得・読み込みに失敗した inbox ソースがあれば知らせる。"""
+    failed = inbox_source_errors()
+    if failed:
+        st.warning(
+            f"inbox のうち {len(failed)} 件のソースを取得・読み込みできませんでした"
+            "（取得できなかったものは前回の内容で代用、読めないものは飛ばしています）: "
+            + " / ".join(f"{src}（{msg}）" for src, msg in failed.items())
+        )
+
+
+def _load_token_record(token: str):
+    """inbox から token 行を取り、物件台帳で空欄を埋める。(rec, 食い違い一覧) を返す。"""
+    rec = load_from_sheet_by_token(token)
+    try:
+        notes = apply_property_master(rec)
+    except Exception:
+        notes = []
+    return rec, notes
+
+
+def _warm_template_in_pool(digest: str):
+    """
+    token 直行時、inbox の取得を待つ前にテンプレートの解析を生成ワーカーへ投入する
+    （取得と解析を並行させる）。投入できなければ None（生成側で解析する）。
+    """
+    if not ensure_template_file(digest):
+        return None
+    try:
+        return submit_job(warm_shared_template, digest)
+    except PoolBusyError:
+        return None
+
+
+def _start_token_generation(digest: str, rec: dict):
+    """
+    token 直行時、Step3 を描く前に生成を始めておく。スケジューラの作り置きが今の内容と
+    一致すればそれを使い、無ければ通常の生成と同じくプロセスプールへ投入する
+    （受付制限も同じ。混雑で断られた場合は Step3 の通常処理でやり直す）。
+    """
+    fp = report_fingerprint(digest, rec)
+    data = take_pregenerated(fp)
+    if data is not None:
+        st.session_state.prefetch = {"fp": fp, "data": data}
+        return
+    if not ensure_template_file(digest):
+        return
+    fn, args = wrap_job("gen_job", fill_shared_template, (digest, dict(rec)))
+    try:
+        job_id = submit_job(fn, *args)
+    except PoolBusyError:
+        return
+    # Step3 の _generate_in_pool がこのジョブを fp 付きで待つ
+    st.session_state.gen_job = {"id": job_id, "fp": fp}
+
+
+def _default_template_digest():
+    """作り置きスケジューラ用：既定テンプレートの digest（無ければ None）"""
+    if not os.path.exists(DEFAULT_TEMPLATE_PATH):
+        return None
+    return publish_template_file(DEFAULT_TEMPLATE_PATH)
+
+
+def _take_prefetched_workbook(fp: str):
+    """token 直行時に受け取った作り置きが今の内容と一致すれば受け取る（一度きり）。"""
+    pf = st.session_state.get("prefetch")
+    if not pf:
+        return None
+    st.session_state.prefetch = None
+    return pf["data"] if pf["fp"] == fp else None
+
+
 # =======================
 # token=xxx が付いていたら inbox からロード
 # =======================
@@ -111,11 +230,33 @@ def _maybe_load_by_token():
     if not token or st.session_state.get("token_loaded"):
         return
 
+    # テンプレートの解析を先に生成ワーカーへ投入してから CSV を取得し（両者が並行する）、
+    # 行が取れたらすぐ生成を投入して、rerun 後の Step3 で受け取る。
+    # （CSV の取得は inbox_loader がソースごとに並行して行う）
+    digest = None
+    if st.session_state.get("template_digest") and get_template_bytes() is not None:
+        digest = st.session_state.template_digest
+    elif os.path.exists(DEFAULT_TEMPLATE_PATH):
+        try:
+            digest = publish_template_file(DEFAULT_TEMPLATE_PATH)
+        except Exception:
+            # テンプレ側の失敗は Step3 の通常処理に任せる
+            digest = None
+    warm_job = _warm_template_in_pool(digest) if digest else None
     try:
-        rec = load_from_sheet_by_token(token)
+        rec, notes = _load_token_record(token)
     except Exception as e:
         st.warning(f"トークンからの読み込みに失敗しました: {e}")
         return
+    finally:
+        if warm_job:
+            # 結果は使わない（解析済みブックはワーカー側に残る）
+            discard_job(warm_job)
+
+    if digest and st.session_state.get("template_digest") != digest:
+        set_template_digest(digest)
+    if digest and rec:
+        _start_token_generation(digest, rec)
 
     if rec:
         # トークンを知っていればOKという運用：認証も通す
@@ -123,6 +264,7 @@ def _maybe_load_by_token():
         st.session_state.extracted = rec.copy()
         st.session_state.affiliation = rec.get("所属", "") or ""
         st.session_state.processing_after = rec.get("処理修理後", "") or ""
+        st.session_state.master_notes = notes
         st.session_state.step = 3
         st.session_state.token_loaded = True
 
@@ -133,14 +275,341 @@ def _maybe_load_by_token():
             st.experimental_rerun()
 
 
+# =======================
+# 生成ジョブ（プロセスプール）の待ち合わせ
+# =======================
+# 1 回の rerun で完了を待つ秒数（待ち中はこの間隔で表示を更新する）
+_JOB_POLL_SEC = 0.5
+
+
+def _rerun():
+    try:
+        st.rerun()
+    except Exception:
+        st.experimental_rerun()
+
+
+def _poll_job(state_key: str):
+    """
+    session_state[state_key] に入っているジョブを少し待つ。
+    完了なら結果を返す。待ち中は待ち順を表示して rerun、失敗ならエラー表示して None。
+    """
+    job = st.session_state.get(state_key)
+    status = wait_job(job["id"], timeout=_JOB_POLL_SEC)
+    if status["state"] == "done":
+        st.session_state[state_key] = None
+        return take_result(job["id"])
+    if status["state"] in ("error", "missing"):
+        st.session_state[state_key] = None
+        st.error(f"生成に失敗しました: {status.get('error') or 'ジョブが見つかりません'}")
+        return None
+    if status["state"] == "queued":
+        st.info(f"⏳ 生成待ちです（前に {status['position']} 件）…")
+    else:
+        st.info("⏳ 生成中です…")
+    time.sleep(0.05)
+    _rerun()
+
+
+def _submit_or_explain(state_key: str, fn, *args, timeout=None, lane="interactive", **meta) -> bool:
+    """ジョブを投入する。混雑で断られた場合は理由を表示して False。"""
+    fn, args = wrap_job(state_key, fn, args)
+    try:
+        job_id = submit_job(fn, *args, timeout=timeout, lane=lane)
+    except PoolBusyError as e:
+        st.error(str(e))
+        return False
+    st.session_state[state_key] = {"id": job_id, **meta}
+    return True
+
+
+def _render_job_download(kind: str, label: str, mime: str = ""):
+    """
+    まとめ出力・一覧出力の共通部分：{kind}_job を待ち、完成品を重いデータとして保持して
+    ダウンロードボタンを出す。ジョブが (bytes, 件数) を返す場合は件数を表示に使う。
+    mime を省略した場合は投入時に meta に入れた mime を使う。
+    """
+    meta = st.session_state.get(f"{kind}_meta") or {}
+    if st.session_state.get(f"{kind}_job"):
+        result = _poll_job(f"{kind}_job")
+        if isinstance(result, tuple):
+            result, meta["count"] = result
+        if result is not None:
+            # 完成品は作り直せないので、メモリ予算の退避対象にしない
+            put_heavy(kind, result, tag=meta.get("file_name"), evictable=False)
+    data = get_heavy(kind, tag=meta.get("file_name"))
+    if data is None:
+        return
+    st.success(f"{meta.get('count', 0)} 件を出力しました。")
+    st.download_button(
+        label,
+        data=data,
+        file_name=meta["file_name"],
+        mime=mime or meta.get("mime"),
+        use_container_width=True,
+        key=f"{kind}_download",
+    )
+
+
+def _start_export_job(kind: str, file_name: str, fn, *args, count=None, timeout=None, mime=None,
+                      lane="interactive"):
+    put_heavy(kind, None)
+    st.session_state[f"{kind}_meta"] = {"file_name": file_name, "count": count, "mime": mime}
+    if _submit_or_explain(f"{kind}_job", fn, *args, timeout=timeout, lane=lane):
+        _rerun()
+
+
+def _generate_in_pool(fp: str, data: dict):
+    """Step3 の帳票をプロセスプールで生成する。完成していれば bytes、未完成なら None。"""
+    job = st.session_state.get("gen_job")
+    if job and job["fp"] != fp:
+        # 待っている間に内容が変わった
+        discard_job(job["id"])
+        st.session_state.gen_job = None
+        job = None
+    if job is None:
+        # ワーカーへはテンプレート本体ではなく digest だけを渡す（各ワーカーが共有置き場を mmap する）
+        digest = st.session_state.template_digest
+        if not ensure_template_file(digest):
+            st.error("テンプレートが見つかりません。Step2 でテンプレートを読み込み直してください。")
+            return None
+        if not _submit_or_explain("gen_job", fill_shared_template, digest, dict(data), fp=fp):
+            if st.button("もう一度試す", use_container_width=True, key="gen_retry"):
+                _rerun()
+            return None
+    return _poll_job("gen_job")
+
+
+# =======================
+# まとめ出力（バインダー）
+# =======================
+def _filter_binder_records(records, manageno: str, month: str):
+    """管理番号（完全一致）と 受信時刻 の年月で絞り込み、受信時刻順に並べる。"""
+    ym = parse_year_month(month)
+    picked = []
+    for rec in records:
+        if not record_in_scope(rec, manageno, ym):
+            continue
+        dt = try_parse_datetime(rec.get("受信時刻"))
+        picked.append((dt.timestamp() if dt else 0.0, rec))
+    picked.sort(key=lambda x: x[0])
+    return [rec for _, rec in picked]
+
+
+def _passcode_login_required(feature: str) -> bool:
+    """
+    inbox 全体を読む一括出力は、パスコードでログインしたセッションだけに許す。
+    token リンクは 1 件分の閲覧用なので、許可しない場合は案内を出して False。
+    """
+    if st.session_state.get("passcode_authed"):
+        return True
+    st.info(f"{feature}はパスコードでログインした場合のみ使えます。")
+    return False
+
+
+def _render_binder_export():
+    if not _passcode_login_required("まとめ出力"):
+        return
+    c1, c2 = st.columns(2)
+    with c1:
+        manageno = st.text_input("管理番号", key="binder_manageno")
+    with c2:
+        month = st.text_input("対象年月（例: 2025/01）", key="binder_month")
+
+    _render_job_download("binder", "まとめ出力をダウンロード（.xlsm）",
+                         "application/vnd.ms-excel.sheet.macroEnabled.12")
+
+    if not st.button("inbox から検索して綴る", use_container_width=True, key="binder_build"):
+        return
+    if st.session_state.get("binder_job"):
+        st.info("前回のまとめ出力を生成中です。")
+        return
+    if not manageno.strip() and not month.strip():
+        st.warning("管理番号か対象年月のどちらかを入力してください。")
+        return
+
+    try:
+        records = _filter_binder_records(load_inbox_records(), manageno, month)
+    except Exception as e:
+        st.warning(f"inbox からの読み込みに失敗しました: {e}")
+        return
+    _warn_source_errors()
+    if not records:
+        st.info("該当する行がありません。")
+        return
+
+    digest = st.session_state.template_digest
+    if not ensure_template_file(digest):
+        st.error("テンプレートが見つかりません。テンプレートを読み込み直してください。")
+        return
+    _start_export_job("binder", build_binder_filename(records), fill_shared_binder,
+                      digest, records, count=len(records))
+
+
+# =======================
+# 一覧出力（1 案件 1 行の .xlsx / 分析用の列指向形式）
+# =======================
+# 年間分など件数が多い場合に備えて、通常の生成より長い制限時間にする
+# （一括処理用の lane で動かすので、Step3 の生成のワーカーは占有しない）
+_SUMMARY_TIMEOUT_SEC = 1800
+
+_XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# 表示名 → 形式（xlsx 以外は columnar_export.FORMATS のキー）
+_SUMMARY_FORMATS = {
+    "Excel（.xlsx）": "xlsx",
+    "Parquet": "parquet",
+    "Arrow IPC": "arrow",
+    "JSON Lines": "jsonl",
+}
+
+
+def _render_summary_export():
+    if not _passcode_login_required("一覧出力"):
+        return
+    source_label = st.radio(
+        "出力元", ["inbox", "過去案件索引"], horizontal=True, key="summary_source",
+    )
+    fmt_label = st.radio(
+        "形式", list(_SUMMARY_FORMATS), horizontal=True, key="summary_format",
+        help="Parquet / Arrow IPC / JSON Lines は分析用（時刻は日時型、所要時間は分の整数）",
+    )
+    c1, c2 = st.columns(2)
+    with c1:
+        manageno = st.text_input("管理番号（空欄なら全件）", key="summary_manageno")
+    with c2:
+        month = st.text_input("対象年月（空欄なら全期間）", key="summary_month")
+
+    _render_job_download("summary", "一覧をダウンロード")
+
+    if not st.button("一覧を作成", use_container_width=True, key="summary_build"):
+        return
+    if st.session_state.get("summary_job"):
+        st.info("前回の一覧を作成中です。")
+        return
+    if month.strip() and parse_year_month(month) is None:
+        st.warning("対象年月は 2025/01 の形式で入力してください。")
+        return
+
+    source = "inbox" if source_label == "inbox" else "archive"
+    span = parse_year_month(month)
+    suffix = "_".join(x for x in (
+        manageno.strip().replace("/", "_"),
+        f"{span[0]}{span[1]:02d}" if span else "",
+    ) if x) or "全件"
+    fmt = _SUMMARY_FORMATS[fmt_label]
+    if fmt == "xlsx":
+        _start_export_job("summary", f"緊急出動一覧_{suffix}.xlsx", build_summary_xlsx,
+                          source, manageno, month, timeout=_SUMMARY_TIMEOUT_SEC, mime=_XLSX_MIME,
+                          lane="bulk")
+        return
+    used = resolve_format(fmt)
+    if used != fmt:
+        st.info("pyarrow が無いため JSON Lines で出力します。")
+    ext, mime = COLUMNAR_FORMATS[used]
+    _start_export_job("summary", f"緊急出動一覧_{suffix}{ext}", build_columnar_export,
+                      source, used, manageno, month, timeout=_SUMMARY_TIMEOUT_SEC, mime=mime,
+                      lane="bulk")
+
+
+# =======================
+# 類似案件の索引
+# =======================
+def _render_index_refresh():
+    with st.sidebar:
+        if st.button("inbox から索引を更新", use_container_width=True, key="index_refresh"):
+            try:
+                records = load_inbox_records()
+                _warn_source_errors()
+                n = index_records(records)
+                m = update_properties(records)
+                st.success(f"{n} 件を追加・更新しました（計 {count_indexed()} 件）／物件台帳 {m} 件更新")
+            except Exception as e:
+                st.warning(f"索引の更新に失敗しました: {e}")
+
+
+def _index_current(data: dict):
+    """生成できた案件は次回以降の検索対象・物件台帳に加える（失敗しても本処理は止めない）"""
+    try:
+        index_records([data])
+        update_properties([data])
+    except Exception:
+        pass
+
+
+# =======================
+# 帳票プレビュー
+# =======================
+def _render_preview():
+    """生成時と同じ値を重ねた帳票を HTML で表示する（ブックは作らない）。"""
+    digest = st.session_state.get("template_digest")
+    if not digest:
+        st.info("テンプレートが読み込まれていないため、プレビューできません。")
+        return
+    try:
+        with stage("preview"):
+            html = render_preview_html(digest, get_working_dict())
+    except Exception as e:
+        st.warning(f"プレビューを作成できませんでした: {e}")
+        return
+    st.markdown(html, unsafe_allow_html=True)
+    st.caption("黄色のセルが書き込まれる値です。数式（窓口会社など）は Excel で開いたときに計算されます。")
+
+
+# =======================
+# デバッグ表示の判定（?debug=1 または APP_DEBUG=1）
+# =======================
+def _debug_enabled() -> bool:
+    if get_setting("APP_DEBUG") == "1":
+        return True
+    try:
+        return st.query_params.get("debug") == "1"
+    except Exception:
+        return False
+
+
+# =======================
+# プロファイル採取の指示（?profile=…&admin=…）
+# =======================
+def _profile_query() -> dict:
+    try:
+        return {k: st.query_params.get(k) for k in ("profile", "engine", "admin")}
+    except Exception:
+        return {}
+
+
 # =======================
 # メインエントリ
 # =======================
 def render_app():
-    _init_session()
-    _maybe_load_by_token()
+    """
+    1 回の rerun を計測付きで実行する。
+    PROFILE_CAPTURE か管理者用クエリで指示があればプロファイルを採取し、
+    指示が無くても PROFILE_SLOW_MS を超えた rerun は自動で保存する（core/profiling.py）。
+    """
+    scope, engine = requested_capture(_profile_query())
+    label = f"step{st.session_state.get('step', 1)}"
+    with profile_rerun(label, scope=scope, engine=engine,
+                       token=bool(st.session_state.get("token_loaded"))):
+        _render_app()
+
+
+def _render_app():
+    with stage("init"):
+        _init_session()
+        touch_session(st.session_state)
+        # どのセッションも使わなくなったテンプレートの mmap を手放す
+        release_unused_templates(live_template_digests())
+        note_shared_store_bytes()
+        start_pregen_scheduler(_default_template_digest)
+    with stage("token"):
+        _maybe_load_by_token()
     PASSCODE = get_passcode()
 
+    # セッション一覧などを出すので、token リンクではなくパスコードでログインした場合だけ
+    if st.session_state.get("passcode_authed") and _debug_enabled():
+        render_memory_debug()
+        render_pregen_debug()
+
     # -----------------------
     # Step 1: パスコード認証
     # -----------------------
@@ -153,6 +622,7 @@ def render_app():
         if st.button("次へ", use_container_width=True):
             if pw == PASSCODE:
                 st.session_state.authed = True
+                st.session_state.passcode_authed = True
                 st.session_state.step = 2
                 try:
                     st.rerun()
@@ -172,7 +642,7 @@ def render_app():
         with tpl_col1:
             st.caption("① 既定：template.xlsm を探します")
             _ensure_template_loaded()
-            if st.session_state.get("template_xlsx_bytes"):
+            if st.session_state.get("template_digest"):
                 st.success("テンプレートは読み込み済みです。")
             else:
                 st.warning("既定テンプレートが見つかりません。②のアップロードをご利用ください。")
@@ -181,10 +651,10 @@ def render_app():
             st.caption("② またはテンプレ.xlsmをアップロード")
             up = st.file_uploader("テンプレート（.xlsm）", type=["xlsm"], accept_multiple_files=False)
             if up is not None:
-                st.session_state.template_xlsx_bytes = up.read()
+                set_template_bytes(up.getvalue())
                 st.success(f"アップロード済み: {up.name}")
 
-        if not st.session_state.template_xlsx_bytes:
+        if not st.session_state.template_digest:
             st.error("テンプレートが未準備です。template.xlsm を配置するか、上でアップロードしてください。")
             st.stop()
 
@@ -211,6 +681,7 @@ def render_app():
                 else:
                     st.session_state.extracted = extract_fields(text)
                     st.session_state.extracted["所属"] = st.session_state.affiliation
+                    st.session_state.master_notes = apply_property_master(st.session_state.extracted)
                     st.session_state.step = 3
                     try:
                         st.rerun()
@@ -225,6 +696,11 @@ def render_app():
                     st.rerun()
                 except Exception:
                     st.experimental_rerun()
+
+        with st.expander("📚 まとめ出力（inbox の複数件を 1 ファイルに綴る）", expanded=False):
+            _render_binder_export()
+        with st.expander("📊 一覧出力（.xlsx / Parquet / Arrow / JSON Lines）", expanded=False):
+            _render_summary_export()
         return
 
     # -----------------------
@@ -235,6 +711,9 @@ def render_app():
         _ensure_template_loaded()
 
         st.subheader("Step 3. 抽出結果の確認・編集 → Excel生成")
+        if profiles_file_error():
+            # 抽出は既定の書式で続けているので、知らせるだけにする
+            st.warning(profiles_file_error() + "（既定の書式で抽出しました）")
 
         # Step2 で入力した「処理修理後」を初回だけ反映
         if "processing_after" in st.session_state and st.session_state.extracted is not None:
@@ -283,6 +762,8 @@ def render_app():
 
         # ② 基本情報（表示）
         with st.expander("② 基本情報（表示）", expanded=True):
+            if st.session_state.get("master_notes"):
+                st.warning("物件台帳と食い違う項目があります：\n\n" + "\n\n".join(st.session_state.master_notes))
             render_field("管理番号", "管理番号", 1)
             render_field("物件名", "物件名", 1)
             render_field("住所", "住所", 2)
@@ -310,6 +791,10 @@ def render_app():
             with c3:
                 st.info(f"受付〜完了: { _fmt_minutes(t_recv_to_done) }")
 
+        # 類似の過去案件（サイドバー）
+        render_similar_panel(data)
+        _render_index_refresh()
+
         # ④ その他情報（表示）
         with st.expander("④ その他情報（表示）", expanded=False):
             render_field("対応者", "対応者", 1)
@@ -318,6 +803,10 @@ def render_app():
             render_field("受付URL", "受付URL", 1)
             render_field("現着完了登録URL", "現着完了登録URL", 1)
 
+        # ⑤ 帳票プレビュー（編集内容がそのまま反映される）
+        if st.toggle("👀 帳票プレビュー（Excelを作らずに表示）", key="show_preview"):
+            _render_preview()
+
         st.divider()
 
         # Excel 生成ボタン
@@ -326,7 +815,7 @@ def render_app():
             gen_data = get_working_dict()
 
             # まずテンプレがあるか確認
-            if not st.session_state.get("template_xlsx_bytes"):
+            if not st.session_state.get("template_digest"):
                 st.error(
                     "テンプレート（.xlsm）が読み込まれていません。"
                     "Step2でテンプレートを設定するか、template.xlsm を配置してください。"
@@ -367,17 +856,28 @@ def render_app():
             can_generate = (not is_editing) and (not missing_now)
 
             if can_generate:
-                xlsx_bytes = fill_template_xlsx(st.session_state.template_xlsx_bytes, gen_data)
-                fname = build_filename(gen_data)
-                st.download_button(
-                    "Excelを生成（.xlsm）",
-                    data=xlsx_bytes,
-                    file_name=fname,
-                    mime="application/vnd.ms-excel.sheet.macroEnabled.12",
-                    use_container_width=True,
-                    disabled=False,
-                    help="一括編集モードはオフ、かつ必須項目がすべて入力されている場合に生成できます",
-                )
+                # 同じ内容なら rerun のたびに作り直さない（退避されていれば再生成）
+                fp = report_fingerprint(st.session_state.template_digest, gen_data)
+                xlsx_bytes = get_cached_workbook(fp)
+                if xlsx_bytes is None:
+                    # token 直行時は作り置きか、先に投入した生成ジョブを待つだけで済む。
+                    # それ以外はプロセスプールで生成（待ち中は None で、待ち順を表示して rerun）
+                    with stage("generate"):
+                        xlsx_bytes = _take_prefetched_workbook(fp) or _generate_in_pool(fp, gen_data)
+                    if xlsx_bytes is not None:
+                        put_cached_workbook(fp, xlsx_bytes)
+                        _index_current(gen_data)
+                if xlsx_bytes is not None:
+                    fname = build_filename(gen_data)
+                    st.download_button(
+                        "Excelを生成（.xlsm）",
+                        data=xlsx_bytes,
+                        file_name=fname,
+                        mime="application/vnd.ms-excel.sheet.macroEnabled.12",
+                        use_container_width=True,
+                        disabled=False,
+                        help="一括編集モードはオフ、かつ必須項目がすべて入力されている場合に生成できます",
+                    )
             else:
                 st.download_button(
                     "Excelを生成（.xlsm）",